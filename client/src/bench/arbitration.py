@@ -0,0 +1,128 @@
+"""
+Simulated devices for the wakeword arbiter. Every round, each device hears
+the wake word with a random score and SNR (or misses it), and claims it after
+a random network delay. Checks that exactly one device answers every round,
+and that it's the best of the claims that made the window, e.g.:
+
+    python -m bench.arbitration --devices 3 --rounds 20 --jitter 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+from server.arbiter import ArbiterServer, WakewordArbiter
+from server.client import ArbiterClient
+
+# claims this close to the end of the window may or may not make it, so they don't count against the arbiter
+WINDOW_MARGIN = 0.02
+
+
+async def run_round(clients: list[ArbiterClient], turn_id: int, jitter: float, miss_rate: float,
+                    rng: random.Random) -> list[dict]:
+    """
+    Have every device claim one utterance of the wake word.
+
+    :return: Every device's claim, delay, decision and decision latency.
+    """
+    async def claim(client: ArbiterClient) -> dict:
+        result = {"device": client.client_id, "score": round(rng.uniform(0.5, 1.0), 3),
+                  "snr": round(rng.uniform(0.0, 30.0), 1), "delay": rng.uniform(0.0, jitter)}
+        if rng.random() < miss_rate:
+            return {**result, "heard": False, "won": False}
+
+        await asyncio.sleep(result["delay"])
+        start = time.perf_counter()
+        won = await client.claim(turn_id, result["score"], result["snr"])
+        return {**result, "heard": True, "won": won, "latency": time.perf_counter() - start}
+
+    return await asyncio.gather(*(claim(client) for client in clients))
+
+
+async def run_simulation(devices: int, rounds: int, window: float, hold: float, jitter: float,
+                         miss_rate: float, seed: int) -> dict:
+    """
+    Run the simulated devices against an in-process arbiter on a local socket.
+
+    :param devices: Number of simulated devices.
+    :param rounds: Number of wake words.
+    :param window: The arbiter's claim window in seconds.
+    :param hold: The arbiter's round length in seconds.
+    :param jitter: Max random delay of a device's claim in seconds.
+    :param miss_rate: Chance that a device doesn't hear a wake word.
+    :param seed: Random seed.
+    :return: The results.
+    """
+    rng = random.Random(seed)
+    server = await ArbiterServer(WakewordArbiter(window, hold)).start("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    clients = [ArbiterClient("127.0.0.1", port, client_id=f"device-{i}", timeout=window + 1.0)
+               for i in range(devices)]
+
+    results = []
+    try:
+        for turn_id in range(rounds):
+            claims = await run_round(clients, turn_id, jitter, miss_rate, rng)
+            heard = [claim for claim in claims if claim["heard"]]
+            winners = [claim for claim in heard if claim["won"]]
+            # claims delayed past the window can't win, the rest are ranked like the arbiter does
+            first = min((claim["delay"] for claim in heard), default=0.0)
+            rank = lambda claim: (claim["score"], claim["snr"])
+            surely_in = [claim for claim in heard if claim["delay"] - first < window - WINDOW_MARGIN]
+            maybe_in = [claim for claim in heard if claim["delay"] - first < window + WINDOW_MARGIN]
+            correct = len(winners) == (1 if heard else 0)
+            if winners:
+                # as good as the best claim that surely made it, and no better than any that might have
+                correct = correct and rank(winners[0]) >= max(map(rank, surely_in)) and winners[0] in maybe_in
+            results.append({
+                "heard": len(heard),
+                "winners": [claim["device"] for claim in winners],
+                "correct": correct,
+                "latency": [claim["latency"] for claim in heard],
+            })
+            # let the arbiter's round end before the next wake word
+            await asyncio.sleep(hold + 0.05)
+    finally:
+        for client in clients:
+            await client.close()
+        server.close()
+        await server.wait_closed()
+
+    latencies = [latency for result in results for latency in result["latency"]]
+    return {
+        "devices": devices,
+        "rounds": rounds,
+        "window": window,
+        "jitter": jitter,
+        "miss_rate": miss_rate,
+        "single_winner": sum(len(result["winners"]) == 1 for result in results if result["heard"]),
+        "rounds_heard": sum(1 for result in results if result["heard"]),
+        "incorrect": sum(not result["correct"] for result in results),
+        "decision_latency": {
+            "p50": float(np.percentile(latencies, 50)) if latencies else None,
+            "p90": float(np.percentile(latencies, 90)) if latencies else None,
+            "max": max(latencies, default=None),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run simulated devices against the wakeword arbiter.")
+    parser.add_argument("--devices", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--window", type=float, default=0.15, help="The arbiter's claim window in seconds")
+    parser.add_argument("--hold", type=float, default=0.5, help="The arbiter's round length in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Max random delay of a claim in seconds")
+    parser.add_argument("--miss-rate", type=float, default=0.1, help="Chance a device misses a wake word")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = asyncio.run(run_simulation(args.devices, args.rounds, args.window, args.hold, args.jitter,
+                                         args.miss_rate, args.seed))
+    print(json.dumps(results, indent=2))
+    if results["incorrect"]:
+        sys.exit(1)
@@ -0,0 +1,130 @@
+"""
+Stub backends for the replay benchmark. They keep the interfaces of the real
+models, with fixed delays instead of inference, so the pipeline's own
+overhead can be measured without a GPU.
+"""
+import re
+import time
+from typing import Generator, Iterator
+
+import numpy as np
+
+from utils.audio import float32_to_int16
+
+
+class StubWakewordDetector:
+    """
+    Energy based stand-in for the wakeword/VAD detector. The first voiced
+    frame after a stretch of silence counts as the wake word, and any voiced
+    frame counts as speech.
+    """
+
+    out_of_process = False
+
+    def __init__(self, threshold_db: float = -40.0, min_silence: float = 1.0, frame_length: float = 0.08):
+        """
+        :param threshold_db: Level (dBFS) above which a frame counts as voiced.
+        :param min_silence: Seconds of silence needed before a voiced frame counts as the wake word.
+        :param frame_length: Length of the frames passed to predict() in seconds.
+        """
+        self.threshold_db = threshold_db
+        self.min_silent_frames = int(min_silence / frame_length)
+        self.silent_frames = self.min_silent_frames
+        self.level = -100.0
+        self.voiced = False
+        self.wakeword = False
+        self.skip_ratio = 0.0
+
+    def predict(self, audio_data: np.ndarray):
+        rms = np.sqrt(np.mean(np.square(audio_data.astype(np.float32) / 32768)))
+        self.level = 20 * np.log10(max(rms, 1e-10))
+        self.voiced = self.level > self.threshold_db
+        self.wakeword = self.voiced and self.silent_frames >= self.min_silent_frames
+        self.silent_frames = 0 if self.voiced else self.silent_frames + 1
+
+    @property
+    def wakewords(self) -> list[str]:
+        return ["stub"]
+
+    def is_wakeword_detected(self) -> bool:
+        return self.wakeword
+
+    def detected_wakeword(self) -> str | None:
+        return "stub" if self.wakeword else None
+
+    def wakeword_score(self, name: str | None = None) -> float:
+        return 1.0 if self.wakeword else 0.0
+
+    def snr(self) -> float:
+        return self.level - self.threshold_db
+
+    def vad(self) -> bool:
+        return self.voiced
+
+    def vad_probability(self) -> float:
+        return 1.0 if self.voiced else 0.0
+
+
+class StubSTT:
+    """Stand-in for the batched STT model that always hears the same prompt."""
+
+    streaming = False
+
+    def __init__(self, transcript: str = "What time is it?", delay: float = 0.05, realtime_factor: float = 0.02):
+        """
+        :param transcript: The transcription to return.
+        :param delay: Fixed seconds every transcription takes.
+        :param realtime_factor: Additional seconds per second of audio.
+        """
+        self.transcript = transcript
+        self.delay = delay
+        self.realtime_factor = realtime_factor
+
+    def transcribe(self, audio_data: np.ndarray) -> str:
+        time.sleep(self.delay + self.realtime_factor * len(audio_data) / 16000)
+        return self.transcript
+
+
+class StubCommandProcessor:
+    """Stand-in for the command processor that gives the same response to every prompt."""
+
+    def __init__(self, response: str = "It's half past three. Anything else I can do?",
+                 first_chunk_delay: float = 0.2, chunk_delay: float = 0.05):
+        """
+        :param response: The response, yielded sentence by sentence.
+        :param first_chunk_delay: Seconds until the first sentence.
+        :param chunk_delay: Seconds between the following sentences.
+        """
+        self.chunks = re.split(r"(?<=[.!?])\s+", response.strip())
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+
+    def warm_up(self, session: str = "default", reason: str = "startup") -> float | None:
+        return None
+
+    def process_prompt(self, prompt: str, session: str = "default", trace=None,
+                       gate=None) -> Generator[str, None, None]:
+        for i, chunk in enumerate(self.chunks):
+            time.sleep(self.first_chunk_delay if i == 0 else self.chunk_delay)
+            yield chunk
+
+
+class StubTTS:
+    """Stand-in for the TTS model that speaks a tone for every word."""
+
+    def __init__(self, delay: float = 0.05, word_length: float = 0.25, rate: int = 24000):
+        """
+        :param delay: Seconds every synthesis takes.
+        :param word_length: Seconds of audio per word.
+        :param rate: Sample rate of the audio.
+        """
+        self.delay = delay
+        self.word_length = word_length
+        self.rate = rate
+        self.cache = None
+
+    def synthesize(self, text: str, voice: str | None = None) -> Iterator[np.ndarray]:
+        time.sleep(self.delay)
+        length = int(max(len(text.split()), 1) * self.word_length * self.rate)
+        t = np.arange(length, dtype=np.float32) / self.rate
+        yield float32_to_int16(0.2 * np.sin(2 * np.pi * 440 * t))
@@ -0,0 +1,126 @@
+"""
+Local fake of the Ollama HTTP API, so the real command processor can be
+benchmarked with a predictable model. It streams a canned response token by
+token, with a configurable time to first token and time per token.
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class FakeOllamaServer:
+    def __init__(self, response: str = "It's half past three. Anything else I can do?",
+                 first_token_delay: float = 0.2, token_delay: float = 0.02, host: str = "127.0.0.1", port: int = 0):
+        """
+        :param response: The response to every chat or generate request.
+        :param first_token_delay: Seconds until the first token, like prompt processing.
+        :param token_delay: Seconds between tokens.
+        :param host: Address to listen on.
+        :param port: Port to listen on, any free port if 0.
+        """
+        self.tokens = [word + " " for word in response.split()]
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.requests = 0
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self._send_json({})
+
+            def do_GET(self):
+                match self.path:
+                    case "/":
+                        self.send_response(200)
+                        self.end_headers()
+                        self.wfile.write(b"Ollama is running")
+                    case "/api/version":
+                        self._send_json({"version": "0.0.0-fake"})
+                    case "/api/tags" | "/api/ps":
+                        self._send_json({"models": []})
+                    case _:
+                        self.send_error(404)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                match self.path:
+                    case "/api/chat":
+                        fake.requests += 1
+                        self._stream(body, lambda token: {"message": {"role": "assistant", "content": token}})
+                    case "/api/generate":
+                        fake.requests += 1
+                        self._stream(body, lambda token: {"response": token})
+                    case "/api/show":
+                        self._send_json({"modelfile": "", "parameters": "", "template": "", "details": {}})
+                    case _:
+                        self.send_error(404)
+
+            def _send_json(self, data: dict):
+                payload = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(payload)
+
+            def _stream(self, body: dict, make_chunk):
+                start = time.perf_counter()
+                model = body.get("model", "fake")
+                stream = body.get("stream", True)
+
+                def chunk(token: str, done: bool) -> dict:
+                    data = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": done}
+                    data.update(make_chunk(token))
+                    if done:
+                        duration = int((time.perf_counter() - start) * 1e9)
+                        data.update(done_reason="stop", total_duration=duration, load_duration=0,
+                                    prompt_eval_count=1, eval_count=len(fake.tokens), eval_duration=duration)
+                    return data
+
+                time.sleep(fake.first_token_delay)
+                if not stream:
+                    for _ in fake.tokens[1:]:
+                        time.sleep(fake.token_delay)
+                    self._send_json(chunk("".join(fake.tokens).strip(), True))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for i, token in enumerate(fake.tokens):
+                    if i > 0:
+                        time.sleep(fake.token_delay)
+                    self.wfile.write(json.dumps(chunk(token, False)).encode() + b"\n")
+                    self.wfile.flush()
+                self.wfile.write(json.dumps(chunk("", True)).encode() + b"\n")
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        """The address to use as OLLAMA_HOST."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Start serving in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-ollama", daemon=True)
+        self.thread.start()
+        logger.info(f"Fake Ollama server listening on {self.url}")
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,126 @@
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+import pyaudio
+
+
+class FakeStream:
+    """
+    Callback-mode stream that stands in for a PortAudio one. A thread calls the
+    stream callback on a fixed schedule, at a multiple of real time, the way
+    PortAudio would from its audio thread.
+    """
+
+    def __init__(self, callback, rate: int, frames_per_buffer: int, speed: float,
+                 read: Callable[[int], bytes | None] | None = None,
+                 on_output: Callable[[np.ndarray, float], None] | None = None):
+        """
+        :param callback: The PyAudio stream callback.
+        :param rate: Sample rate of the stream.
+        :param frames_per_buffer: Frames passed to every callback.
+        :param speed: How many times faster than real time the callback is called.
+        :param read: For input streams, returns the next buffer of int16 audio, or None once it runs out.
+        :param on_output: For output streams, called with every buffer the callback returns and its time.
+        """
+        self.callback = callback
+        self.frames_per_buffer = frames_per_buffer
+        self.period = frames_per_buffer / rate / speed
+        self.read = read
+        self.on_output = on_output
+
+        self.input_times = []  # when each input buffer was handed to the callback
+        self.callbacks = 0
+        self.overruns = 0  # callbacks that finished after the next one was due
+        self.max_callback_time = 0.0
+
+        self.active = False
+        self.thread = None
+
+    def _run(self):
+        status = 0
+        deadline = time.perf_counter()
+        while self.active:
+            in_data = None
+            if self.read is not None:
+                in_data = self.read(self.frames_per_buffer)
+                if in_data is None:
+                    break
+                self.input_times.append(time.perf_counter())
+
+            start = time.perf_counter()
+            out_data, flag = self.callback(in_data, self.frames_per_buffer, {"current_time": start}, status)
+            end = time.perf_counter()
+            self.callbacks += 1
+            self.max_callback_time = max(self.max_callback_time, end - start)
+
+            if self.on_output is not None and out_data is not None:
+                self.on_output(np.frombuffer(out_data, dtype=np.int16), end)
+            if flag != pyaudio.paContinue:
+                break
+
+            deadline += self.period
+            if end > deadline:
+                # missed the deadline, so the device would have over/underflowed
+                self.overruns += 1
+                status = pyaudio.paInputOverflow if self.read is not None else pyaudio.paOutputUnderflow
+                deadline = end
+            else:
+                status = 0
+                time.sleep(deadline - end)
+
+        self.active = False
+
+    def start_stream(self):
+        self.active = True
+        self.thread = threading.Thread(target=self._run, name="fake-stream", daemon=True)
+        self.thread.start()
+
+    def stop_stream(self):
+        self.active = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def is_active(self) -> bool:
+        return self.active
+
+    def close(self):
+        self.stop_stream()
+
+
+class FakePyAudio:
+    """
+    Stand-in for pyaudio.PyAudio that replays audio into input streams and
+    hands output streams' audio to a listener instead of a device.
+    """
+
+    def __init__(self, speed: float = 1.0, read: Callable[[int], bytes | None] | None = None,
+                 on_output: Callable[[np.ndarray, float], None] | None = None):
+        """
+        :param speed: How many times faster than real time the streams run.
+        :param read: Returns the next buffer of int16 input audio, or None once it runs out.
+            Can also be set later, before an input stream is opened.
+        :param on_output: Called with every buffer of output audio and the time it was played.
+        """
+        self.speed = speed
+        self.read = read
+        self.on_output = on_output
+        self.input_streams = []
+        self.output_streams = []
+
+    def open(self, rate: int, frames_per_buffer: int = 1024, input: bool = False, output: bool = False,
+             stream_callback=None, **kwargs) -> FakeStream:
+        if stream_callback is None:
+            raise ValueError("Only callback mode streams are supported.")
+
+        if input:
+            stream = FakeStream(stream_callback, rate, frames_per_buffer, self.speed, read=self.read)
+            self.input_streams.append(stream)
+        else:
+            stream = FakeStream(stream_callback, rate, frames_per_buffer, self.speed, on_output=self.on_output)
+            self.output_streams.append(stream)
+        return stream
+
+    def terminate(self):
+        pass
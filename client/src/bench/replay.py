@@ -0,0 +1,363 @@
+"""
+Replay benchmark for the assistant pipeline.
+
+Feeds recorded prompts (mono 16 kHz WAV files, each starting with the wake
+word) through the real pipeline with a fake PyAudio, faster than real time,
+and reports per-stage latencies as JSON, e.g.:
+
+    python -m bench.replay prompts/*.wav --speed 4 --out results.json
+    python -m bench.replay prompts/*.wav --stt real --llm fake-ollama --baseline results.json
+
+Latencies are measured from when the triggering frame was captured: the
+wake word frame for the beep, and the frame the endpointer ended the prompt
+on (after pause_length of silence) for the rest.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pyaudio
+
+from config import logging_config
+from pipeline import components
+from pipeline.pipeline import AssistantPipeline, RATE, CHUNK, INITIAL_PAUSE_TIME, SPECULATIVE_ENDPOINTING
+from utils.audio import load_wav
+from utils.playback import AudioPlaybackManager
+from .backends import StubWakewordDetector, StubSTT, StubCommandProcessor, StubTTS
+from .fake_ollama import FakeOllamaServer
+from .fakes import FakePyAudio
+
+logger = logging.getLogger(__name__)
+
+METRICS = {
+    "wake_to_beep": ("wakeword_at", "beep_at"),
+    "speech_end_to_transcript": ("speech_end_at", "transcript_at"),
+    "speech_end_to_first_text": ("speech_end_at", "text_at"),
+    "speech_end_to_first_audio": ("speech_end_at", "audio_at"),
+}
+
+
+class TurnRecorder:
+    """Collects the timestamps of every replayed prompt's turn."""
+
+    def __init__(self, audio_interface: FakePyAudio):
+        """
+        :param audio_interface: The fake PyAudio the mic is opened with, for the capture times of frames.
+        """
+        self.audio_interface = audio_interface
+        self.lock = threading.Lock()
+        self.turns = []
+        self.by_turn_id = {}
+        self.awaiting_beep = None
+        self.awaiting_audio = None
+        self.finished = threading.Event()
+
+    @property
+    def current(self) -> dict | None:
+        return self.turns[-1] if self.turns else None
+
+    def start_prompt(self, path: Path):
+        """Start recording the turn of the next replayed prompt."""
+        with self.lock:
+            self.turns.append({"file": str(path), "status": "missed"})
+            self.finished.clear()
+
+    def _frame_time(self, frame: int) -> float:
+        return self.audio_interface.input_streams[0].input_times[frame - 1]
+
+    def on_event(self, event: str, turn_id: int, frame: int | None):
+        """Pipeline event listener."""
+        now = time.perf_counter()
+        with self.lock:
+            if event == "wakeword":
+                turn = self.current
+                if turn is None:
+                    return
+                turn.update(status="wakeword", wakeword_at=self._frame_time(frame))
+                self.by_turn_id[turn_id] = turn
+                self.awaiting_beep = turn
+                return
+
+            if event == "speculation_miss":
+                # the speculative work was dropped, the turn goes on under a new id
+                turn = self.current
+                if turn is not None:
+                    turn.pop("transcript_at", None)
+                    turn.pop("text_at", None)
+                    turn["speculation_misses"] = turn.get("speculation_misses", 0) + 1
+                    self.by_turn_id[turn_id] = turn
+                return
+
+            turn = self.by_turn_id.get(turn_id)
+            if turn is None:
+                return
+            match event:
+                case "speech_end":
+                    turn.update(status="speech_end", speech_end_at=self._frame_time(frame))
+                    self.awaiting_audio = turn
+                case "transcript" | "text":
+                    turn.setdefault(f"{event}_at", now)
+                case "done":
+                    turn["status"] = "ok"
+                    self.finished.set()
+                case "reset":
+                    turn["status"] = "reset"
+                    self.finished.set()
+
+    def on_output(self, samples: np.ndarray, played_at: float):
+        """Output stream listener, notes when the beep and the response start playing."""
+        if not samples.any():
+            return
+        with self.lock:
+            if self.awaiting_beep is not None:
+                self.awaiting_beep["beep_at"] = played_at
+                self.awaiting_beep = None
+            elif self.awaiting_audio is not None:
+                self.awaiting_audio["audio_at"] = played_at
+                self.awaiting_audio = None
+
+
+class ReplaySource:
+    """
+    Mic input for the fake PyAudio. Plays the prompts one after another, and
+    after each one keeps feeding silence until its turn is over.
+    """
+
+    def __init__(self, paths: list[Path], recorder: TurnRecorder, playback_manager: AudioPlaybackManager,
+                 lead_silence: float = 1.0, turn_timeout: float = 30.0):
+        """
+        :param paths: WAV files with the prompts.
+        :param recorder: Records the turns of the prompts.
+        :param playback_manager: The pipeline's playback manager, a turn is over once it stops playing.
+        :param lead_silence: Seconds of silence before every prompt.
+        :param turn_timeout: Wall clock seconds to wait for a turn to finish.
+        """
+        self.paths = paths
+        self.recorder = recorder
+        self.playback_manager = playback_manager
+        self.lead_silence = lead_silence
+        self.turn_timeout = turn_timeout
+        self.frames = self._frames()
+
+    def _frames(self):
+        silence = np.zeros(CHUNK, dtype=np.int16).tobytes()
+        lead_frames = int(self.lead_silence * RATE / CHUNK)
+        # frames to wait for a wake word after the prompt ended, before counting it as missed
+        grace_frames = int((INITIAL_PAUSE_TIME + 1) * RATE / CHUNK)
+
+        for path in self.paths:
+            audio = load_wav(path, RATE)
+            audio = np.pad(audio, (0, -len(audio) % CHUNK))
+
+            for _ in range(lead_frames):
+                yield silence
+            self.recorder.start_prompt(path)
+            for start in range(0, len(audio), CHUNK):
+                yield audio[start:start + CHUNK].tobytes()
+
+            turn = self.recorder.current
+            waited = 0
+            deadline = time.perf_counter() + self.turn_timeout
+            while not (self.recorder.finished.is_set() and not self.playback_manager.is_playing):
+                if "wakeword_at" not in turn and waited >= grace_frames:
+                    break
+                if time.perf_counter() > deadline:
+                    turn["status"] = "timeout"
+                    logger.warning(f"Turn of {path} timed out")
+                    break
+                waited += 1
+                yield silence
+
+        for _ in range(lead_frames):
+            yield silence
+
+    def read(self, frame_count: int) -> bytes | None:
+        return next(self.frames, None)
+
+
+def load_command_processor():
+    """
+    Load a command processor for the benchmark. Its memory is kept in memory
+    and the fast path is off, so runs don't influence each other.
+    """
+    from command import CommandProcessor
+
+    return CommandProcessor(
+        model_name=components.LLM_MODEL, stream_tokens=components.LLM_STREAM_TOKENS,
+        tool_timeout=components.TOOL_TIMEOUT, memory_max_tokens=components.MEMORY_MAX_TOKENS,
+        memory_max_turns=components.MEMORY_MAX_TURNS, memory_summarize=components.MEMORY_SUMMARIZE,
+        tool_top_k=components.TOOL_TOP_K)
+
+
+def summarize(values: list[float]) -> dict:
+    """Latency statistics in seconds."""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": float(np.mean(values)),
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(np.max(values)),
+    }
+
+
+async def run_benchmark(paths: list[Path], wakeword: str, stt: str, llm: str, tts: str, speed: float,
+                        lead_silence: float, turn_timeout: float, speculative: bool = True,
+                        wakeword_process: bool = components.WAKEWORD_PROCESS) -> dict:
+    """
+    Replay the prompts through the pipeline.
+
+    :param paths: WAV files with the prompts.
+    :param wakeword: Wakeword backend, "stub" or "real".
+    :param stt: STT backend, "stub" or "real".
+    :param llm: LLM backend, "stub", "fake-ollama" or "real".
+    :param tts: TTS backend, "stub" or "real".
+    :param speed: How many times faster than real time the audio is replayed.
+    :param lead_silence: Seconds of silence before every prompt.
+    :param turn_timeout: Wall clock seconds to wait for a turn to finish.
+    :param speculative: Use speculative endpointing, if the config enables it.
+    :param wakeword_process: Run the wakeword detector in a worker process.
+    :return: The results.
+    """
+    audio_interface = FakePyAudio(speed)
+    recorder = TurnRecorder(audio_interface)
+    audio_interface.on_output = recorder.on_output
+    playback_manager = AudioPlaybackManager(rate=24000, format=pyaudio.paInt16, channels=1, chunk_size=1024,
+                                            audio_interface=audio_interface)
+    audio_interface.read = ReplaySource(paths, recorder, playback_manager, lead_silence, turn_timeout).read
+
+    ollama = None
+    # frames are due as fast as they are replayed
+    deadline = CHUNK / RATE / speed
+    if wakeword == "stub" and wakeword_process:
+        from wakeword import WakewordProcess
+
+        wakeword_detector = WakewordProcess(StubWakewordDetector, deadline=deadline)
+    elif wakeword == "stub":
+        wakeword_detector = StubWakewordDetector()
+    else:
+        wakeword_detector = components.load_wakeword_detector(wakeword_process, deadline)
+    stt_model = StubSTT() if stt == "stub" else components.load_stt_model()
+    if llm == "stub":
+        command_processor = StubCommandProcessor()
+    else:
+        if llm == "fake-ollama":
+            ollama = FakeOllamaServer()
+            ollama.start()
+            os.environ["OLLAMA_HOST"] = ollama.url
+        command_processor = load_command_processor()
+    tts_model = StubTTS() if tts == "stub" else components.load_tts_model()
+
+    pipeline = AssistantPipeline(wakeword_detector, playback_manager, stt_model=stt_model,
+                                 command_processor=command_processor, tts_model=tts_model,
+                                 audio_interface=audio_interface, on_event=recorder.on_event,
+                                 speculative=speculative and SPECULATIVE_ENDPOINTING)
+
+    start = time.perf_counter()
+    try:
+        await pipeline.run()
+    finally:
+        playback_manager.close()
+        if ollama is not None:
+            ollama.stop()
+    elapsed = time.perf_counter() - start
+
+    turns = []
+    for turn in recorder.turns:
+        result = {"file": turn["file"], "status": turn["status"]}
+        for metric, (start_key, end_key) in METRICS.items():
+            if start_key in turn and end_key in turn:
+                result[metric] = turn[end_key] - turn[start_key]
+        turns.append(result)
+
+    input_stream = audio_interface.input_streams[0]
+    output_overruns = sum(stream.overruns for stream in audio_interface.output_streams)
+    return {
+        "backends": {"wakeword": wakeword, "stt": stt, "llm": llm, "tts": tts},
+        "speed": speed,
+        "pause_length": components.crumbot_config["pause_length"],
+        "elapsed": elapsed,
+        "prompts": len(turns),
+        "statuses": {status: sum(turn["status"] == status for turn in turns)
+                     for status in sorted({turn["status"] for turn in turns})},
+        "latency": {metric: summarize([turn[metric] for turn in turns if metric in turn]) for metric in METRICS},
+        "overruns": {"input": input_stream.overruns, "output": output_overruns},
+        "max_callback_time": {
+            "input": input_stream.max_callback_time,
+            "output": max((stream.max_callback_time for stream in audio_interface.output_streams), default=0.0),
+        },
+        "frames_dropped": pipeline.frames_dropped,
+        "wakeword_deadline_misses": wakeword_detector.deadline_misses if wakeword_process else None,
+        "input_overflows": pipeline.input_overflows,
+        "speculation": pipeline.endpointer.stats() if pipeline.endpointer is not None else None,
+        "turns": turns,
+    }
+
+
+def compare(baseline: dict, results: dict, max_regression: float | None) -> bool:
+    """
+    Print how the latencies changed since a baseline run.
+
+    :param baseline: Results of the baseline run.
+    :param results: Results of this run.
+    :param max_regression: Max allowed relative increase of a p50/p90 latency, or None to allow any.
+    :return: If no latency regressed more than allowed.
+    """
+    ok = True
+    for metric in METRICS:
+        old, new = baseline["latency"].get(metric, {}), results["latency"][metric]
+        for q in ("p50", "p90"):
+            if q not in old or q not in new:
+                continue
+            change = (new[q] - old[q]) / old[q] if old[q] else 0.0
+            regressed = max_regression is not None and change > max_regression
+            ok = ok and not regressed
+            print(f"{metric} {q}: {old[q] * 1000:.0f} ms -> {new[q] * 1000:.0f} ms ({change:+.0%})"
+                  + (" REGRESSION" if regressed else ""), file=sys.stderr)
+    for stream in ("input", "output"):
+        print(f"{stream} overruns: {baseline['overruns'][stream]} -> {results['overruns'][stream]}", file=sys.stderr)
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded prompts through the Crumbot pipeline.")
+    parser.add_argument("prompts", nargs="+", type=Path,
+                        help="Mono 16 kHz 16-bit WAV files, each with the wake word and a prompt")
+    parser.add_argument("--wakeword", choices=["stub", "real"], default="real")
+    parser.add_argument("--stt", choices=["stub", "real"], default="stub")
+    parser.add_argument("--llm", choices=["stub", "fake-ollama", "real"], default="stub")
+    parser.add_argument("--tts", choices=["stub", "real"], default="stub")
+    parser.add_argument("--speed", type=float, default=4.0, help="Replay speed relative to real time")
+    parser.add_argument("--lead-silence", type=float, default=1.0, help="Seconds of silence before every prompt")
+    parser.add_argument("--turn-timeout", type=float, default=30.0, help="Seconds to wait for a turn to finish")
+    parser.add_argument("--no-speculation", action="store_true", help="Disable speculative endpointing")
+    parser.add_argument("--no-wakeword-process", action="store_true",
+                        help="Run the wakeword detector in the pipeline's process")
+    parser.add_argument("--out", type=Path, help="File to write the results to, instead of stdout")
+    parser.add_argument("--baseline", type=Path, help="Results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="Fail if a p50/p90 latency got worse than this fraction of the baseline (e.g. 0.1)")
+    args = parser.parse_args()
+
+    logging_config.configure_logging()
+    results = asyncio.run(run_benchmark(args.prompts, args.wakeword, args.stt, args.llm, args.tts, args.speed,
+                                        args.lead_silence, args.turn_timeout, not args.no_speculation,
+                                        components.WAKEWORD_PROCESS and not args.no_wakeword_process))
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        args.out.write_text(output)
+    else:
+        print(output)
+
+    if args.baseline and not compare(json.loads(args.baseline.read_text()), results, args.max_regression):
+        sys.exit(1)
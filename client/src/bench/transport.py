@@ -0,0 +1,125 @@
+"""
+Audio transport over a simulated network link. Streams a recording through
+every codec in packets, delays each packet by a random network delay (or
+drops it), and plays what the jitter buffer releases on a simulated clock.
+Reports the bandwidth, codec time, quality and playback gaps of each codec,
+e.g.:
+
+    python -m bench.transport response.wav --jitter 0.05 --loss 0.01
+"""
+import argparse
+import heapq
+import json
+import random
+from pathlib import Path
+
+import numpy as np
+
+from server.codec import available_codecs, make_codec
+from server.transport import AudioPacketizer, JitterBuffer
+from utils.audio import load_wav
+
+
+def snr(reference: np.ndarray, audio_data: np.ndarray) -> float | None:
+    """
+    Signal-to-noise ratio of decoded audio against the original in dB, lost
+    packets count as noise. None if they don't line up.
+    """
+    if len(reference) != len(audio_data):
+        return None
+    noise = np.sum(np.square(reference.astype(np.float64) - audio_data))
+    signal = np.sum(np.square(reference.astype(np.float64)))
+    return float(10 * np.log10(signal / max(noise, 1.0)))  # lossless audio comes out as its own power in dB
+
+
+def simulate(audio_data: np.ndarray, codec: str, rate: int, packet_length: float, target: float,
+             latency: float, jitter: float, loss: float, seed: int) -> dict:
+    """
+    Send a stream through a simulated link, as fast as the sender produces it.
+
+    :param audio_data: The stream as int16 audio.
+    :param codec: Name of the codec.
+    :param rate: Sample rate of the stream.
+    :param packet_length: Seconds of audio per packet.
+    :param target: Seconds the jitter buffer holds back.
+    :param latency: Fixed network delay in seconds.
+    :param jitter: Max random extra delay of a packet in seconds.
+    :param loss: Chance a packet is dropped.
+    :param seed: Random seed.
+    :return: The results.
+    """
+    rng = random.Random(seed)
+    packetizer = AudioPacketizer(make_codec(codec, rate), packet_length)
+    jitter_buffer = JitterBuffer(make_codec(codec, rate), target)
+
+    # packets leave at the pace the audio is produced, like from streaming TTS, and arrive out of order
+    arrivals = []
+    for packet in packetizer.split(audio_data):
+        seq, samples, payload = packetizer.encode(packet)
+        if rng.random() >= loss:
+            sent_at = seq * packet_length
+            heapq.heappush(arrivals, (sent_at + latency + rng.uniform(0.0, jitter), seq, samples, payload))
+
+    # play what the jitter buffer releases, on a clock that starts with the first audio
+    released = []
+    play_start = None
+    played_until = 0.0
+    gaps = 0
+    gap_time = 0.0
+    while arrivals:
+        arrived_at, seq, samples, payload = heapq.heappop(arrivals)
+        ready = jitter_buffer.push(seq, samples, payload) if arrivals else \
+            jitter_buffer.push(seq, samples, payload) + jitter_buffer.flush()
+        for segment in ready:
+            if play_start is None:
+                play_start = played_until = arrived_at
+            if arrived_at > played_until:
+                # playback ran dry before this audio arrived
+                gaps += 1
+                gap_time += arrived_at - played_until
+                played_until = arrived_at
+            played_until += len(segment) / rate
+            released.append(segment)
+
+    decoded = np.concatenate(released) if released else np.zeros(0, dtype=np.int16)
+    seconds = len(audio_data) / rate
+    return {
+        "codec": codec,
+        "kbps": packetizer.bytes * 8 / seconds / 1000,
+        "compression": len(audio_data) * 2 / packetizer.bytes,
+        "encode_rtf": packetizer.encode_time / seconds,
+        "decode_rtf": jitter_buffer.decode_time / seconds,
+        "snr_db": snr(audio_data, decoded),
+        "packets": packetizer.seq,
+        "lost": jitter_buffer.lost,
+        "late": jitter_buffer.late,
+        "first_audio": play_start,
+        "gaps": gaps,
+        "gap_time": gap_time,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the audio codecs over a simulated network link.")
+    parser.add_argument("audio", type=Path, help="Mono 16-bit WAV file to stream")
+    parser.add_argument("--rate", type=int, default=24000, help="Sample rate of the file")
+    parser.add_argument("--codecs", nargs="+", help="Default: every available codec")
+    parser.add_argument("--packet-length", type=float, default=0.1, help="Seconds of audio per packet")
+    parser.add_argument("--jitter-buffer", type=float, default=0.1, help="Seconds the jitter buffer holds back")
+    parser.add_argument("--latency", type=float, default=0.02, help="Fixed network delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Max random extra delay in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="Chance a packet is dropped")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="File to write the results to, instead of stdout")
+    args = parser.parse_args()
+
+    audio = load_wav(args.audio, args.rate)
+    results = [simulate(audio, codec, args.rate, args.packet_length, args.jitter_buffer, args.latency,
+                        args.jitter, args.loss, args.seed)
+               for codec in args.codecs or available_codecs()]
+    output = json.dumps({"audio": str(args.audio), "seconds": len(audio) / args.rate, "latency": args.latency,
+                         "jitter": args.jitter, "loss": args.loss, "results": results}, indent=2)
+    if args.out:
+        args.out.write_text(output, encoding="utf8")
+    else:
+        print(output)
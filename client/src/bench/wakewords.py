@@ -0,0 +1,94 @@
+"""
+Cost of listening for several wakewords. Times the per-frame predict() of
+one detector with N wakeword models, which share the feature extraction,
+against N detectors with one model each, e.g.:
+
+    python -m bench.wakewords --max-wakewords 4 --seconds 20
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from wakeword import OpenWakewordDetector
+
+MODELS_DIR = Path(__file__).parent.parent / "wakeword" / "models"
+FRAME_SIZE = 1280
+
+
+def copy_models(directory: Path, count: int) -> list[Path]:
+    """
+    Copy the bundled wakeword models under distinct names, since a detector's
+    wakewords are named after their files.
+
+    :return: Paths of `count` models.
+    """
+    sources = sorted(MODELS_DIR.glob("*.onnx"))
+    paths = []
+    for i in range(count):
+        source = sources[i % len(sources)]
+        path = directory / f"{source.stem}_{i}.onnx"
+        shutil.copy(source, path)
+        paths.append(path)
+    return paths
+
+
+def time_frames(detectors: list[OpenWakewordDetector], frames: np.ndarray) -> float:
+    """
+    Run every frame through all the detectors.
+
+    :return: Mean seconds per frame.
+    """
+    start = time.perf_counter()
+    for frame in frames:
+        for detector in detectors:
+            detector.predict(frame)
+            detector.detected_wakeword()
+    return (time.perf_counter() - start) / len(frames)
+
+
+def run(max_wakewords: int, seconds: float, seed: int) -> dict:
+    """
+    Time detection with 1 to `max_wakewords` wakewords.
+
+    :param max_wakewords: Most wakewords to listen for.
+    :param seconds: Seconds of audio per measurement.
+    :param seed: Random seed of the noise audio.
+    :return: The results.
+    """
+    rng = np.random.default_rng(seed)
+    # quiet noise, the detectors' cost doesn't depend on what's said
+    frames = (rng.normal(0, 300, (int(seconds * 16000 / FRAME_SIZE), FRAME_SIZE))).astype(np.int16)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = copy_models(Path(directory), max_wakewords)
+        for count in range(1, max_wakewords + 1):
+            shared = OpenWakewordDetector([str(path) for path in paths[:count]])
+            separate = [OpenWakewordDetector(str(path)) for path in paths[:count]]
+            time_frames([shared, *separate], frames[:10])  # warm up
+            results.append({
+                "wakewords": count,
+                "shared": time_frames([shared], frames),
+                "separate": time_frames(separate, frames),
+            })
+
+    single = results[0]["shared"]
+    for result in results:
+        result["shared_relative"] = result["shared"] / single
+        result["separate_relative"] = result["separate"] / single
+    return {"seconds": seconds, "frame_length": FRAME_SIZE / 16000, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time wakeword detection with several wakewords.")
+    parser.add_argument("--max-wakewords", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=20.0, help="Seconds of audio per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.max_wakewords, args.seconds, args.seed), indent=2))
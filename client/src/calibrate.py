@@ -0,0 +1,174 @@
+"""
+STT calibration for this machine.
+
+Benchmarks every combination of the candidate STT models, compute types,
+CPU thread counts and beam sizes on a reference clip, and writes the fastest
+one that transcribes it in time (and accurately enough, with a reference
+transcript) into config.toml, e.g.:
+
+    python calibrate.py prompt.wav --device cpu
+    python calibrate.py prompt.wav --device cpu --models base.en small.en --target-rtf 0.2 --max-wer 0.1
+
+The clip should be a typical prompt. A .txt file with the same name is its
+reference transcript.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from transcribe import SAMPLE_RATE, load_audio, word_errors
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODELS = ["base.en", "small.en", "distil-large-v3", "large-v3-turbo"]
+DEFAULT_COMPUTE_TYPES = {"cpu": ["int8", "float32"], "cuda": ["int8", "int8_float16", "float16"]}
+DEFAULT_BEAM_SIZES = [1, 5]
+
+
+def default_thread_counts() -> list[int]:
+    """Half and all of the cores, which are usually the fastest settings for CTranslate2 on the CPU."""
+    cores = os.cpu_count() or 1
+    return sorted({max(cores // 2, 1), cores})
+
+
+def supported_compute_types(device: str, compute_types: list[str]) -> list[str]:
+    """Drop the compute types the device can't run."""
+    import ctranslate2
+
+    supported = ctranslate2.get_supported_compute_types(device)
+    for compute_type in compute_types:
+        if compute_type not in supported:
+            logger.warning(f"Skipping {compute_type}, {device} only supports {sorted(supported)}")
+    return [compute_type for compute_type in compute_types if compute_type in supported]
+
+
+def measure(stt, audio, reference: str | None, beam_size: int, repeats: int) -> dict:
+    """
+    Time the transcription of the clip with one beam size.
+
+    :param stt: The loaded STT model.
+    :param audio: The clip as int16 audio.
+    :param reference: The clip's transcript, if known.
+    :param beam_size: Beam size of the decode.
+    :param repeats: Timed decodes, the median of them counts.
+    :return: The real-time factor and the word error rate.
+    """
+    stt.decode_options["beam_size"] = beam_size
+    hypothesis = stt.transcribe(audio)  # untimed, so caches and thread pools are warm
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        stt.transcribe(audio)
+        times.append(time.perf_counter() - start)
+
+    result = {"rtf": statistics.median(times) / (len(audio) / SAMPLE_RATE), "hypothesis": hypothesis, "wer": None}
+    if reference is not None:
+        errors, words = word_errors(reference, hypothesis)
+        result["wer"] = errors / words if words else None
+    return result
+
+
+def calibrate(audio, reference: str | None, device: str, models: list[str], compute_types: list[str],
+              thread_counts: list[int], beam_sizes: list[int], repeats: int) -> list[dict]:
+    """
+    Benchmark every combination of the candidate settings. Each model is loaded
+    once per compute type and thread count, and decoded with every beam size.
+
+    :return: A result per combination.
+    """
+    from stt import FasterWhisperBatchedSTT
+
+    results = []
+    for model, compute_type, cpu_threads in itertools.product(models, compute_types, thread_counts):
+        settings = {"stt_model": model, "stt_compute_type": compute_type, "stt_cpu_threads": cpu_threads}
+        try:
+            stt = FasterWhisperBatchedSTT(model, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+        except Exception as e:
+            logger.error(f"Failed to load {settings}: {e!r}")
+            continue
+
+        for beam_size in beam_sizes:
+            result = {**settings, "stt_beam_size": beam_size,
+                      **measure(stt, audio, reference, beam_size, repeats)}
+            wer = f"{result['wer']:.1%}" if result["wer"] is not None else "n/a"
+            logger.info(f"{model} {compute_type}, {cpu_threads} threads, beam {beam_size}: "
+                        f"real-time factor {result['rtf']:.3f}, WER {wer}")
+            results.append(result)
+        del stt
+    return results
+
+
+def pick(results: list[dict], target_rtf: float, max_wer: float | None) -> dict | None:
+    """
+    Pick the fastest result within the target real-time factor and word error rate.
+
+    :return: The best result, None if none of them qualify.
+    """
+    qualified = [result for result in results if result["rtf"] <= target_rtf
+                 and (max_wer is None or (result["wer"] is not None and result["wer"] <= max_wer))]
+    return min(qualified, key=lambda result: result["rtf"], default=None)
+
+
+if __name__ == "__main__":
+    import config
+    from config import logging_config
+
+    crumbot_config = config.get_config()
+
+    parser = argparse.ArgumentParser(description="Find the fastest STT settings for this machine and save them.")
+    parser.add_argument("clip", type=Path, help="Reference recording of a typical prompt")
+    parser.add_argument("--reference", help="Transcript of the clip, instead of a .txt file next to it")
+    parser.add_argument("--device", choices=["cpu", "cuda"], default=crumbot_config["device"])
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS)
+    parser.add_argument("--compute-types", nargs="+", help="Default: int8 and float32 on the CPU, "
+                        "int8, int8_float16 and float16 on CUDA")
+    parser.add_argument("--threads", type=int, nargs="+", help="CPU thread counts, default: half and all cores")
+    parser.add_argument("--beam-sizes", type=int, nargs="+", default=DEFAULT_BEAM_SIZES)
+    parser.add_argument("--repeats", type=int, default=3, help="Timed decodes per combination")
+    parser.add_argument("--target-rtf", type=float, default=0.3,
+                        help="Max seconds of decoding per second of audio")
+    parser.add_argument("--max-wer", type=float, help="Max word error rate on the clip, needs a reference")
+    parser.add_argument("--out", help="JSON file to write every combination's results to")
+    parser.add_argument("--dry-run", action="store_true", help="Don't write the result into config.toml")
+    args = parser.parse_args()
+
+    logging_config.configure_logging()
+
+    reference = args.reference
+    if reference is None and args.clip.with_suffix(".txt").exists():
+        reference = args.clip.with_suffix(".txt").read_text(encoding="utf8").strip()
+    if args.max_wer is not None and reference is None:
+        sys.exit("--max-wer needs a reference transcript")
+
+    audio = load_audio(args.clip)
+    compute_types = supported_compute_types(args.device, args.compute_types or DEFAULT_COMPUTE_TYPES[args.device])
+    # the thread count only matters on the CPU
+    thread_counts = (args.threads or default_thread_counts()) if args.device == "cpu" else [0]
+    logger.info(f"Calibrating on {args.clip} ({len(audio) / SAMPLE_RATE:.1f}s) with {args.device}: "
+                f"{args.models}, {compute_types}, {thread_counts} threads, beam sizes {args.beam_sizes}")
+
+    results = calibrate(audio, reference, args.device, args.models, compute_types, thread_counts,
+                        args.beam_sizes, args.repeats)
+    if args.out:
+        with open(args.out, "w", encoding="utf8") as f:
+            json.dump({"clip": str(args.clip), "device": args.device, "reference": reference, "results": results},
+                      f, indent=2)
+
+    best = pick(results, args.target_rtf, args.max_wer)
+    if best is None:
+        sys.exit(f"None of the {len(results)} combinations met the target real-time factor of {args.target_rtf}"
+                 + (f" and WER of {args.max_wer:.1%}" if args.max_wer is not None else ""))
+
+    values = {"device": args.device, **{key: best[key] for key in
+                                        ("stt_model", "stt_compute_type", "stt_cpu_threads", "stt_beam_size")}}
+    logger.info(f"Fastest: {values}, real-time factor {best['rtf']:.3f}")
+    if not args.dry_run:
+        config.update_config(values)
+        logger.info(f"Saved to {config.CONFIG_PATH}")
@@ -0,0 +1,217 @@
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AnyMessage, BaseMessage, HumanMessage, SystemMessage, RemoveMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_ID = "conversation-summary"
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and their voice assistant in a few short sentences. "
+    "Keep facts, names and preferences the assistant may need later, and leave out small talk. "
+    "Only answer with the summary."
+)
+
+
+class ConversationMemory:
+    """
+    Persistent, bounded conversation memory for the agent.
+
+    Conversations are checkpointed to a SQLite file. Each session (like a
+    client of the inference server) continues its conversation until it has
+    been idle for too long, after which it starts a new thread. The history
+    the model sees is kept within a token and turn budget: once it grows past
+    the budget, the oldest turns are folded into a running summary and
+    removed from the checkpoint, so prompt processing time stays flat.
+    """
+
+    def __init__(self, model: BaseChatModel, db_path: str | Path | None = None, max_tokens: int = 2000,
+                 max_turns: int = 20, summarize: bool = True, session_timeout: float = 1800,
+                 retention: float = 7 * 24 * 3600):
+        """
+        :param model: Chat model used to summarize trimmed turns.
+        :param db_path: SQLite file to persist conversations to, kept in memory if not given.
+        :param max_tokens: Approximate token budget for the history sent to the model.
+        :param max_turns: Max number of user turns kept in the history.
+        :param summarize: Summarize trimmed turns instead of just dropping them.
+        :param session_timeout: Seconds of inactivity after which a session starts a new conversation.
+        :param retention: Seconds after which inactive conversations are deleted.
+        """
+        self.model = model.with_config(tags=[TAG_NOSTREAM])
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.summarize = summarize
+        self.session_timeout = session_timeout
+        self.retention = retention
+
+        if db_path is not None:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        # the saver serializes access with its own lock, so the connection can be shared between threads
+        self.conn = sqlite3.connect(str(db_path or ":memory:"), check_same_thread=False)
+        self.checkpointer = SqliteSaver(self.conn)
+        with self.checkpointer.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    thread_id TEXT PRIMARY KEY,
+                    session TEXT NOT NULL,
+                    last_active REAL NOT NULL
+                )""")
+
+        self._delete_expired()
+
+    def thread_id(self, session: str) -> str:
+        """
+        Get the conversation thread to continue for a session, starting a new
+        one if the session has been idle for too long.
+
+        :param session: The session, like a client id.
+        :return: The thread id to pass to the agent.
+        """
+        now = time.time()
+        thread_id = self.current_thread_id(session)
+        if thread_id is None:
+            thread_id = f"{session}-{now:.0f}"
+            logger.info(f"Starting conversation {thread_id}")
+        with self.checkpointer.cursor() as cur:
+            cur.execute("INSERT OR REPLACE INTO sessions (thread_id, session, last_active) VALUES (?, ?, ?)",
+                        (thread_id, session, now))
+
+        return thread_id
+
+    def current_thread_id(self, session: str) -> str | None:
+        """
+        Get the conversation thread a session would continue, without touching it.
+
+        :param session: The session, like a client id.
+        :return: The thread id, or None if the session would start a new conversation.
+        """
+        with self.checkpointer.cursor() as cur:
+            cur.execute("SELECT thread_id, last_active FROM sessions WHERE session = ? "
+                        "ORDER BY last_active DESC LIMIT 1", (session,))
+            row = cur.fetchone()
+        if row is not None and time.time() - row[1] < self.session_timeout:
+            return row[0]
+        return None
+
+    def compact(self, thread_id: str):
+        """
+        Delete all but the latest checkpoint of a thread, only the latest one
+        is needed to continue the conversation.
+
+        :param thread_id: The thread to compact.
+        """
+        latest = self.latest_checkpoint(thread_id)
+        if latest is None:
+            return
+        with self.checkpointer.cursor() as cur:
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id < ?", (thread_id, latest))
+            cur.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_id < ?", (thread_id, latest))
+
+    def latest_checkpoint(self, thread_id: str) -> str | None:
+        """
+        Get the id of a thread's latest checkpoint.
+
+        :param thread_id: The thread.
+        :return: The checkpoint id, or None if the thread has no checkpoints yet.
+        """
+        with self.checkpointer.cursor() as cur:
+            cur.execute("SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ''",
+                        (thread_id,))
+            return cur.fetchone()[0]
+
+    def rollback(self, thread_id: str, checkpoint_id: str | None):
+        """
+        Undo a thread's turns since a checkpoint, by deleting the checkpoints after it.
+
+        :param thread_id: The thread to roll back.
+        :param checkpoint_id: The checkpoint to go back to, or None to go back to an empty conversation.
+        """
+        with self.checkpointer.cursor() as cur:
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id > ?",
+                        (thread_id, checkpoint_id or ""))
+            cur.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_id > ?", (thread_id, checkpoint_id or ""))
+
+    def _delete_expired(self):
+        """Delete conversations that have been inactive for longer than the retention time."""
+        with self.checkpointer.cursor() as cur:
+            cur.execute("SELECT thread_id FROM sessions WHERE last_active < ?", (time.time() - self.retention,))
+            expired = [row[0] for row in cur.fetchall()]
+
+        for thread_id in expired:
+            self.checkpointer.delete_thread(thread_id)
+            with self.checkpointer.cursor() as cur:
+                cur.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+
+        if expired:
+            logger.info(f"Deleted {len(expired)} expired conversation(s)")
+
+    def _within_budget(self, messages: list[BaseMessage], max_tokens: int, max_turns: int) -> bool:
+        turns = sum(isinstance(message, HumanMessage) for message in messages)
+        return turns <= max_turns and count_tokens_approximately(messages) <= max_tokens
+
+    def _summarize(self, summary: BaseMessage | None, messages: list[BaseMessage]) -> SystemMessage:
+        """Fold trimmed messages into the running summary."""
+        lines = [f"Earlier: {summary.content}"] if summary is not None else []
+        for message in messages:
+            if isinstance(message, HumanMessage):
+                lines.append(f"User: {message.content}")
+            elif message.type == "ai" and isinstance(message.content, str) and message.content.strip():
+                lines.append(f"Assistant: {message.content.strip()}")
+            elif message.type == "tool":
+                lines.append(f"Tool {message.name}: {message.content}")
+
+        response = self.model.invoke([SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content="\n".join(lines))])
+        content = response.content if isinstance(response.content, str) else ""
+        # reasoning models may think out loud first
+        content = content.rsplit("</think>", 1)[-1].strip()
+        return SystemMessage(content=f"Summary of the earlier conversation: {content}", id=SUMMARY_ID)
+
+    def pre_model_hook(self, state: dict) -> dict:
+        """
+        Agent hook run before every model call that keeps the history within budget.
+
+        When the history is over budget, whole turns are trimmed from the start
+        down to half the budget, so trimming (and summarizing) only happens
+        every few turns instead of on every one. The current turn is never trimmed.
+        """
+        messages: list[AnyMessage] = state["messages"]
+        summary = messages[0] if messages and messages[0].id == SUMMARY_ID else None
+        history = messages[1:] if summary is not None else messages
+
+        if self._within_budget(messages, self.max_tokens, self.max_turns):
+            return {"llm_input_messages": messages}
+
+        # only cut at the start of a turn, so tool calls stay paired with their results
+        turn_starts = [i for i, message in enumerate(history) if isinstance(message, HumanMessage)]
+        if not turn_starts:
+            return {"llm_input_messages": messages}
+        cut = turn_starts[-1]
+        for start in turn_starts[1:]:
+            if self._within_budget(history[start:], self.max_tokens // 2, self.max_turns // 2):
+                cut = start
+                break
+
+        trimmed, kept = history[:cut], history[cut:]
+        if not trimmed:
+            return {"llm_input_messages": messages}
+
+        if self.summarize:
+            try:
+                summary = self._summarize(summary, trimmed)
+            except Exception as e:
+                logger.error(f"Failed to summarize conversation: {e}")
+        logger.debug(f"Trimmed {len(trimmed)} message(s) from the conversation")
+
+        kept = ([summary] if summary is not None else []) + kept
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + kept, "llm_input_messages": kept}
+
+    def close(self):
+        """Close the database."""
+        self.conn.close()
@@ -1,4 +1,5 @@
 import subprocess
+import threading
 import logging
 from pathlib import Path
 
@@ -17,4 +18,27 @@ def run_script(script_name: str):
         except subprocess.CalledProcessError as e:
             logger.error(f"Error running script {script_name}: {e}")
     else:
-        logger.error(f"Script {script_name} does not exist at path: {script_path}")
\ No newline at end of file
+        logger.error(f"Script {script_name} does not exist at path: {script_path}")
+
+def start_script(script_name: str):
+    """
+    Start a PowerShell script located in the scripts directory without waiting for it.
+    The result is logged once the script exits.
+    :param script_name: The name of the script to start.
+    :return: If the script was started.
+    """
+    script_path = Path(__file__).parent / "scripts" / script_name
+    if not script_path.exists():
+        logger.error(f"Script {script_name} does not exist at path: {script_path}")
+        return False
+
+    process = subprocess.Popen(["powershell", script_path], shell=True)
+
+    def wait():
+        if process.wait() == 0:
+            logger.info(f"Successfully ran script: {script_name}")
+        else:
+            logger.error(f"Error running script {script_name}: exit code {process.returncode}")
+
+    threading.Thread(target=wait, name=f"script-{script_name}", daemon=True).start()
+    return True
\ No newline at end of file
@@ -1,20 +1,38 @@
 import logging
+import threading
+import time
+import httpx
 from langchain_ollama import ChatOllama
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
 from langchain_core.tools import BaseTool
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.errors import GraphRecursionError
 
 from pathlib import Path
 import importlib
-from typing import Iterator, Generator, Any
+from typing import Iterator, Generator, Any, TYPE_CHECKING
 import re
 
 import config
+from .streaming import ThinkingFilter, SentenceChunker
+from .router import FastPathRouter, Route
+from .selection import ToolIndex
+from .tools import ToolRunner
+from .memory import ConversationMemory
+from .tracing import TraceCallbackHandler, llm_state
+from utils.metrics import registry
+from utils.tracing import SPAN_BUCKETS
+
+if TYPE_CHECKING:
+    from utils.tracing import Trace
+    from pipeline.endpointing import TurnGate
 
 logger = logging.getLogger(__name__)
 
+# idle connections to Ollama are kept open this long, so a turn doesn't have to reconnect
+HTTP_KEEPALIVE_EXPIRY = 600
+SKILLS_DIR = Path(__file__).parent / "skills"
+
 
 def strip_thinking(message: str) -> str:
     """
@@ -31,27 +49,57 @@ def strip_thinking(message: str) -> str:
 
 
 class CommandProcessor:
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, stream_tokens: bool = False, fast_path: bool = False,
+                 fast_path_cache: str | Path | None = None, tool_timeout: float = 10.0,
+                 memory_path: str | Path | None = None, memory_max_tokens: int = 2000, memory_max_turns: int = 20,
+                 memory_summarize: bool = True, session_timeout: float = 1800,
+                 keep_alive: int | str | None = None, tool_top_k: int = 0,
+                 tool_index_path: str | Path | None = None):
         """
         Initialize the CommandProcessor with a specified model name.
 
         :param model_name: The name of the Ollama model to use for command processing.
+        :param stream_tokens: Stream the response token by token, yielding it in sentence/clause chunks.
+        :param fast_path: Run simple commands directly, without the agent.
+        :param fast_path_cache: JSON file to persist the agent decisions the fast path learns from.
+        :param tool_timeout: Seconds to wait for a tool before the agent answers without its result.
+        :param memory_path: SQLite file to persist conversations to, kept in memory if not given.
+        :param memory_max_tokens: Approximate token budget for the conversation history sent to the model.
+        :param memory_max_turns: Max number of user turns kept in the conversation history.
+        :param memory_summarize: Summarize turns trimmed from the history instead of just dropping them.
+        :param session_timeout: Seconds of inactivity after which a session starts a new conversation.
+        :param keep_alive: How long Ollama keeps the model loaded after a request, like "30m" or -1 for
+            forever, Ollama's default if not given.
+        :param tool_top_k: Only give the agent the tools most relevant to each prompt, at most this many
+            (plus the ones picked for the session's previous prompt, for follow-ups). 0 gives it every tool.
+        :param tool_index_path: JSON file to cache the tool index in, so it's only rebuilt when skills change.
         """
-        self.model = ChatOllama(model=model_name)
+        # one model, and so one HTTP client, for the agent, the summaries and the warm-ups
+        self.model = ChatOllama(model=model_name, keep_alive=keep_alive,
+                                client_kwargs={"limits": httpx.Limits(keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)})
+        self.stream_tokens = stream_tokens
+        self.tool_top_k = tool_top_k
+        self.tool_index_path = tool_index_path
+        self.tool_runner = ToolRunner(tool_timeout)
+        self.memory = ConversationMemory(self.model, memory_path, max_tokens=memory_max_tokens,
+                                         max_turns=memory_max_turns, summarize=memory_summarize,
+                                         session_timeout=session_timeout)
         self._create_agent()
+        self.router = FastPathRouter(self.tools, fast_path_cache) if fast_path else None
+        self.warm_up_lock = threading.Lock()
 
     def _discover_tools(self) -> list[BaseTool]:
         """
         Discover and return the tools available for command processing.
         This method can be extended to include more tools as needed.
+        Skills may be sync or async, both are run by the tool runner.
 
         :return: A list of callable tools for command processing.
         """
 
         discovered_tools = {}
 
-        skills_dir = Path(__file__).parent / "skills"
-        for skill in skills_dir.glob("*.py"):
+        for skill in SKILLS_DIR.glob("*.py"):
             if skill == "__init__.py":
                 continue
 
@@ -60,7 +108,7 @@ class CommandProcessor:
 
             for name, val in module.__dict__.items():
                 if isinstance(val, BaseTool):
-                    discovered_tools[name] = val
+                    discovered_tools[name] = self.tool_runner.wrap(val)
 
         self.tools = discovered_tools
 
@@ -72,15 +120,51 @@ class CommandProcessor:
         This method can be extended to include more tools as needed.
         """
         tools = self._discover_tools()
-        checkpointer = InMemorySaver()
-        prompt = config.get_config()["system_prompt"]
+        self.prompt = config.get_config()["system_prompt"]
+        self.system_message = SystemMessage(content=self.prompt)
 
-        self.agent = create_react_agent(
-            model=self.model,
-            tools=tools,
-            checkpointer=checkpointer,
-            prompt=prompt
-        )
+        # agents by the names of the tools they're given, they share the conversations in the checkpointer
+        self.agents = {}
+        self.agent = self._agent(tuple(self.tools))
+        self.tool_index = ToolIndex(self.tools, SKILLS_DIR, self.tool_index_path) if self.tool_top_k else None
+        self.session_tools = {}  # session -> names of the tools picked for its previous prompt
+
+    def _agent(self, tool_names: tuple[str, ...]):
+        """
+        Get the agent that is given a set of tools, creating it on first use.
+
+        :param tool_names: Names of the tools, in a stable order.
+        :return: The agent.
+        """
+        agent = self.agents.get(tool_names)
+        if agent is None:
+            agent = self.agents[tool_names] = create_react_agent(
+                model=self.model,
+                tools=[self.tools[name] for name in tool_names],
+                checkpointer=self.memory.checkpointer,
+                prompt=self.prompt,
+                pre_model_hook=self.memory.pre_model_hook
+            )
+        return agent
+
+    def _select_tools(self, prompt: str, session: str) -> tuple[str, ...]:
+        """
+        Pick the tools to give the agent for a prompt.
+
+        :param prompt: The transcription.
+        :param session: The session the prompt continues, whose previous tools are kept for follow-ups.
+            Its first prompt is given every tool, which is what its warm-up binds.
+        :return: Names of the tools, in a stable order.
+        """
+        if self.tool_index is None:
+            return tuple(self.tools)
+
+        relevant = set(self.tool_index.select(prompt, self.tool_top_k))
+        previous = self.session_tools.get(session)
+        selected = set(self.tools) if previous is None else relevant | previous
+        self.session_tools[session] = relevant
+        logger.debug(f"Tools for the prompt: {sorted(selected)}")
+        return tuple(name for name in self.tools if name in selected)
 
     def _agent_stream(self, it: Iterator[dict[str, Any]]) -> Generator[str, None, None]:
         """
@@ -92,7 +176,8 @@ class CommandProcessor:
         try:
             for update in it:
                 for key in update:
-                    if "messages" in update[key]:
+                    # the memory hook re-emits the messages it keeps, only the model's are new
+                    if key == "agent" and "messages" in update[key]:
                         for message in update[key]["messages"]:
                             if isinstance(message, AIMessage):
                                 logger.debug(
@@ -102,21 +187,201 @@ class CommandProcessor:
             logger.error(f"Graph recursion error: {e}")
             yield "An error occurred while processing the command. Please try again."
 
-    def process_prompt(self, prompt: str) -> Generator[str, None, None]:
+    def _token_stream(self, it: Iterator[tuple[Any, dict]]) -> Generator[str, None, None]:
+        """
+        Process the token stream from the agent and yield the LLM's response
+        in sentence or clause sized chunks as soon as they are complete.
+
+        :param it: The stream of (message chunk, metadata) tuples from the agent.
+        :return: A generator yielding chunks of the LLM's response.
+        """
+        thinking = ThinkingFilter()
+        chunker = SentenceChunker()
+        message_id = None
+        message_text = ""
+
+        def flush():
+            # end of an AI message, so pass on whatever is left of it
+            chunks = chunker.feed(thinking.flush())
+            last = chunker.flush()
+            if last:
+                chunks.append(last)
+            return chunks
+
+        try:
+            for message, metadata in it:
+                if not isinstance(message, AIMessage) or message.id != message_id:
+                    if message_text:
+                        logger.debug(f"AIMessage: {message_text.strip()}")
+                    message_text = ""
+                    yield from flush()
+                    message_id = message.id
+
+                if not isinstance(message, AIMessage) or not isinstance(message.content, str):
+                    continue
+
+                message_text += message.content
+                yield from chunker.feed(thinking.feed(message.content))
+
+            if message_text:
+                logger.debug(f"AIMessage: {message_text.strip()}")
+            yield from flush()
+        except GraphRecursionError as e:
+            logger.error(f"Graph recursion error: {e}")
+            yield "An error occurred while processing the command. Please try again."
+
+    def _run_route(self, prompt: str, route: Route, callbacks: list) -> bool:
+        """
+        Run a tool directly for the fast path.
+
+        :param prompt: The prompt the route was found for.
+        :param route: The route to run.
+        :param callbacks: Callback handlers for the tool run.
+        :return: If the tool ran successfully.
+        """
+        logger.info(f"Fast path: {route.tool.name}({route.args})")
+        try:
+            route.tool.invoke(route.args, config={"callbacks": callbacks})
+            return True
+        except Exception as e:
+            logger.error(f"Fast path tool {route.tool.name} failed: {e}")
+            self.router.forget(prompt)
+            return False
+
+    def _learn_decision(self, prompt: str, config: dict):
+        """
+        Record the agent's decision for the fast path, if it handled the prompt
+        with exactly one successful tool call.
+
+        :param prompt: The processed prompt.
+        :param config: The agent config the prompt was processed with.
+        """
+        messages = self.agent.get_state(config).values.get("messages", [])
+
+        # messages since the prompt
+        turn = []
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            turn.append(message)
+        turn.reverse()
+
+        tool_calls = [call for message in turn if isinstance(message, AIMessage)
+                      for call in message.tool_calls]
+        if len(tool_calls) != 1:
+            return
+        if any(isinstance(message, ToolMessage) and message.status == "error" for message in turn):
+            return
+        if not isinstance(turn[-1], AIMessage) or turn[-1].tool_calls:
+            return
+
+        call = tool_calls[0]
+        self.router.record(prompt, call["name"], call["args"], strip_thinking(turn[-1].content))
+
+    def warm_up(self, session: str = "default", reason: str = "startup") -> float | None:
+        """
+        Send the prefix of the session's next request to Ollama, so the model is
+        loaded and the system prompt, tool schemas and conversation so far are
+        in its prompt cache before the prompt arrives. Does nothing if a
+        warm-up is already running.
+
+        :param session: The session whose conversation to warm up.
+        :param reason: What the warm-up is for, for the logs.
+        :return: Seconds the warm-up took, or None if it was skipped or failed.
+        """
+        if not self.warm_up_lock.acquire(blocking=False):
+            return None
+        try:
+            thread_id = self.memory.current_thread_id(session)
+            history = []
+            if thread_id is not None:
+                history = self.agent.get_state({"configurable": {"thread_id": thread_id}}).values.get("messages", [])
+
+            # same prompt and tool schemas as the session's next request (if it picks the same tools),
+            # but only generates one token
+            tool_names = tuple(self.tools)
+            if self.tool_index is not None and session in self.session_tools:
+                tool_names = tuple(name for name in self.tools if name in self.session_tools[session])
+            warm_up_model = self.model.model_copy(update={"num_predict": 1})
+            if tool_names:
+                warm_up_model = warm_up_model.bind_tools([self.tools[name] for name in tool_names])
+
+            start = time.perf_counter()
+            response = warm_up_model.invoke([self.system_message] + history)
+            elapsed = time.perf_counter() - start
+
+            state = llm_state(response.response_metadata)
+            registry.histogram("crumbot_llm_warm_up_seconds", "Time of warm-up requests, by whether the model "
+                               "had to be loaded.", SPAN_BUCKETS, state=state).observe(elapsed)
+            logger.info(f"Warmed up LLM ({reason}, {state}) in {elapsed:.2f}s, "
+                        f"{response.response_metadata.get('prompt_eval_count', 0)} prompt tokens evaluated")
+            return elapsed
+        except Exception as e:
+            logger.warning(f"Failed to warm up LLM: {e}")
+            return None
+        finally:
+            self.warm_up_lock.release()
+
+    def process_prompt(self, prompt: str, session: str = "default", trace: "Trace | None" = None,
+                       gate: "TurnGate | None" = None) -> Generator[str, None, None]:
         """
         Process the given prompt string to execute commands.
 
         :param prompt: The command prompt string to process.
+        :param session: The session whose conversation to continue, like a client id.
+        :param trace: Trace of the utterance, to record the agent's model and tool calls in.
+        :param gate: For a speculative prompt, the gate that decides if it's final. Tool calls wait for
+            it, and the turn is rolled back out of the conversation if it's aborted.
         :return: A string indicating the result of the command execution.
         """
 
         logger.info(f"Processing prompt.")
 
-        config = {"configurable": {"thread_id": "default"}}
-        response = self.agent.stream(
-            {"messages": [HumanMessage(content=prompt)]},
-            config=config,
-            stream_mode="updates"
-        )
+        agent_span = trace.start_span("agent") if trace is not None else None
+        callbacks = [TraceCallbackHandler(trace, agent_span)] if trace is not None else []
+        try:
+            route = self.router.route(prompt) if self.router is not None else None
+            if route is not None:
+                if gate is not None and not gate.wait():
+                    return
+                if self._run_route(prompt, route, callbacks):
+                    if agent_span is not None:
+                        agent_span.attributes["fast_path"] = True
+                    yield route.confirmation
+                    return
+
+            tool_names = self._select_tools(prompt, session)
+            if agent_span is not None:
+                agent_span.attributes["tools"] = len(tool_names)
+            agent = self._agent(tool_names)
+
+            thread_id = self.memory.thread_id(session)
+            checkpoint_id = self.memory.latest_checkpoint(thread_id) if gate is not None else None
+            config = {"configurable": {"thread_id": thread_id, "gate": gate}, "callbacks": callbacks}
+            committed = False
+            try:
+                response = agent.stream(
+                    {"messages": [HumanMessage(content=prompt)]},
+                    config=config,
+                    stream_mode="messages" if self.stream_tokens else "updates"
+                )
+
+                if self.stream_tokens:
+                    yield from self._token_stream(response)
+                else:
+                    yield from self._agent_stream(response)
+
+                committed = gate is None or gate.wait()
+            finally:
+                if gate is not None and not gate.committed:
+                    # a speculative prompt that was dropped
+                    logger.info("Rolling back speculative turn.")
+                    self.memory.rollback(thread_id, checkpoint_id)
 
-        yield from self._agent_stream(response)
+            if committed:
+                if self.router is not None:
+                    self._learn_decision(prompt, config)
+                self.memory.compact(thread_id)
+        finally:
+            if agent_span is not None:
+                agent_span.end()
@@ -0,0 +1,163 @@
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from langchain_core.tools import BaseTool
+
+logger = logging.getLogger(__name__)
+
+# Words that carry no meaning for routing
+FILLER_WORDS = {"crumbot", "hey", "ok", "okay", "please", "can", "could", "would", "you", "the", "my", "a", "an"}
+# Verbs that are interchangeable in tool names
+ACTION_WORDS = {"launch", "open", "start", "run", "turn", "switch", "show", "get", "set"}
+QUESTION_WORDS = {"what", "who", "why", "how", "when", "where", "which", "is", "are", "does", "do", "did"}
+# Words that change what a command means, or join several commands, so the agent has to handle it
+NEGATION_WORDS = {"not", "no", "never", "dont", "stop", "cancel"}
+CONJUNCTION_WORDS = {"and", "then", "also", "after", "before", "or"}
+CONTRACTIONS = [(r"\bwon't\b", "will not"), (r"\bcan't\b", "can not"), (r"n't\b", " not"), (r"'s\b", " is"),
+                (r"'re\b", " are"), (r"'ll\b", " will"), (r"'d\b", " would"), (r"'ve\b", " have"), (r"'m\b", " am")]
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize a transcription for matching.
+
+    :param text: The transcription to normalize.
+    :return: Lowercase words without punctuation, contractions or filler words.
+    """
+    text = text.lower().replace("\u2019", "'")
+    for contraction, expansion in CONTRACTIONS:
+        text = re.sub(contraction, expansion, text)
+    words = re.sub(r"[^a-z0-9 ]+", " ", text).split()
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+@dataclass
+class Route:
+    tool: BaseTool
+    args: dict = field(default_factory=dict)
+    confirmation: str = ""
+
+
+class FastPathRouter:
+    """
+    Route simple commands straight to a tool, skipping the agent.
+
+    A transcription is routed if it was handled by the same single tool call in
+    earlier agent turns (persisted to disk), or if it is a short command that
+    names exactly one argument-free tool.
+    """
+
+    def __init__(self, tools: dict[str, BaseTool], cache_path: str | Path | None = None,
+                 max_words: int = 6, min_agreements: int = 2):
+        """
+        Initialize the router.
+
+        :param tools: The available tools by name.
+        :param cache_path: JSON file that stores earlier agent decisions, or None to not persist them.
+        :param max_words: Longest normalized transcription that may be matched by keywords.
+        :param min_agreements: How many times the agent must have made the same decision before it is reused.
+        """
+        self.tools = tools
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.max_words = max_words
+        self.min_agreements = min_agreements
+        self.keywords = {name: self._tool_keywords(name) for name in tools}
+        self.decisions = self._load_decisions()
+
+    @staticmethod
+    def _tool_keywords(name: str) -> set[str]:
+        """Get the words that identify a tool, i.e. its name without generic verbs."""
+        return set(name.lower().split("_")) - ACTION_WORDS
+
+    def _load_decisions(self) -> dict[str, dict]:
+        """Load earlier agent decisions from disk."""
+
+        if self.cache_path is None or not self.cache_path.exists():
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Failed to load fast path cache {self.cache_path}: {e}")
+            return {}
+
+    def _save_decisions(self):
+        """Write the agent decisions to disk."""
+
+        if self.cache_path is None:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.cache_path, "w", encoding="utf8") as f:
+                json.dump(self.decisions, f, indent=2)
+        except OSError as e:
+            logger.warning(f"Failed to save fast path cache {self.cache_path}: {e}")
+
+    def _match_keywords(self, text: str) -> Route | None:
+        """Match a short command against the name of exactly one tool."""
+
+        words = text.split()
+        if not words or len(words) > self.max_words or words[0] in QUESTION_WORDS:
+            return None
+        if not NEGATION_WORDS.isdisjoint(words) or not CONJUNCTION_WORDS.isdisjoint(words):
+            return None  # "don't open discord", "turn on the display and open discord"
+
+        word_set = set(words)
+        candidates = [name for name, keywords in self.keywords.items()
+                      if keywords and keywords <= word_set and not self.tools[name].args]
+        if len(candidates) != 1:
+            return None  # no tool, or ambiguous
+
+        name = candidates[0]
+        return Route(self.tools[name], confirmation=f"Done: {name.replace('_', ' ')}.")
+
+    def route(self, prompt: str) -> Route | None:
+        """
+        Find a tool to run directly for a transcription.
+
+        :param prompt: The transcription.
+        :return: The route to take, or None to fall through to the agent.
+        """
+        if "?" in prompt:
+            return None
+
+        text = normalize(prompt)
+
+        decision = self.decisions.get(text)
+        if decision and decision["count"] >= self.min_agreements and decision["tool"] in self.tools:
+            return Route(self.tools[decision["tool"]], decision["args"], decision["confirmation"])
+
+        return self._match_keywords(text)
+
+    def record(self, prompt: str, tool_name: str, args: dict, confirmation: str):
+        """
+        Record a decision the agent made for a transcription.
+
+        :param prompt: The transcription.
+        :param tool_name: The single tool the agent called.
+        :param args: The arguments of the tool call.
+        :param confirmation: The agent's spoken response.
+        """
+        text = normalize(prompt)
+        if not text:
+            return
+
+        decision = self.decisions.get(text)
+        if decision and decision["tool"] == tool_name and decision["args"] == args:
+            decision["count"] += 1
+            decision["confirmation"] = confirmation or decision["confirmation"]
+        else:
+            self.decisions[text] = {"tool": tool_name, "args": args, "confirmation": confirmation, "count": 1}
+
+        self._save_decisions()
+
+    def forget(self, prompt: str):
+        """
+        Forget the decision for a transcription, e.g. because replaying it failed.
+
+        :param prompt: The transcription.
+        """
+        if self.decisions.pop(normalize(prompt), None) is not None:
+            self._save_decisions()
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from langchain_core.tools import BaseTool
+
+from .router import normalize
+
+logger = logging.getLogger(__name__)
+
+# bump when the way documents are built or tokenized changes, so old indexes are rebuilt
+INDEX_VERSION = 2
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split text into crudely stemmed terms, so "displays" and "display" match.
+
+    :param text: A transcription or a tool's description.
+    :return: The terms, without filler words.
+    """
+    terms = []
+    for word in normalize(text.replace("_", " ")).replace("'", "").split():
+        if len(word) > 5 and word.endswith("ing"):
+            word = word[:-3]
+        elif len(word) > 4 and word.endswith("ed"):
+            word = word[:-2]
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def tool_document(tool: BaseTool) -> list[str]:
+    """Get the terms a tool is found by: its name (counted twice), description and arguments."""
+
+    text = f"{tool.name} {tool.name} {tool.description}"
+    for name, schema in tool.args.items():
+        text += f" {name} {schema.get('description', '')}"
+    return tokenize(text)
+
+
+def skills_fingerprint(skills_dir: Path) -> str:
+    """Hash the skill files, so the index is rebuilt when any of them changes."""
+
+    digest = hashlib.sha256(str(INDEX_VERSION).encode())
+    for path in sorted(skills_dir.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class ToolIndex:
+    """
+    BM25 index over the tools' names, docstrings and arguments, to bind only
+    the tools relevant to a prompt to the agent, instead of every tool's
+    schema in every request.
+
+    The index is cached on disk, and only rebuilt when the skill files change.
+    """
+
+    def __init__(self, tools: dict[str, BaseTool], skills_dir: str | Path, cache_path: str | Path | None = None,
+                 k1: float = 1.5, b: float = 0.75):
+        """
+        Load the index from the cache, or build it.
+
+        :param tools: The available tools by name.
+        :param skills_dir: Directory of the skill files the tools come from.
+        :param cache_path: JSON file to cache the index in, or None to always build it.
+        :param k1: BM25 term frequency saturation.
+        :param b: BM25 document length normalization.
+        """
+        self.tools = tools
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.k1 = k1
+        self.b = b
+
+        fingerprint = skills_fingerprint(Path(skills_dir))
+        index = self._load_index()
+        if index is None or index["fingerprint"] != fingerprint or set(index["documents"]) != set(tools):
+            logger.info(f"Building tool index over {len(tools)} tools")
+            index = self._build_index(fingerprint)
+            self._save_index(index)
+
+        self.documents = {name: Counter(terms) for name, terms in index["documents"].items()}
+        self.lengths = {name: sum(terms.values()) for name, terms in self.documents.items()}
+        self.average_length = sum(self.lengths.values()) / len(self.lengths) if self.lengths else 0.0
+        self.idf = index["idf"]
+
+    def _build_index(self, fingerprint: str) -> dict:
+        """Tokenize every tool, and compute the inverse document frequencies of the terms."""
+
+        documents = {name: tool_document(tool) for name, tool in self.tools.items()}
+        frequencies = Counter(term for terms in documents.values() for term in set(terms))
+        count = len(documents)
+        idf = {term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+               for term, frequency in frequencies.items()}
+        return {"fingerprint": fingerprint, "documents": documents, "idf": idf}
+
+    def _load_index(self) -> dict | None:
+        """Load the cached index from disk."""
+
+        if self.cache_path is None or not self.cache_path.exists():
+            return None
+        try:
+            with open(self.cache_path, "r", encoding="utf8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Failed to load tool index {self.cache_path}: {e}")
+            return None
+
+    def _save_index(self, index: dict):
+        """Write the index to disk."""
+
+        if self.cache_path is None:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.cache_path, "w", encoding="utf8") as f:
+                json.dump(index, f)
+        except OSError as e:
+            logger.warning(f"Failed to save tool index {self.cache_path}: {e}")
+
+    def scores(self, prompt: str) -> dict[str, float]:
+        """
+        Score every tool's relevance to a prompt.
+
+        :param prompt: The transcription.
+        :return: The BM25 score of each tool by name, 0 if none of the prompt's terms describe it.
+        """
+        terms = tokenize(prompt)
+        scores = {}
+        for name, document in self.documents.items():
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[name] / (self.average_length or 1))
+            scores[name] = sum(self.idf[term] * document[term] * (self.k1 + 1) / (document[term] + norm)
+                               for term in terms if term in document)
+        return scores
+
+    def select(self, prompt: str, k: int) -> list[str]:
+        """
+        Find the tools most relevant to a prompt.
+
+        :param prompt: The transcription.
+        :param k: Max number of tools.
+        :return: Names of up to k tools that match the prompt, best first.
+        """
+        scores = self.scores(prompt)
+        ranked = sorted((name for name, score in scores.items() if score > 0), key=scores.get, reverse=True)
+        return ranked[:k]
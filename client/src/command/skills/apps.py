@@ -1,18 +1,16 @@
 from langchain_core.tools import tool
-from command.powershell import run_script
+from command.powershell import start_script
 
 @tool
 def launch_minecraft():
     """
     Launches Minecraft. Only call this tool if the user explicitly mentions Minecraft.
     """
-    run_script("minecraft.ps1")
-    return True
+    return start_script("minecraft.ps1")
 
 @tool
 def launch_discord():
     """
     Launches Discord.
     """
-    run_script("discord.ps1")
-    return True
\ No newline at end of file
+    return start_script("discord.ps1")
\ No newline at end of file
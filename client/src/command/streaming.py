@@ -0,0 +1,140 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Tags whose contents should never be spoken
+HIDDEN_TAGS = ("think", "empty")
+
+# Punctuation followed by whitespace, optionally with closing quotes/brackets in between
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s")
+CLAUSE_END = re.compile(r"[,;:]\s")
+
+
+class ThinkingFilter:
+    """
+    Incrementally strip hidden tags (like <think>...</think>) from streamed text.
+    Text that might be the start of a tag is held back until it can be decided.
+    """
+
+    def __init__(self):
+        self.pending = ""
+        self.inside = None  # the hidden tag we are currently inside of
+        self.hidden = ""  # text inside the hidden tag so far, passed on if the tag is never closed
+
+    def feed(self, text: str) -> str:
+        """
+        Feed a piece of streamed text.
+
+        :param text: The next piece of text.
+        :return: The text that is safe to pass on.
+        """
+        self.pending += text
+        output = []
+
+        while self.pending:
+            if self.inside is not None:
+                closing = f"</{self.inside}>"
+                index = self.pending.find(closing)
+                if index == -1:
+                    # hold back hidden text, apart from anything that could be the start of the closing tag
+                    self.hidden += self.pending[:-len(closing) + 1]
+                    self.pending = self.pending[-len(closing) + 1:]
+                    break
+                self.pending = self.pending[index + len(closing):]
+                self.inside = None
+                self.hidden = ""
+                continue
+
+            index = self.pending.find("<")
+            if index == -1:
+                output.append(self.pending)
+                self.pending = ""
+                break
+
+            output.append(self.pending[:index])
+            self.pending = self.pending[index:]
+
+            for tag in HIDDEN_TAGS:
+                opening = f"<{tag}>"
+                if self.pending.startswith(opening):
+                    self.pending = self.pending[len(opening):]
+                    self.inside = tag
+                    break
+            else:
+                if any(f"<{tag}>".startswith(self.pending) for tag in HIDDEN_TAGS):
+                    break  # might still become a hidden tag, wait for more text
+                output.append("<")
+                self.pending = self.pending[1:]
+
+        return "".join(output)
+
+    def flush(self) -> str:
+        """
+        Finish the stream.
+
+        :return: Any text that was held back. Hidden text is dropped, unless its tag was never closed,
+            in which case the model most likely answered inside of it.
+        """
+        text = self.pending
+        if self.inside is not None:
+            text = self.hidden + self.pending
+            logger.warning(f"Response ended inside of an unclosed <{self.inside}> tag, passing on its text")
+        self.pending = ""
+        self.inside = None
+        self.hidden = ""
+        return text
+
+
+class SentenceChunker:
+    """
+    Cut streamed text into speakable chunks at sentence boundaries, or at clause
+    boundaries once a chunk is long enough to be worth synthesizing on its own.
+    """
+
+    def __init__(self, min_clause_length: int = 24):
+        """
+        :param min_clause_length: Minimum length of a chunk cut at a clause boundary.
+        """
+        self.min_clause_length = min_clause_length
+        self.buffer = ""
+
+    def _find_cut(self) -> int | None:
+        """Find the end of the first complete chunk in the buffer."""
+
+        cuts = []
+        sentence = SENTENCE_END.search(self.buffer)
+        if sentence:
+            cuts.append(sentence.end())
+        clause = CLAUSE_END.search(self.buffer, self.min_clause_length - 1)
+        if clause:
+            cuts.append(clause.end())
+        return min(cuts) if cuts else None
+
+    def feed(self, text: str) -> list[str]:
+        """
+        Feed a piece of streamed text.
+
+        :param text: The next piece of text.
+        :return: A list of completed chunks.
+        """
+        self.buffer += text
+        chunks = []
+
+        while (cut := self._find_cut()) is not None:
+            chunk = self.buffer[:cut].strip()
+            self.buffer = self.buffer[cut:]
+            if chunk:
+                chunks.append(chunk)
+
+        return chunks
+
+    def flush(self) -> str:
+        """
+        Finish the stream.
+
+        :return: The remaining text as the last chunk.
+        """
+        chunk = self.buffer.strip()
+        self.buffer = ""
+        return chunk
@@ -0,0 +1,73 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool
+
+logger = logging.getLogger(__name__)
+
+
+class ToolRunner:
+    """
+    Run tools on a background event loop with per-tool timeouts.
+
+    Both sync and async (coroutine) tools are supported, and calls from the
+    agent's parallel tool node run concurrently on the loop. A tool that takes
+    longer than its timeout keeps running in the background, and the agent is
+    told so instead of waiting for it. A tool can override the default timeout
+    with `tool.metadata = {"timeout": seconds}`.
+
+    A speculative turn passes a gate as `configurable.gate` in the agent's
+    config, and its tool calls wait for the turn to be committed first.
+    """
+
+    def __init__(self, default_timeout: float):
+        """
+        :param default_timeout: Seconds to wait for a tool before answering without its result.
+        """
+        self.default_timeout = default_timeout
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="tools", daemon=True)
+        self.thread.start()
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """
+        Wrap a tool so that it runs on the runner.
+
+        :param tool: The tool to wrap.
+        :return: A sync tool with the same name, description and arguments.
+        """
+        timeout = (tool.metadata or {}).get("timeout", self.default_timeout)
+
+        def run(config: RunnableConfig, **kwargs):
+            gate = config.get("configurable", {}).get("gate")
+            if gate is not None and not gate.wait():
+                return "Cancelled, the user kept speaking."
+
+            future = asyncio.run_coroutine_threadsafe(tool.ainvoke(kwargs), self.loop)
+            try:
+                return future.result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                logger.warning(f"Tool {tool.name} is taking longer than {timeout}s, leaving it running.")
+                future.add_done_callback(lambda f: self._log_late_result(tool.name, f))
+                return f"Started, {tool.name} is still running in the background."
+
+        return StructuredTool.from_function(
+            func=run,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            metadata=tool.metadata
+        )
+
+    @staticmethod
+    def _log_late_result(name: str, future: concurrent.futures.Future):
+        """Log the outcome of a tool that finished after its timeout."""
+
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error(f"Tool {name} failed in the background: {future.exception()}")
+        else:
+            logger.info(f"Tool {name} finished in the background.")
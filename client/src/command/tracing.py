@@ -0,0 +1,90 @@
+import time
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.metrics import registry
+from utils.tracing import Trace, Span, SPAN_BUCKETS
+
+# a model that took longer than this to load (in seconds) wasn't resident in memory
+COLD_LOAD_TIME = 0.25
+
+
+def llm_state(metadata: dict) -> str:
+    """
+    Tell from an Ollama response's metadata if the model had to be loaded for it.
+
+    :param metadata: The response metadata of the model's message.
+    :return: "cold" if the model was loaded for the request, "warm" if it was already loaded.
+    """
+    return "cold" if metadata.get("load_duration", 0) / 1e9 > COLD_LOAD_TIME else "warm"
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """Records the agent's model calls and tool calls as spans of an utterance's trace."""
+
+    def __init__(self, trace: Trace, parent: Span | None = None):
+        """
+        :param trace: The trace to add the spans to.
+        :param parent: The span the agent runs in.
+        """
+        self.trace = trace
+        self.parent = parent
+        self.spans = {}  # run id -> span
+
+    def _start(self, run_id: UUID, parent_run_id: UUID | None, name: str, **attributes):
+        # runs inside a traced run, like a wrapped tool, are its steps
+        parent = self.spans.get(parent_run_id, self.parent)
+        self.spans[run_id] = self.trace.start_span(name, parent, **attributes)
+
+    def _end(self, run_id: UUID, **attributes):
+        span = self.spans.pop(run_id, None)
+        if span is not None:
+            span.end(**attributes)
+
+    def on_chat_model_start(self, serialized: dict[str, Any], messages: list, *, run_id: UUID,
+                            parent_run_id: UUID | None = None, metadata: dict[str, Any] | None = None,
+                            **kwargs: Any):
+        node = (metadata or {}).get("langgraph_node")
+        self._start(run_id, parent_run_id, "llm", node=node, messages=sum(len(batch) for batch in messages))
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        span = self.spans.get(run_id)
+        if span is not None and "first_token" not in span.attributes:
+            span.attributes["first_token"] = round(time.perf_counter() - span.start, 6)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        attributes = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage_metadata = getattr(message, "usage_metadata", None)
+                if usage_metadata:
+                    attributes.update(input_tokens=usage_metadata["input_tokens"],
+                                      output_tokens=usage_metadata["output_tokens"])
+                metadata = getattr(message, "response_metadata", None)
+                if metadata and "load_duration" in metadata:
+                    attributes.update(state=llm_state(metadata),
+                                      load_time=round(metadata["load_duration"] / 1e9, 6))
+
+        span = self.spans.get(run_id)
+        if span is not None and "state" in attributes:
+            first_token = span.attributes.get("first_token", time.perf_counter() - span.start)
+            registry.histogram("crumbot_llm_first_token_seconds", "Time to the first token of the model's "
+                               "responses, by whether the model had to be loaded.", SPAN_BUCKETS,
+                               state=attributes["state"]).observe(first_token)
+        self._end(run_id, **attributes)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error=str(error))
+
+    def on_tool_start(self, serialized: dict[str, Any], input_str: str, *, run_id: UUID,
+                      parent_run_id: UUID | None = None, **kwargs: Any):
+        self._start(run_id, parent_run_id, "tool", tool=serialized.get("name"))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error=str(error))
@@ -1,3 +1,3 @@
-from .config import get_config
+from .config import CONFIG_PATH, get_config, update_config
 
-__all__ = ["get_config"]
\ No newline at end of file
+__all__ = ["CONFIG_PATH", "get_config", "update_config"]
\ No newline at end of file
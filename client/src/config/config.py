@@ -1,7 +1,34 @@
+from functools import cache
 from pathlib import Path
+import json
+import re
 import tomllib
 
+CONFIG_PATH = Path(__file__).parent.parent.parent / "config.toml"
+
+@cache
 def get_config():
-    config_path = Path(__file__).parent.parent.parent / "config.toml"
-    with open(config_path, "rb") as f:
-        return tomllib.load(f)["crumbot"]
\ No newline at end of file
+    """
+    Get the crumbot config. The file is only read and parsed on the first call,
+    so the returned dictionary is shared and must not be modified.
+    """
+    with open(CONFIG_PATH, "rb") as f:
+        return tomllib.load(f)["crumbot"]
+
+
+def update_config(values: dict[str, str | int | float | bool]):
+    """
+    Set config values in the config file, keeping its comments and layout.
+    Only keys that are already in the file can be set, and the config returned
+    by get_config() isn't updated.
+
+    :param values: The keys to set and their new values.
+    """
+    text = CONFIG_PATH.read_text(encoding="utf8")
+    for key, value in values.items():
+        # JSON strings, numbers and booleans are valid TOML too
+        line = f"{key} = {json.dumps(value)}"
+        text, count = re.subn(rf"^{re.escape(key)}\s*=.*$", lambda _: line, text, count=1, flags=re.MULTILINE)
+        if not count:
+            raise KeyError(f"{key} is not in {CONFIG_PATH}")
+    CONFIG_PATH.write_text(text, encoding="utf8")
\ No newline at end of file
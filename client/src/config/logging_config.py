@@ -1,63 +1,148 @@
-import logging.config
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
 import os
+import queue
+import sys
+import threading
+import time
+
+from .config import get_config
+
+LOG_DIR = "logs"
+QUEUE_SIZE = 10000  # records waiting for the writer thread, more are dropped
+
+STANDARD_FORMAT = "%(asctime)s:%(name)s [%(levelname)s] %(message)s"
+DETAILED_FORMAT = "%(asctime)s:%(name)s [%(levelname)s] %(filename)s:%(lineno)d:%(funcName)s - %(message)s"
+
+_listener = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread, dropping them instead of waiting when its queue is full."""
+
+    def __init__(self, record_queue: queue.Queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `rate` records per second from each line of code, with
+    bursts of up to `burst`, for records below `level`. Per-frame debug logging
+    then can't flood the writer. The next record let through from a line says
+    how many of its records were suppressed.
+    """
+
+    def __init__(self, rate: float, burst: int = 10, level: int = logging.INFO):
+        """
+        :param rate: Records per second let through from each line.
+        :param burst: Records let through at once after a quiet period.
+        :param level: Records at this level or above are never limited.
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.level = level
+        self.buckets = {}  # (path, line) -> [tokens, time of the last record, records suppressed]
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.level:
+            return True
+
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.setdefault((record.pathname, record.lineno), [self.burst, now, 0])
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+def _writer_handlers() -> list[logging.Handler]:
+    """The handlers that do the actual I/O, on the writer thread."""
+    crumbot_config = get_config()
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(logging.INFO)  # Default level for console output
+    console.setFormatter(logging.Formatter(STANDARD_FORMAT))
+    if multiprocessing.parent_process() is not None:
+        # a worker process, like the wakeword one, leaves the log files to the main process,
+        # since rotating them from two processes breaks on Windows
+        return [console]
+
+    max_bytes = crumbot_config["log_max_size"] * 1024 * 1024
+    backups = crumbot_config["log_backups"]
+    file = logging.handlers.RotatingFileHandler(
+        os.path.join(LOG_DIR, "app.log"), maxBytes=max_bytes, backupCount=backups, encoding="utf8")
+    file.setLevel(logging.DEBUG)  # Default level for file output (more detailed)
+    file.setFormatter(logging.Formatter(DETAILED_FORMAT))
+    error_file = logging.handlers.RotatingFileHandler(
+        os.path.join(LOG_DIR, "errors.log"), maxBytes=max_bytes, backupCount=backups, encoding="utf8")
+    error_file.setLevel(logging.ERROR)  # Only log ERROR and CRITICAL to this file
+    error_file.setFormatter(logging.Formatter(DETAILED_FORMAT))
+    return [console, file, error_file]
+
+
+def _stop_listener():
+    """Write out the records still queued, at exit."""
+    while True:
+        try:
+            _listener.stop()
+            return
+        except queue.Full:
+            time.sleep(0.01)  # no room for the stop sentinel yet
+
 
 def configure_logging():
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
-
-    LOGGING_CONFIG = {
-        "version": 1,
-        "disable_existing_loggers": False,
-
-        "formatters": {
-            "standard": {
-                "format": "%(asctime)s:%(name)s [%(levelname)s] %(message)s"
-            },
-            "detailed": {
-                "format": "%(asctime)s:%(name)s [%(levelname)s] %(filename)s:%(lineno)d:%(funcName)s - %(message)s"
-            }
-        },
-
-        "handlers": {
-            "console": {
-                "class": "logging.StreamHandler",
-                "level": "INFO", # Default level for console output
-                "formatter": "standard",
-                "stream": "ext://sys.stdout"
-            },
-            "file": {
-                "class": "logging.FileHandler",
-                "level": "DEBUG", # Default level for file output (more detailed)
-                "formatter": "detailed",
-                "filename": os.path.join(log_dir, "app.log"),
-                "encoding": "utf8"
-            },
-            "error_file": {
-                "class": "logging.FileHandler",
-                "level": "ERROR", # Only log ERROR and CRITICAL to this file
-                "formatter": "detailed",
-                "filename": os.path.join(log_dir, "errors.log"),
-                "encoding": "utf8"
-            }
-        },
-
-        "loggers": {
-            # "voice_assistant": {
-            #     "handlers": ["console", "file", "error_file"],
-            #     "level": "DEBUG",
-            #     "propagate": False # Prevent propagation to root logger
-            # }
-            "httpcore": {
-                "level": "INFO"
-            },
-            "urllib3": {
-                "level": "INFO"
-            }
-        },
-
-        "root": {
-            "handlers": ["console", "file", "error_file"],
-            "level": "DEBUG"
-        }
-    }
-    logging.config.dictConfig(LOGGING_CONFIG)
\ No newline at end of file
+    """
+    Log to the console, logs/app.log and logs/errors.log without blocking the
+    logging threads: records are queued, and a background thread writes them.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    from utils.metrics import registry
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+    record_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(record_queue)
+    rate_limit = RateLimitFilter(get_config()["log_debug_rate"])
+    queue_handler.addFilter(rate_limit)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(logging.DEBUG)
+    logging.getLogger("httpcore").setLevel(logging.INFO)
+    logging.getLogger("urllib3").setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(record_queue, *_writer_handlers(), respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+
+    description = "Log records dropped because the writer fell behind, or by the debug rate limit."
+    registry.counter("crumbot_log_records_dropped_total", description, fn=lambda: queue_handler.dropped,
+                     reason="queue_full")
+    registry.counter("crumbot_log_records_dropped_total", description, fn=lambda: rate_limit.suppressed,
+                     reason="rate_limited")
@@ -1,9 +1,7 @@
+from pipeline import startup  # start the startup clock first
 from config import logging_config
 logging_config.configure_logging()
 
-import openwakeword
-openwakeword.utils.download_models()
-
 import asyncio
 from pipeline.pipeline import run_mic
 
@@ -0,0 +1,167 @@
+import config
+import functools
+import pyaudio
+import sys
+import os
+from pathlib import Path
+
+crumbot_config = config.get_config()
+
+DEVICE = crumbot_config["device"]  # "cuda" or "cpu", for STT and TTS
+
+# https://github.com/SYSTRAN/faster-whisper/issues/1080
+if DEVICE == "cuda" and sys.platform == "win32":
+    venv_base = Path(sys.executable).parent
+    nvidia_base_path = venv_base / 'Lib' / 'site-packages' / 'nvidia'
+    cublas_path = nvidia_base_path / 'cublas' / 'bin'
+    cudnn_path = nvidia_base_path / 'cudnn' / 'bin'
+    paths_to_add = [str(cublas_path), str(cudnn_path)]
+    env_vars = ['CUDA_PATH', 'CUDA_PATH_V12_4', 'PATH']
+
+    for env_var in env_vars:
+        current_value = os.environ.get(env_var, '')
+        new_value = os.pathsep.join(paths_to_add + [current_value])
+        os.environ[env_var] = new_value
+
+# Wakeword models (paths in wakeword/models) with their thresholds, sessions and voices
+WAKEWORDS = crumbot_config["wakewords"]
+# Skip wakeword inference while the room is silent
+WAKEWORD_GATE = crumbot_config["wakeword_gate"]
+# dB above the noise floor that counts as sound
+WAKEWORD_GATE_MARGIN = crumbot_config["wakeword_gate_margin"]
+# Run wakeword/VAD inference in a worker process, fed from shared memory
+WAKEWORD_PROCESS = crumbot_config["wakeword_process"]
+STT_MODEL = crumbot_config["stt_model"]  # Specify the STT model to use
+STT_COMPUTE_TYPE = crumbot_config["stt_compute_type"]
+STT_CPU_THREADS = crumbot_config["stt_cpu_threads"]  # 0 for the default
+STT_BEAM_SIZE = crumbot_config["stt_beam_size"]
+# Transcribe while the user is still speaking
+STT_STREAMING = crumbot_config["stt_streaming"]
+LLM_MODEL = crumbot_config["llm_model"]  # Specify the LLM model to use
+# Stream the response into TTS clause by clause
+LLM_STREAM_TOKENS = crumbot_config["llm_stream_tokens"]
+# How long Ollama keeps the LLM loaded after a request
+LLM_KEEP_ALIVE = crumbot_config["llm_keep_alive"]
+# Warm up the LLM at startup and on the wakeword
+LLM_WARM_UP = crumbot_config["llm_warm_up"]
+# Run simple commands without the LLM, learning from earlier agent decisions
+FAST_PATH = crumbot_config["fast_path"]
+FAST_PATH_CACHE = crumbot_config["fast_path_cache"]
+# Seconds to wait for a tool before answering without its result
+TOOL_TIMEOUT = crumbot_config["tool_timeout"]
+# Give the agent only the tools most relevant to the prompt, at most this many (0 for all of them)
+TOOL_TOP_K = crumbot_config["tool_top_k"]
+TOOL_INDEX_CACHE = crumbot_config["tool_index_cache"]
+# SQLite file conversations are persisted to ("" to keep them in memory)
+MEMORY_PATH = crumbot_config["memory_path"]
+MEMORY_MAX_TOKENS = crumbot_config["memory_max_tokens"]  # Approximate token budget for the history
+MEMORY_MAX_TURNS = crumbot_config["memory_max_turns"]  # Max user turns kept in the history
+MEMORY_SUMMARIZE = crumbot_config["memory_summarize"]  # Summarize trimmed turns instead of dropping them
+# Minutes of inactivity after which a new conversation is started
+SESSION_TIMEOUT = crumbot_config["session_timeout"]
+TTS_VOICE = crumbot_config["tts_voice"]  # Specify the TTS voice to use
+TTS_SPEED = crumbot_config["tts_speed"]  # Specify the TTS speed
+TTS_CACHE_SIZE = crumbot_config["tts_cache_size"]  # MB of synthesized speech kept in memory
+# Directory for cached speech that survives restarts ("" to disable)
+TTS_CACHE_DIR = crumbot_config["tts_cache_dir"]
+TTS_CACHE_DISK_SIZE = crumbot_config["tts_cache_disk_size"]  # MB
+
+# JSON lines file every utterance's trace is appended to ("" to only log them)
+TRACE_FILE = crumbot_config["trace_file"]
+METRICS_HOST = crumbot_config["metrics_host"]
+METRICS_PORT = crumbot_config["metrics_port"]  # serve Prometheus metrics on this port (0 to disable)
+# File the metrics are rewritten to every metrics_interval seconds ("" to disable)
+METRICS_FILE = crumbot_config["metrics_file"]
+METRICS_INTERVAL = crumbot_config["metrics_interval"]
+
+# Longest prompt audio, including its pre-roll and trailing pause (seconds)
+MAX_PROMPT_TIME = (crumbot_config["pre_roll_length"] + crumbot_config["max_speech_length"]
+                   + crumbot_config["pause_length"] + 1)
+
+
+def start_metrics_export():
+    """Start exporting this process's metrics, as configured."""
+    from utils.metrics import registry
+
+    if METRICS_PORT:
+        registry.serve(METRICS_HOST, METRICS_PORT)
+    if METRICS_FILE:
+        registry.write_periodically(METRICS_FILE, METRICS_INTERVAL)
+
+
+# Models are imported when they are loaded, so a thin client never imports the heavy ones
+
+
+def load_wakeword_detector(separate_process: bool = WAKEWORD_PROCESS, deadline: float | None = None):
+    """
+    Load the wakeword/VAD detector.
+
+    :param separate_process: Run the detector in a worker process.
+    :param deadline: Seconds after its capture by which the worker process should be done with a frame,
+        the length of a frame if not given.
+    """
+    from wakeword import OpenWakewordDetector, EnergyGate, WakewordProcess, ensure_feature_models
+
+    ensure_feature_models()
+    make_detector = functools.partial(
+        OpenWakewordDetector,
+        model_path=[wakeword["model"] for wakeword in WAKEWORDS],
+        wakeword_threshold=[wakeword.get("threshold", 0.5) for wakeword in WAKEWORDS],
+        gate=EnergyGate(margin_db=WAKEWORD_GATE_MARGIN) if WAKEWORD_GATE else None)
+    if separate_process:
+        return WakewordProcess(make_detector, deadline=deadline)
+    return make_detector()
+
+
+def load_stt_model(streaming: bool = STT_STREAMING):
+    """
+    Load the STT model.
+
+    :param streaming: Load the streaming model instead of the batched one.
+    """
+    from stt import FasterWhisperBatchedSTT, FasterWhisperStreamingSTT
+
+    model_kwargs = {"device": DEVICE, "compute_type": STT_COMPUTE_TYPE, "cpu_threads": STT_CPU_THREADS}
+    if streaming:
+        return FasterWhisperStreamingSTT(
+            model_name=STT_MODEL, max_buffer_length=MAX_PROMPT_TIME, beam_size=STT_BEAM_SIZE, **model_kwargs)
+    return FasterWhisperBatchedSTT(
+        model_name=STT_MODEL, decode_options={"beam_size": STT_BEAM_SIZE}, **model_kwargs)
+
+
+def wakeword_routes() -> dict:
+    """Where the turns of each configured wakeword go, by the wakeword's name."""
+    from pipeline.pipeline import WakewordRoute
+
+    return {Path(wakeword["model"]).stem: WakewordRoute(session=wakeword.get("session"), voice=wakeword.get("voice"))
+            for wakeword in WAKEWORDS}
+
+
+def load_command_processor():
+    """Load the command processor (agent), and warm up its LLM if enabled."""
+    from command import CommandProcessor
+
+    command_processor = CommandProcessor(
+        model_name=LLM_MODEL, stream_tokens=LLM_STREAM_TOKENS, fast_path=FAST_PATH, fast_path_cache=FAST_PATH_CACHE,
+        tool_timeout=TOOL_TIMEOUT, memory_path=MEMORY_PATH or None, memory_max_tokens=MEMORY_MAX_TOKENS,
+        memory_max_turns=MEMORY_MAX_TURNS, memory_summarize=MEMORY_SUMMARIZE, session_timeout=SESSION_TIMEOUT * 60,
+        keep_alive=LLM_KEEP_ALIVE, tool_top_k=TOOL_TOP_K, tool_index_path=TOOL_INDEX_CACHE or None)
+    if LLM_WARM_UP:
+        command_processor.warm_up()
+    return command_processor
+
+
+def load_tts_model():
+    """Load the TTS model, with its cache."""
+    from tts import KokoroTTS, TTSCache
+
+    tts_cache = TTSCache(max_memory_size=TTS_CACHE_SIZE * 1024 * 1024, cache_dir=TTS_CACHE_DIR or None,
+                         max_disk_size=TTS_CACHE_DISK_SIZE * 1024 * 1024)
+    return KokoroTTS(voice=TTS_VOICE, speed=TTS_SPEED, cache=tts_cache, device=DEVICE)
+
+
+def load_playback_manager():
+    """Create a playback manager for TTS audio."""
+    from utils.playback import AudioPlaybackManager
+
+    return AudioPlaybackManager(rate=24000, format=pyaudio.paInt16, channels=1, chunk_size=1024)
@@ -0,0 +1,108 @@
+import threading
+
+
+class TurnGate:
+    """
+    Holds back the side effects of a speculative turn, like tool calls, until
+    the pipeline either commits the turn or aborts it. Can be waited on from any thread.
+    """
+
+    def __init__(self):
+        self.settled = threading.Event()
+        self.committed = False
+
+    def commit(self):
+        """The prompt is final, let the turn go ahead."""
+        if not self.settled.is_set():
+            self.committed = True
+            self.settled.set()
+
+    def abort(self):
+        """The prompt went on, drop the turn."""
+        self.settled.set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wait until the turn is committed or aborted.
+
+        :param timeout: Max seconds to wait, forever if not given.
+        :return: If the turn was committed.
+        """
+        self.settled.wait(timeout)
+        return self.committed
+
+
+class SpeculativeEndpointer:
+    """
+    Decides when to start working on a prompt before the pause that ends it is
+    long enough to be sure it's over.
+
+    Every frame of a pause adds to the evidence that the prompt ended, weighted
+    by how sure the VAD is that the frame is silent, so a clean pause is
+    speculated on sooner than breathing or trailing noise. The amount of
+    evidence needed adapts to the hit rate: a miss (speech resumed) raises it,
+    a hit lowers it again.
+    """
+
+    def __init__(self, pause: float, min_pause: float, max_pause: float, backoff: float = 1.5, recovery: float = 0.95):
+        """
+        :param pause: Seconds of certain silence to start speculating after.
+        :param min_pause: The least the pause can adapt down to.
+        :param max_pause: The most the pause can adapt up to.
+        :param backoff: Factor the pause grows by after a miss.
+        :param recovery: Factor the pause shrinks by after a hit.
+        """
+        self.pause = pause
+        self.min_pause = min_pause
+        self.max_pause = max_pause
+        self.backoff = backoff
+        self.recovery = recovery
+        self.evidence = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0  # seconds the committed prompts were started ahead of the end of their pause
+
+    @property
+    def hit_rate(self) -> float:
+        speculations = self.hits + self.misses
+        return self.hits / speculations if speculations else 0.0
+
+    def reset(self):
+        """Speech resumed, start a new pause."""
+        self.evidence = 0.0
+
+    def update(self, speech_probability: float, frame_length: float) -> bool:
+        """
+        Feed a silent frame of a pause.
+
+        :param speech_probability: The VAD's probability that the frame is speech.
+        :param frame_length: Length of the frame in seconds.
+        :return: If there's enough evidence to speculate that the prompt ended.
+        """
+        self.evidence += (1.0 - speech_probability) * frame_length
+        return self.evidence >= self.pause
+
+    def hit(self, head_start: float):
+        """
+        The speculated prompt was committed.
+
+        :param head_start: Seconds between the speculation and the end of the pause.
+        """
+        self.hits += 1
+        self.saved += head_start
+        self.pause = max(self.min_pause, self.pause * self.recovery)
+
+    def miss(self):
+        """Speech resumed after a speculation."""
+        self.misses += 1
+        self.pause = min(self.max_pause, self.pause * self.backoff)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "saved": self.saved,
+            "pause": self.pause,
+        }
@@ -1,32 +1,32 @@
-# https://github.com/SYSTRAN/faster-whisper/issues/1080
 import config
-from tts import KokoroTTS
-from command import CommandProcessor
-from stt import FasterWhisperBatchedSTT
-from wakeword import OpenWakewordDetector
-from playsound import playsound
+from . import components
+from .startup import Startup
+from .endpointing import SpeculativeEndpointer, TurnGate
+from server import protocol
+from utils.audio import AudioRingBuffer, load_wav
+from utils.metrics import registry
+from utils.tracing import Tracer
+import math
 from concurrent.futures import ThreadPoolExecutor
 import asyncio
-import time
+import contextlib
+from dataclasses import dataclass
 from enum import Enum
 import numpy as np
 import pyaudio
 import logging
-import sys
-import os
+import socket
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable
 
-venv_base = Path(sys.executable).parent
-nvidia_base_path = venv_base / 'Lib' / 'site-packages' / 'nvidia'
-cublas_path = nvidia_base_path / 'cublas' / 'bin'
-cudnn_path = nvidia_base_path / 'cudnn' / 'bin'
-paths_to_add = [str(cublas_path), str(cudnn_path)]
-env_vars = ['CUDA_PATH', 'CUDA_PATH_V12_4', 'PATH']
-
-for env_var in env_vars:
-    current_value = os.environ.get(env_var, '')
-    new_value = os.pathsep.join(paths_to_add + [current_value])
-    os.environ[env_var] = new_value
+if TYPE_CHECKING:
+    from wakeword import OpenWakewordDetector, WakewordProcess
+    from stt import FasterWhisperBatchedSTT, FasterWhisperStreamingSTT
+    from command import CommandProcessor
+    from tts import KokoroTTS
+    from server.client import InferenceClient, ArbiterClient
+    from utils.playback import AudioPlaybackManager
 
 
 logger = logging.getLogger(__name__)
@@ -38,16 +38,39 @@ CHUNK = 1280
 
 crumbot_config = config.get_config()
 
-WAKEWORD_MODEL = crumbot_config["wakeword_model"]  # Path to the wakeword model
-STT_MODEL = crumbot_config["stt_model"]  # Specify the STT model to use
-LLM_MODEL = crumbot_config["llm_model"]  # Specify the LLM model to use
-TTS_VOICE = crumbot_config["tts_voice"]  # Specify the TTS voice to use
-TTS_SPEED = crumbot_config["tts_speed"]  # Specify the TTS speed
+# Run STT, the agent and TTS on an inference server instead of in this process
+USE_SERVER = crumbot_config["use_server"]
+SERVER_HOST = crumbot_config["server_host"]
+SERVER_PORT = crumbot_config["server_port"]
+# Codec of the audio to and from the server, and seconds of its response audio buffered against jitter
+AUDIO_CODEC = crumbot_config["audio_codec"]
+AUDIO_JITTER_BUFFER = crumbot_config["audio_jitter_buffer"]
+AUDIO_PACKET_LENGTH = crumbot_config["audio_packet_length"]
+# Let only the device that heard the wakeword best answer it, decided by an arbiter shared by the devices
+ARBITRATION = crumbot_config["arbitration"]
+ARBITER_HOST = crumbot_config["arbiter_host"]
+ARBITER_PORT = crumbot_config["arbiter_port"]
 
 MAX_SPEAKING_TIME = crumbot_config["max_speech_length"]  # seconds
 # max seconds to wait for speech after wakeword
 INITIAL_PAUSE_TIME = crumbot_config["initial_pause_length"]
 PAUSE_TIME = crumbot_config["pause_length"]  # seconds
+# Start STT and the agent once a pause looks like the end of the prompt, before PAUSE_TIME is up
+SPECULATIVE_ENDPOINTING = crumbot_config["speculative_endpointing"]
+# seconds of certain silence to speculate after, adapted to the hit rate between the bounds
+SPECULATIVE_PAUSE_TIME = crumbot_config["speculative_pause_length"]
+MIN_SPECULATIVE_PAUSE_TIME = 0.2
+MAX_SPECULATIVE_PAUSE_TIME = 0.8 * PAUSE_TIME
+# seconds of audio before speech starts to keep in the prompt
+PRE_ROLL_TIME = crumbot_config["pre_roll_length"]
+
+# Queue bounds between pipeline stages
+FRAME_QUEUE_SIZE = 64  # ~5 seconds of mic frames
+TURN_QUEUE_SIZE = 2  # utterances/transcriptions waiting on STT or the agent
+# frames of a prompt waiting on streaming STT
+SPEECH_QUEUE_SIZE = math.ceil((MAX_SPEAKING_TIME + PAUSE_TIME) * RATE / CHUNK) + 2
+TEXT_QUEUE_SIZE = 8  # response chunks waiting on TTS
+AUDIO_QUEUE_SIZE = 4  # synthesized segments waiting on playback
 
 
 class AssistantState(Enum):
@@ -56,112 +79,820 @@ class AssistantState(Enum):
     LISTENING = "listening"  # listening to prompt
 
 
-# Pipeline components
-wakeword_detector = OpenWakewordDetector(model_path=WAKEWORD_MODEL)
-stt_model = FasterWhisperBatchedSTT(
-    model_name=STT_MODEL, device="cuda", compute_type="int8")
-command_processor = CommandProcessor(model_name=LLM_MODEL)
-tts_model = KokoroTTS(voice=TTS_VOICE, speed=TTS_SPEED, device="cuda")
-
-
-def reset_state():
-    """Reset the assistant state and timers."""
-
-    global state, wakeword_time, speech_start_time, pause_start_time
-    state = AssistantState.IDLE
-    wakeword_time = None
-    speech_start_time = None
-    pause_start_time = None
-
-
-reset_state()  # Initialize state
-
-
-def _mic_callback(in_data, frame_count, time_info, status):
-    global state, wakeword_time, speech_start_time, pause_start_time, prompt_audio
-
-    current_time = time.time()
-    audio_data = np.frombuffer(in_data, dtype=np.int16)
-
-    wakeword_detector.predict(audio_data)
-
-    match state:
-        case AssistantState.IDLE:
-            if wakeword_detector.is_wakeword_detected():
-                # start listening
-                state = AssistantState.WAITING
-                wakeword_time = current_time
-                tts_model.playback_manager.stop_playback()  # stop any ongoing TTS playback
-                playsound(str(Path(__file__).parent.parent.parent /
-                          "res/audio/beep.mp3"), block=False)
-                prompt_audio = audio_data.copy()  # reset prompt audio
-                logger.info("Wake word detected!")
-
-        case AssistantState.WAITING:
-            if wakeword_detector.vad():
-                # start listening to speech
-                state = AssistantState.LISTENING
-                speech_start_time = current_time
-                logger.info("Listening for prompt...")
-            elif current_time - wakeword_time > INITIAL_PAUSE_TIME:
-                # reset state if no speech detected after initial pause time
-                logger.info("No speech detected, resetting state...")
-                reset_state()
-
-        case AssistantState.LISTENING:
-            prompt_audio = np.concatenate(
-                (prompt_audio, audio_data))  # may be inefficient
-
-            if current_time - speech_start_time > MAX_SPEAKING_TIME:
-                # reset state if max speaking time exceeded
-                logger.info("Max speaking time exceeded, resetting state...")
-                reset_state()
-
-            if not wakeword_detector.vad():
-                # start the pause timer
-                if pause_start_time is None:
-                    pause_start_time = current_time
-                elif current_time - pause_start_time > PAUSE_TIME:
-                    # process the speech and reset state
-                    logger.info("Pause detected, processing prompt...")
-                    reset_state()
-
-                    transcription = stt_model.transcribe(prompt_audio)
-                    logger.info("Transcription: " + transcription)
-
-                    response = command_processor.process_prompt(transcription)
-                    for chunk in response:
-                        if not chunk:
+@dataclass(frozen=True)
+class WakewordRoute:
+    """Where the turns started by a wakeword go, like a user's own conversation and voice."""
+    session: str | None = None  # conversation to continue, the default one (or the client's on a server) if None
+    voice: str | None = None  # TTS voice to answer in, the default one if None
+
+
+# Played when the wakeword is detected
+BEEP_SOUND = load_wav(Path(__file__).parent.parent.parent / "res/audio/beep.wav", rate=24000)
+
+
+class AssistantPipeline:
+    """
+    Event-driven assistant pipeline.
+
+    The mic callback only enqueues frames. Everything else runs as a chain of
+    asyncio stages linked by bounded queues:
+    capture -> wakeword/VAD -> endpointing -> STT -> agent -> TTS -> playback.
+    Blocking model calls run in a thread pool so capture never stalls, and a new
+    wakeword cancels any turn that is still in flight.
+
+    With an inference server, the STT, agent and TTS stages are replaced by a
+    single stage that streams the prompt to the server while it's spoken, and
+    plays what comes back.
+    """
+
+    def __init__(self, wakeword_detector: "OpenWakewordDetector | WakewordProcess",
+                 playback_manager: "AudioPlaybackManager",
+                 stt_model: "FasterWhisperBatchedSTT | FasterWhisperStreamingSTT | None" = None,
+                 command_processor: "CommandProcessor | None" = None, tts_model: "KokoroTTS | None" = None,
+                 remote: "InferenceClient | None" = None, streaming_stt: bool | None = None,
+                 audio_interface: "pyaudio.PyAudio | None" = None,
+                 on_event: Callable[[str, int, int | None], None] | None = None, tracer: Tracer | None = None,
+                 speculative: bool = SPECULATIVE_ENDPOINTING, arbiter: "ArbiterClient | None" = None,
+                 routes: dict[str, WakewordRoute] | None = None):
+        """
+        Initialize the pipeline with its components.
+        Either the local models or the remote client must be given. The local
+        models may also be futures of models still loading in the background,
+        the stages that need them wait for them on their first use.
+
+        :param wakeword_detector: The wakeword/VAD detector, or a detector running in a worker process.
+        :param playback_manager: Plays the responses and the wake beep.
+        :param stt_model: The speech-to-text model.
+        :param command_processor: The command processor (agent).
+        :param tts_model: The text-to-speech model.
+        :param remote: Client for an inference server that runs STT, the agent and TTS.
+        :param streaming_stt: Whether the STT model is a streaming one, taken from the model if not given.
+        :param audio_interface: PyAudio instance to open the mic with, a new one is created if not given.
+        :param on_event: Called on the event loop with (event, turn id, frame) at the milestones of a
+            turn: "wakeword", "speech_end" and "reset" from the endpointer, with the index of the captured
+            frame that triggered them, then "transcript", "text" (for every response chunk) and "done".
+            "speculation_miss" moves the turn to a new id when speech resumes after a speculation.
+        :param tracer: Records a trace of every utterance, one that only logs them is used if not given.
+        :param speculative: Start transcribing and running the agent on a prompt at the first pause
+            that looks like its end, holding back its tool calls and audio until the pause is long enough.
+            Only supported with local, batched STT.
+        :param arbiter: Arbiter that decides which device answers a wakeword heard by several. A turn
+            another device won is dropped with a "reset" event.
+        :param routes: Where the turns of each wakeword go, by the wakeword's name. Wakewords without a
+            route use the default conversation and voice.
+        """
+        self.wakeword_detector = wakeword_detector
+        self.playback_manager = playback_manager
+        self.stt_model = stt_model
+        self.command_processor = command_processor
+        self.tts_model = tts_model
+        self.remote = remote
+        self.arbiter = arbiter
+        self.arbitrations = set()  # pending claims
+        self.routes = routes or {}
+        self.route = WakewordRoute()  # of the wakeword that started the current turn
+        self.audio_interface = audio_interface
+        self.on_event = on_event
+        self.tracer = tracer or Tracer()
+        self.traces = {}  # turn id -> trace of the turn
+        self.endpoint_span = None  # span of the endpointer's current state
+        self.warm_up_task = None  # of the LLM warm-up in flight
+        if streaming_stt is None:
+            streaming_stt = remote is None and stt_model.streaming
+        self.streaming_stt = streaming_stt
+        # the prompt goes on frame by frame while it's spoken, instead of once it ends
+        self.stream_prompt = streaming_stt or remote is not None
+        self.remote_turn = None  # task receiving the server's response to a turn
+        # streaming STT already transcribes while the user speaks, and the server can't hold back tool calls
+        self.endpointer = None
+        if speculative and remote is None and not streaming_stt:
+            self.endpointer = SpeculativeEndpointer(
+                SPECULATIVE_PAUSE_TIME, MIN_SPECULATIVE_PAUSE_TIME, MAX_SPECULATIVE_PAUSE_TIME)
+        self.turn_gate = None  # gate of the turn being speculated on
+        self.speculation_time = None  # when the speculation started, on the sample clock
+        self.speculation_settled = asyncio.Event()  # cleared while a speculation is undecided
+        self.speculation_settled.set()
+
+        # wakeword inference is stateful, so it gets its own single worker
+        self.detect_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="detect")
+        self.executor = ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="pipeline")
+        # a warm-up can take seconds while the model loads, and mustn't hold up a pipeline worker
+        self.warm_up_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="warm_up")
+
+        self.frame_queue = asyncio.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.event_queue = asyncio.Queue(maxsize=FRAME_QUEUE_SIZE)
+        # streaming STT and the server receive the prompt frame by frame, followed by None once it ends
+        self.stt_queue = asyncio.Queue(
+            maxsize=SPEECH_QUEUE_SIZE if self.stream_prompt else TURN_QUEUE_SIZE)
+        self.agent_queue = asyncio.Queue(maxsize=TURN_QUEUE_SIZE)
+        self.tts_queue = asyncio.Queue(maxsize=TEXT_QUEUE_SIZE)
+        self.playback_queue = asyncio.Queue(maxsize=AUDIO_QUEUE_SIZE)
+
+        # the capture buffer holds the longest possible prompt, including its pre-roll and trailing pause
+        capture_seconds = PRE_ROLL_TIME + MAX_SPEAKING_TIME + PAUSE_TIME + 1
+        self.capture_buffer = AudioRingBuffer(
+            math.ceil(capture_seconds * RATE / CHUNK) * CHUNK)
+        self.pre_roll_samples = int(PRE_ROLL_TIME * RATE)
+
+        self.loop = None
+        self.turn_id = 0  # incremented to cancel the turn in flight
+        self.wakeword_id = 0  # incremented on every wake word, unlike the turn id not on a speculation miss
+        self.frames_captured = 0
+        self.frames_seen = 0
+        self.frames_dropped = 0
+        self.input_overflows = 0
+        self.reset_state()
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """Expose the pipeline's counters, queue depths and inference times as metrics."""
+
+        registry.counter("crumbot_frames_captured_total", "Mic frames captured.", fn=lambda: self.frames_captured)
+        registry.counter("crumbot_frames_dropped_total", "Mic frames dropped because detection fell behind.",
+                         fn=lambda: self.frames_dropped)
+        registry.counter("crumbot_input_overflows_total", "Mic input overflows reported by PortAudio.",
+                         fn=lambda: self.input_overflows)
+        registry.gauge("crumbot_wakeword_skip_ratio", "Fraction of frames the energy gate skipped inference on.",
+                       fn=lambda: self.wakeword_detector.skip_ratio)
+        if self.wakeword_detector.out_of_process:
+            registry.counter("crumbot_wakeword_deadline_misses_total",
+                             "Frames the wakeword process finished after the next frame was due.",
+                             fn=lambda: self.wakeword_detector.deadline_misses)
+        queues = {"frame": self.frame_queue, "event": self.event_queue, "stt": self.stt_queue,
+                  "agent": self.agent_queue, "tts": self.tts_queue, "playback": self.playback_queue}
+        for name, queue in queues.items():
+            registry.gauge("crumbot_queue_depth", "Items waiting in a pipeline queue.", fn=queue.qsize, queue=name)
+
+        self.turns = registry.counter("crumbot_turns_total", "Wakeword activations.")
+        self.mic_callback_time = registry.histogram(
+            "crumbot_mic_callback_seconds", "Time spent in the mic callback.",
+            [0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01])
+        self.wakeword_inference_time = registry.histogram(
+            "crumbot_wakeword_inference_seconds", "Wakeword/VAD inference time per frame.",
+            [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1])
+
+        if self.endpointer is not None:
+            registry.counter("crumbot_speculations_total", "Prompts worked on before the end of their pause.",
+                             fn=lambda: self.endpointer.hits, outcome="hit")
+            registry.counter("crumbot_speculations_total", "Prompts worked on before the end of their pause.",
+                             fn=lambda: self.endpointer.misses, outcome="miss")
+            registry.gauge("crumbot_speculation_hit_rate", "Fraction of speculations that were committed.",
+                           fn=lambda: self.endpointer.hit_rate)
+            registry.gauge("crumbot_speculative_pause_seconds", "Silence the endpointer currently speculates after.",
+                           fn=lambda: self.endpointer.pause)
+            self.speculation_saved = registry.histogram(
+                "crumbot_speculation_saved_seconds", "Head start of committed speculations.",
+                [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0])
+
+    def reset_state(self):
+        """Reset the assistant state and timers."""
+
+        self.state = AssistantState.IDLE
+        self.wakeword_time = None
+        self.speech_start_time = None
+        self.pause_start_time = None
+        self.prompt_start = None  # position of the prompt in the capture buffer
+        if self.endpointer is not None:
+            self.endpointer.reset()
+
+    def _mic_callback(self, in_data, frame_count, time_info, status):
+        """
+        PyAudio input callback. Runs on the PortAudio thread, so it only hands
+        the frame over to the event loop.
+        """
+        captured_at = time.perf_counter()
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+
+        self.frames_captured += 1
+        audio_data = np.frombuffer(in_data, dtype=np.int16)
+        if self.wakeword_detector.out_of_process:
+            # straight to shared memory, without waiting on the event loop
+            self.wakeword_detector.write(self.frames_captured, captured_at, audio_data)
+        else:
+            self.loop.call_soon_threadsafe(self._enqueue_frame, self.frames_captured, captured_at, audio_data)
+
+        self.mic_callback_time.observe(time.perf_counter() - captured_at)
+        return (in_data, pyaudio.paContinue)
+
+    def _enqueue_frame(self, frame: int, captured_at: float, audio_data: np.ndarray):
+        """
+        Put a captured frame on the frame queue, dropping it if the detection
+        stage has fallen behind.
+
+        :param frame: Index of the frame since capture started.
+        :param captured_at: perf_counter() time the frame was captured at.
+        :param audio_data: Audio frame as a NumPy array in int16 format.
+        """
+        try:
+            self.frame_queue.put_nowait((frame, captured_at, audio_data))
+        except asyncio.QueueFull:
+            self.frames_dropped += 1
+            if self.frames_dropped % FRAME_QUEUE_SIZE == 1:
+                logger.warning(
+                    f"Detection is falling behind, {self.frames_dropped} frames dropped so far.")
+
+    async def _run_blocking(self, func, *args):
+        """Run a blocking call in the pipeline's thread pool."""
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    @staticmethod
+    async def _loaded(component):
+        """Wait for a component that may still be loading in the background."""
+        if isinstance(component, asyncio.Future):
+            if not component.done():
+                logger.info("Waiting for models to finish loading...")
+            return await component
+        return component
+
+    def _emit(self, event: str, turn_id: int, frame: int | None = None):
+        """Report a turn milestone to the event listener, if there is one."""
+        if self.on_event is not None:
+            self.on_event(event, turn_id, frame)
+
+    def _span(self, turn_id: int, name: str, **attributes):
+        """Time a step of a turn as a span of its trace, if it is still traced."""
+        trace = self.traces.get(turn_id)
+        return trace.span(name, **attributes) if trace is not None else contextlib.nullcontext()
+
+    def _finish_trace(self, turn_id: int, status: str = "ok"):
+        """Finish the trace of a turn."""
+        trace = self.traces.pop(turn_id, None)
+        if trace is not None:
+            trace.finish(status)
+
+    def _is_current(self, turn_id: int) -> bool:
+        """Check if a turn has not been cancelled."""
+        return turn_id == self.turn_id
+
+    def _cancel_turn(self):
+        """Cancel the turn in flight, discarding any queued work and stopping playback."""
+
+        for turn_id in list(self.traces):
+            self._finish_trace(turn_id, "cancelled")
+
+        self._drop_speculation()
+        self.turn_id += 1
+        self._clear_queues()
+        self.playback_manager.stop_playback()
+        if self.remote_turn is not None:
+            self.remote_turn.cancel()  # right away, not once the server sends something
+
+    def _clear_queues(self):
+        """Discard the work queued after the endpointer."""
+        for queue in (self.stt_queue, self.agent_queue, self.tts_queue, self.playback_queue):
+            while not queue.empty():
+                queue.get_nowait()
+
+    def _speculate(self, current_time: float) -> np.ndarray:
+        """
+        Start a speculative turn on the prompt so far.
+
+        :param current_time: The endpointer's sample clock.
+        :return: The prompt audio to transcribe.
+        """
+        logger.info("Pause looks final, processing prompt speculatively...")
+        self.turn_gate = TurnGate()
+        self.speculation_time = current_time
+        self.speculation_settled.clear()
+        if self.turn_id in self.traces:
+            self.traces[self.turn_id].event("speculate", pause=round(self.endpointer.pause, 3))
+        return self.capture_buffer.read(self.prompt_start)
+
+    def _commit_speculation(self, current_time: float):
+        """The pause held, let the speculative turn go ahead."""
+        head_start = current_time - self.speculation_time
+        self.endpointer.hit(head_start)
+        self.speculation_saved.observe(head_start)
+        if self.turn_id in self.traces:
+            self.traces[self.turn_id].event("speculation_hit", saved=round(head_start, 3))
+        self.turn_gate.commit()
+        self.turn_gate = None
+        self.speculation_time = None
+        self.speculation_settled.set()
+
+    def _drop_speculation(self) -> bool:
+        """
+        Abort the speculative turn, if there is one, and move the turn on to a
+        new id, so the work already started for it is discarded.
+
+        :return: If there was a speculative turn.
+        """
+        if self.turn_gate is None:
+            return False
+
+        self.turn_gate.abort()
+        self.turn_gate = None
+        self.speculation_time = None
+        self.turn_id += 1
+        self._clear_queues()
+        self.speculation_settled.set()
+        return True
+
+    def _speech_resumed(self):
+        """Speech resumed during a pause, so a speculation on it was wrong."""
+        old_turn_id = self.turn_id
+        if not self._drop_speculation():
+            return
+
+        logger.info("Speech resumed, dropping the speculative turn...")
+        self.endpointer.miss()
+        trace = self.traces.pop(old_turn_id, None)
+        if trace is not None:
+            trace.turn_id = self.turn_id
+            trace.event("speculation_miss")
+            self.traces[self.turn_id] = trace
+        self._emit("speculation_miss", self.turn_id)
+
+    def _warm_up_agent(self):
+        """Warm up the LLM in the background, so it's ready by the time the prompt is transcribed."""
+        if not components.LLM_WARM_UP:
+            return
+        if self.warm_up_task is not None and not self.warm_up_task.done():
+            return
+
+        if self.remote is not None:
+            self.warm_up_task = asyncio.create_task(self.remote.warm_up(self.route.session))
+        else:
+            command_processor = self.command_processor
+            if isinstance(command_processor, asyncio.Future):
+                if not command_processor.done() or command_processor.exception() is not None:
+                    return  # still loading, and warmed up once it is
+                command_processor = command_processor.result()
+            self.warm_up_task = self.loop.run_in_executor(
+                self.warm_up_executor, command_processor.warm_up, self.route.session or "default", "wakeword")
+        self.warm_up_task.add_done_callback(self._warm_up_done)
+
+    @staticmethod
+    def _warm_up_done(future: asyncio.Future):
+        """Log a warm-up that failed, instead of losing its exception."""
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("LLM warm-up failed", exc_info=future.exception())
+
+    def _arbitrate(self, turn_id: int, score: float, snr: float):
+        """Claim the wakeword with the arbiter, and drop the turn if another device answers it."""
+        if self.arbiter is None:
+            return
+
+        wakeword_id = self.wakeword_id
+
+        async def claim():
+            with self._span(turn_id, "arbitration", score=round(score, 3), snr=round(snr, 1)):
+                won = await self.arbiter.claim(turn_id, score, snr)
+            if won or wakeword_id != self.wakeword_id:
+                return  # a newer wake word makes its own claim
+
+            # the turn may have moved on to a new id since, when a speculation on it was dropped
+            logger.info("Another device is answering the wake word, resetting state...")
+            self._emit("reset", self.turn_id)
+            self._finish_trace(self.turn_id, "lost")
+            self._cancel_turn()
+            self.reset_state()
+
+        task = asyncio.create_task(claim())
+        self.arbitrations.add(task)
+        task.add_done_callback(self.arbitrations.discard)
+
+    async def _detect_stage(self):
+        """Run wakeword and VAD inference on every captured frame."""
+
+        if self.wakeword_detector.out_of_process:
+            return await self._detect_process_stage()
+
+        while True:
+            frame, captured_at, audio_data = await self.frame_queue.get()
+            start = time.perf_counter()
+            await self.loop.run_in_executor(
+                self.detect_executor, self.wakeword_detector.predict, audio_data)
+            self.wakeword_inference_time.observe(time.perf_counter() - start)
+
+            wakeword = None  # name, score and SNR if detected
+            name = self.wakeword_detector.detected_wakeword()
+            if name is not None:
+                wakeword = (name, self.wakeword_detector.wakeword_score(name), self.wakeword_detector.snr())
+            speech = self.wakeword_detector.vad()
+            speech_probability = self.wakeword_detector.vad_probability()
+            await self.event_queue.put((frame, captured_at, audio_data, wakeword, speech, speech_probability))
+
+    async def _detect_process_stage(self):
+        """Receive the results of the wakeword process, which reads the frames from shared memory."""
+
+        while True:
+            # time out now and then, so the executor's thread isn't stuck on the pipe when the stage is cancelled
+            result = await self.loop.run_in_executor(self.detect_executor, self.wakeword_detector.receive, 0.5)
+            if result is None:
+                continue
+
+            frame, captured_at, audio_data, wakeword, speech, speech_probability, inference_time, dropped = result
+            self.frames_dropped += dropped
+            self.wakeword_inference_time.observe(inference_time)
+            await self.event_queue.put((frame, captured_at, audio_data, wakeword, speech, speech_probability))
+
+    async def _endpoint_stage(self):
+        """Track the assistant state and hand finished utterances to STT."""
+
+        while True:
+            frame, captured_at, audio_data, wakeword, speech, speech_probability = await self.event_queue.get()
+            self.capture_buffer.write(audio_data)
+
+            # use the sample clock, so queueing delays don't skew the timers
+            self.frames_seen += 1
+            current_time = self.frames_seen * CHUNK / RATE
+
+            match self.state:
+                case AssistantState.IDLE:
+                    if wakeword:
+                        # start listening
+                        self._cancel_turn()  # stop any ongoing turn and TTS playback
+                        self.wakeword_id += 1
+                        name, score, snr = wakeword
+                        self.state = AssistantState.WAITING
+                        self.wakeword_time = current_time
+                        self.route = self.routes.get(name, WakewordRoute())
+                        self.playback_manager.play_clip(BEEP_SOUND)
+                        logger.info(f"Wake word detected! ({name})")
+                        self._emit("wakeword", self.turn_id, frame)
+                        self._arbitrate(self.turn_id, score, snr)
+                        self._warm_up_agent()
+
+                        self.turns.inc()
+                        trace = self.tracer.start_trace(self.turn_id)
+                        self.traces[self.turn_id] = trace
+                        # from the capture of the frame it was heard in
+                        trace.start_span("wakeword", start=captured_at, frame=frame, wakeword=name).end()
+                        self.endpoint_span = trace.start_span("vad_start")
+
+                case AssistantState.WAITING:
+                    if speech:
+                        # start listening to speech
+                        self.state = AssistantState.LISTENING
+                        self.speech_start_time = current_time
+                        self.endpoint_span.end()
+                        self.endpoint_span = self.traces[self.turn_id].start_span("endpoint")
+                        # include the frame that triggered VAD and the pre-roll before it
+                        self.prompt_start = max(
+                            self.capture_buffer.position - len(audio_data) - self.pre_roll_samples,
+                            self.capture_buffer.oldest_position)
+                        if self.stream_prompt:
+                            await self.stt_queue.put(
+                                (self.turn_id, self.capture_buffer.read(self.prompt_start)))
+                        logger.info("Listening for prompt...")
+                    elif current_time - self.wakeword_time > INITIAL_PAUSE_TIME:
+                        # reset state if no speech detected after initial pause time
+                        logger.info("No speech detected, resetting state...")
+                        self.reset_state()
+                        self._emit("reset", self.turn_id, frame)
+                        self._finish_trace(self.turn_id, "reset")
+
+                case AssistantState.LISTENING:
+                    if self.stream_prompt:
+                        await self.stt_queue.put((self.turn_id, audio_data))
+
+                    if current_time - self.speech_start_time > MAX_SPEAKING_TIME:
+                        # reset state if max speaking time exceeded
+                        logger.info("Max speaking time exceeded, resetting state...")
+                        self.reset_state()
+                        self._emit("reset", self.turn_id, frame)
+                        self._finish_trace(self.turn_id, "reset")
+                        self._drop_speculation()
+                    elif not speech:
+                        # start the pause timer
+                        if self.pause_start_time is None:
+                            self.pause_start_time = current_time
+                        elif current_time - self.pause_start_time > PAUSE_TIME:
+                            # hand the speech over to STT and reset state
+                            logger.info("Pause detected, processing prompt...")
+                            speculated = self.turn_gate is not None
+                            if speculated:
+                                self._commit_speculation(current_time)
+                            prompt_audio = None  # streamed or speculated on already
+                            if not self.stream_prompt and not speculated:
+                                prompt_audio = self.capture_buffer.read(self.prompt_start)
+                            self.reset_state()
+                            self._emit("speech_end", self.turn_id, frame)
+                            self.endpoint_span.end()
+                            if not speculated:
+                                await self.stt_queue.put((self.turn_id, prompt_audio))
                             continue
-                        logger.info("AI: " + chunk)
-                        tts_model.speak(chunk)
 
-                    logger.info("Done processing.")
+                        if (self.endpointer is not None and self.turn_gate is None
+                                and self.endpointer.update(speech_probability, CHUNK / RATE)):
+                            await self.stt_queue.put((self.turn_id, self._speculate(current_time)))
+                    else:
+                        # reset pause timer if speech is detected
+                        self.pause_start_time = None
+                        if self.endpointer is not None:
+                            self.endpointer.reset()
+                            self._speech_resumed()
+
+    async def _stt_stage(self):
+        """Transcribe finished utterances."""
+
+        while True:
+            turn_id, prompt_audio = await self.stt_queue.get()
+            if not self._is_current(turn_id):
+                continue
+
+            self.stt_model = await self._loaded(self.stt_model)
+            with self._span(turn_id, "stt", audio_length=len(prompt_audio) / RATE):
+                transcription = await self._run_blocking(self.stt_model.transcribe, prompt_audio)
+            if not self._is_current(turn_id):
+                continue
+
+            logger.info("Transcription: " + transcription)
+            self._emit("transcript", turn_id)
+            await self.agent_queue.put((turn_id, transcription))
+
+    async def _streaming_stt_stage(self):
+        """Transcribe prompts incrementally as their frames arrive."""
+
+        stream_turn_id = None
+        while True:
+            turn_id, audio_data = await self.stt_queue.get()
+            if not self._is_current(turn_id):
+                continue
+
+            if turn_id != stream_turn_id:
+                # first frames of a new prompt
+                self.stt_model = await self._loaded(self.stt_model)
+                await self._run_blocking(self.stt_model.reset)
+                stream_turn_id = turn_id
+
+            if audio_data is None:
+                # end of speech, only the uncommitted tail is left to decode
+                stream_turn_id = None
+                with self._span(turn_id, "stt"):
+                    transcription = await self._run_blocking(self.stt_model.finish)
+                if not self._is_current(turn_id):
+                    continue
+
+                logger.info("Transcription: " + transcription)
+                self._emit("transcript", turn_id)
+                await self.agent_queue.put((turn_id, transcription))
+                continue
+
+            self.stt_model.insert_audio(audio_data)
+            if self.stt_queue.empty():
+                # caught up with the mic, so decode what we have so far
+                with self._span(turn_id, "stt_partial"):
+                    committed = await self._run_blocking(self.stt_model.process_iter)
+                if committed:
+                    logger.debug("Committed: " + committed)
+
+    async def _agent_stage(self):
+        """Run the agent on transcriptions and pass its responses on to TTS."""
+
+        while True:
+            turn_id, transcription = await self.agent_queue.get()
+            if not self._is_current(turn_id):
+                continue
+
+            gate = self.turn_gate  # if the turn is still being speculated on
+            self.command_processor = await self._loaded(self.command_processor)
+            response = self.command_processor.process_prompt(
+                transcription, session=self.route.session or "default", trace=self.traces.get(turn_id),
+                gate=gate)
+            while self._is_current(turn_id):
+                chunk = await self._run_blocking(next, response, None)
+                if chunk is None:
+                    break
+                if not chunk:
+                    continue
+                logger.info("AI: " + chunk)
+                self._emit("text", turn_id)
+                await self.tts_queue.put((turn_id, chunk))
+            response.close()
+
+            # a speculative turn is only done once it's committed, other turns mustn't wait on a newer one
+            if gate is not None and self._is_current(turn_id):
+                await self.speculation_settled.wait()
+            if self._is_current(turn_id):
+                logger.info("Done processing.")
+                self._emit("done", turn_id)
+                await self.tts_queue.put((turn_id, None))  # end of the response
             else:
-                # reset pause timer if speech is detected
-                pause_start_time = None
-
-    return (in_data, pyaudio.paContinue)
+                logger.info("Turn cancelled.")
+
+    async def _tts_stage(self):
+        """Synthesize response text into audio segments."""
+
+        while True:
+            turn_id, text = await self.tts_queue.get()
+            if text is None:
+                await self.playback_queue.put((turn_id, None))
+                continue
+
+            self.tts_model = await self._loaded(self.tts_model)
+            segments = self.tts_model.synthesize(text, self.route.voice)
+            while self._is_current(turn_id):
+                start = time.perf_counter()
+                segment = await self._run_blocking(next, segments, None)
+                if segment is None:
+                    break
+                if turn_id in self.traces:
+                    self.traces[turn_id].start_span("tts", start=start, text=text).end()
+                await self.playback_queue.put((turn_id, segment))
+            segments.close()
+
+    async def _playback_stage(self):
+        """Queue synthesized audio for playback."""
+
+        started_turn_id = None
+        while True:
+            turn_id, segment = await self.playback_queue.get()
+            if self._is_current(turn_id):
+                # hold back the response of a speculative turn until it's committed
+                await self.speculation_settled.wait()
+            if segment is None:
+                # the whole response is queued for playback
+                self._finish_trace(turn_id)
+                continue
+
+            if self._is_current(turn_id):
+                if turn_id != started_turn_id and turn_id in self.traces:
+                    self.traces[turn_id].event("playback_start")
+                    started_turn_id = turn_id
+                # blocks while the playback buffer is full
+                await self._run_blocking(self.playback_manager.queue_playback, segment)
+
+    async def _remote_stage(self):
+        """Stream prompts to the inference server while they're spoken, and queue the audio it sends back."""
+
+        stream_turn_id = None  # of the prompt being streamed
+        while True:
+            turn_id, audio_data = await self.stt_queue.get()
+            if stream_turn_id is not None and turn_id != stream_turn_id:
+                # the prompt was abandoned before it ended
+                await self.remote.cancel(stream_turn_id)
+                stream_turn_id = None
+            if not self._is_current(turn_id):
+                continue
+
+            if audio_data is not None:
+                stream_turn_id = turn_id
+                await self.remote.send_audio(turn_id, audio_data)
+                continue
+
+            # end of speech, wait for the response until the turn ends or is cancelled
+            stream_turn_id = None
+            self.remote_turn = asyncio.create_task(self._remote_turn(turn_id))
+            try:
+                await asyncio.wait([self.remote_turn])
+            finally:
+                self.remote_turn.cancel()
+                self.remote_turn = None
+
+    async def _remote_turn(self, turn_id: int):
+        """End a turn's prompt and queue the server's response to it for playback."""
+
+        remote_span = self.traces[turn_id].start_span("remote") if turn_id in self.traces else None
+        try:
+            # a turn given up on is cancelled on the server as the response is closed
+            async with contextlib.aclosing(self.remote.run_turn(
+                    turn_id, session=self.route.session, voice=self.route.voice)) as events:
+                async for header, payload in events:
+                    match header["type"]:
+                        case protocol.TRANSCRIPT:
+                            logger.info("Transcription: " + header["text"])
+                            self._emit("transcript", turn_id)
+                            if remote_span is not None:
+                                remote_span.trace.event("transcript")
+                        case protocol.TEXT:
+                            logger.info("AI: " + header["text"])
+                            self._emit("text", turn_id)
+                        case protocol.AUDIO:
+                            await self.playback_queue.put((turn_id, np.frombuffer(payload, dtype=np.int16)))
+                        case protocol.ERROR:
+                            logger.error("Inference server error: " + header["message"])
+            logger.info("Done processing.")
+            self._emit("done", turn_id)
+            await self.playback_queue.put((turn_id, None))  # end of the response
+        except asyncio.CancelledError:
+            logger.info("Turn cancelled.")
+        finally:
+            if remote_span is not None:
+                remote_span.end()
+
+    async def _watch_stream(self, mic_stream):
+        """Return once the mic stream is no longer active."""
+
+        while mic_stream.is_active():
+            await asyncio.sleep(1)
+
+    async def run(self):
+        """Run the assistant using the mic."""
+
+        self.loop = asyncio.get_running_loop()
+        pa = self.audio_interface or pyaudio.PyAudio()
+
+        mic_stream = pa.open(format=FORMAT, channels=CHANNELS, rate=RATE,
+                             input=True, frames_per_buffer=CHUNK, stream_callback=self._mic_callback)
+
+        stages = [
+            self._detect_stage(),
+            self._endpoint_stage(),
+            self._playback_stage(),
+            self._watch_stream(mic_stream),
+        ]
+        if self.remote is not None:
+            stages.append(self._remote_stage())
+        else:
+            stages += [
+                self._streaming_stt_stage() if self.streaming_stt else self._stt_stage(),
+                self._agent_stage(),
+                self._tts_stage(),
+            ]
+        tasks = [asyncio.create_task(stage) for stage in stages]
+
+        mic_stream.start_stream()
+        logger.info("Waiting for wake word...")
+
+        try:
+            # stages run forever, so this returns when the mic closes or a stage fails
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error("Pipeline stage failed", exc_info=task.exception())
+        finally:
+            logger.info("Mic stream closed...")
+
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            mic_stream.stop_stream()
+            mic_stream.close()
+            pa.terminate()
+
+            self._drop_speculation()  # releases tool calls waiting on it
+            self.detect_executor.shutdown(wait=False, cancel_futures=True)
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.warm_up_executor.shutdown(wait=False, cancel_futures=True)
+
+            logger.info(
+                f"Frames dropped: {self.frames_dropped}, input overflows: {self.input_overflows}, "
+                f"wakeword inference skipped: {self.wakeword_detector.skip_ratio:.1%}")
+            if self.wakeword_detector.out_of_process:
+                logger.info(f"Wakeword process missed {self.wakeword_detector.deadline_misses} frame deadlines")
+                self.wakeword_detector.close()
+            if self.endpointer is not None:
+                stats = self.endpointer.stats()
+                logger.info(f"Speculative endpointing: {stats['hits']} hits, {stats['misses']} misses "
+                            f"({stats['hit_rate']:.0%}), {stats['saved']:.1f}s saved, "
+                            f"speculating after {stats['pause']:.2f}s")
+            tts_model = self.tts_model
+            if tts_model is not None and not isinstance(tts_model, asyncio.Future) and tts_model.cache is not None:
+                logger.info(f"TTS cache: {tts_model.cache.stats()}")
+            if self.remote is not None:
+                await self.remote.close()
+            if self.arbiter is not None:
+                await self.arbiter.close()
 
 
 async def run_mic():
-    """Run the assistant using the mic."""
-
-    pa = pyaudio.PyAudio()
-    loop = asyncio.get_event_loop()
-    executor = ThreadPoolExecutor()
-
-    mic_stream = pa.open(format=FORMAT, channels=CHANNELS, rate=RATE,
-                         input=True, frames_per_buffer=CHUNK, stream_callback=_mic_callback)
-    mic_stream.start_stream()
-
-    logger.info("Waiting for wake word...")
-
-    while mic_stream.is_active():
-        await asyncio.sleep(0.1)
-
-    logger.info("Mic stream closed...")
-
-    mic_stream.stop_stream()
-    mic_stream.close()
-    pa.terminate()
+    """
+    Run the assistant using the mic.
+    Listening starts as soon as the wakeword detector is up, while the heavier
+    models keep loading concurrently in the background.
+    """
+
+    startup = Startup()
+    components.start_metrics_export()
+    tracer = Tracer(components.TRACE_FILE or None)
+    wakeword_future = startup.load("wakeword", components.load_wakeword_detector)
+    playback_future = startup.load("playback", components.load_playback_manager)
+    wakeword_detector, playback_manager = await asyncio.gather(wakeword_future, playback_future)
+
+    arbiter = None
+    if ARBITRATION:
+        from server.client import ArbiterClient
+
+        arbiter = ArbiterClient(ARBITER_HOST, ARBITER_PORT, client_id=socket.gethostname())
+
+    if USE_SERVER:
+        # thin client, only capture, wakeword and playback run here
+        from server.client import InferenceClient
+
+        pipeline = AssistantPipeline(
+            wakeword_detector, playback_manager,
+            remote=InferenceClient(SERVER_HOST, SERVER_PORT, client_id=socket.gethostname(), codec=AUDIO_CODEC,
+                                   jitter_buffer=AUDIO_JITTER_BUFFER, packet_length=AUDIO_PACKET_LENGTH), tracer=tracer,
+            arbiter=arbiter, routes=components.wakeword_routes())
+    else:
+        pipeline = AssistantPipeline(
+            wakeword_detector, playback_manager,
+            stt_model=startup.load("stt", components.load_stt_model),
+            command_processor=startup.load("agent", components.load_command_processor),
+            tts_model=startup.load("tts", components.load_tts_model),
+            streaming_stt=components.STT_STREAMING, tracer=tracer, arbiter=arbiter,
+            routes=components.wakeword_routes())
+
+    startup.mark("listening")
+    report = asyncio.create_task(startup.report())
+    try:
+        await pipeline.run()
+    finally:
+        report.cancel()
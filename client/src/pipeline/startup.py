@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Reference point for the startup timings, set when this module is first imported
+PROCESS_START = time.perf_counter()
+
+
+class Startup:
+    """
+    Load independent components concurrently in background threads, and keep a
+    per-component timing breakdown relative to process start.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        """
+        :param max_workers: Maximum number of components loaded at the same time.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self.timings = {}  # name -> (start, end) in seconds since process start
+        self.pending = []
+
+    def load(self, name: str, loader, *args) -> asyncio.Future:
+        """
+        Start loading a component in the background.
+
+        :param name: Name of the component in the timing report.
+        :param loader: Function that loads and returns the component.
+        :param args: Arguments for the loader.
+        :return: A future resolving to the loaded component.
+        """
+
+        def timed_load():
+            start = time.perf_counter()
+            component = loader(*args)
+            end = time.perf_counter()
+            self.timings[name] = (start - PROCESS_START, end - PROCESS_START)
+            logger.info(f"Loaded {name} in {end - start:.2f}s")
+            return component
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, timed_load)
+        self.pending.append(future)
+        return future
+
+    def mark(self, name: str):
+        """
+        Record a startup milestone, like when listening starts.
+
+        :param name: Name of the milestone in the timing report.
+        """
+        now = time.perf_counter() - PROCESS_START
+        self.timings[name] = (now, now)
+
+    async def report(self):
+        """Wait for every component to finish loading, then log the timing breakdown."""
+
+        results = await asyncio.gather(*self.pending, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+        lines = [f"  {name:<20} {start:7.2f}s -> {end:7.2f}s ({end - start:.2f}s)"
+                 for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1])]
+        failed = sum(isinstance(result, BaseException) for result in results)
+        logger.info(f"Startup finished after {time.perf_counter() - PROCESS_START:.2f}s"
+                    + (f", {failed} component(s) failed" if failed else "") + ":\n" + "\n".join(lines))
@@ -0,0 +1,36 @@
+from config import logging_config
+logging_config.configure_logging()
+
+import asyncio
+import config
+from pipeline import components
+from server.server import InferenceServer
+from server.arbiter import ArbiterServer, WakewordArbiter
+
+if __name__ == "__main__":
+    crumbot_config = config.get_config()
+    components.start_metrics_export()
+
+    # the server handles concurrent clients, so it always uses batched STT
+    server = InferenceServer(
+        components.load_stt_model(streaming=False),
+        components.load_command_processor(),
+        components.load_tts_model(),
+        max_batch_size=crumbot_config["stt_max_batch_size"],
+        max_batch_wait=crumbot_config["stt_max_batch_wait"],
+        packet_length=crumbot_config["audio_packet_length"]
+    )
+
+    services = [server.serve(crumbot_config["server_host"], crumbot_config["server_port"])]
+    if crumbot_config["arbitration"]:
+        # the devices in the room share this server, so it arbitrates between them too
+        arbiter = ArbiterServer(WakewordArbiter(crumbot_config["arbitration_window"]))
+        services.append(arbiter.serve(crumbot_config["arbiter_host"], crumbot_config["arbiter_port"]))
+
+    async def serve():
+        await asyncio.gather(*services)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\nExiting...")
@@ -0,0 +1,170 @@
+"""
+Wakeword arbitration between the devices in a room.
+
+When several devices hear the wake word at once, each one sends a claim with
+how well it heard it. Claims that arrive within a short window of each other
+are one round, and only the device with the best claim goes on with the turn,
+the others drop it. Run standalone with:
+
+    python -m server.arbiter
+"""
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+from . import protocol
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Round:
+    """Claims on one utterance of the wake word."""
+    started: float
+    claims: dict[str, tuple[float, float]] = field(default_factory=dict)  # device -> (score, snr)
+    decided: asyncio.Future = field(default_factory=asyncio.Future)  # resolves to the winning device
+
+
+class WakewordArbiter:
+    """
+    Decides which device answers a wake word heard by several of them.
+
+    The first claim opens a round, and the claims that arrive within `window`
+    seconds of it join the round. Then the device with the highest wakeword
+    score wins, with the signal-to-noise ratio breaking ties. A claim that
+    arrives after the round was decided but within `hold` seconds of its start
+    loses too, since it's a slow device hearing the same utterance.
+    """
+
+    def __init__(self, window: float = 0.15, hold: float = 1.0):
+        """
+        :param window: Seconds claims are collected for after the first one.
+        :param hold: Seconds after the first claim during which claims still belong to the same round.
+        """
+        self.window = window
+        self.hold = hold
+        self.round = None
+        self.rounds = 0
+        self.claims = 0
+
+    async def claim(self, device: str, score: float, snr: float) -> bool:
+        """
+        Claim the wake word for a device.
+
+        :param device: ID of the device.
+        :param score: The device's wakeword score.
+        :param snr: The device's signal-to-noise ratio in dB, for ties.
+        :return: If the device won and should go on with the turn.
+        """
+        now = time.monotonic()
+        self.claims += 1
+
+        current = self.round
+        if current is not None and now - current.started < self.hold:
+            if current.decided.done():
+                logger.debug(f"Late claim from {device}, {current.decided.result()} already answered")
+                return False
+        else:
+            current = self.round = Round(now)
+            self.rounds += 1
+            asyncio.get_running_loop().call_later(self.window, self._decide, current)
+
+        current.claims[device] = (score, snr)
+        return await asyncio.shield(current.decided) == device
+
+    def _decide(self, current: Round):
+        winner = max(current.claims, key=lambda device: current.claims[device])
+        if len(current.claims) > 1:
+            logger.info(f"{winner} answers the wake word, out of {len(current.claims)} devices: {current.claims}")
+        current.decided.set_result(winner)
+
+
+class ArbiterServer:
+    """Serves a WakewordArbiter to devices over a local socket."""
+
+    def __init__(self, arbiter: WakewordArbiter):
+        """
+        :param arbiter: The arbiter to serve.
+        """
+        self.arbiter = arbiter
+
+    async def _claim(self, writer: asyncio.StreamWriter, device: str, header: dict):
+        won = await self.arbiter.claim(device, float(header["score"]), float(header.get("snr", 0.0)))
+        try:
+            await protocol.write_message(writer, {"type": protocol.ARBITRATION, "turn": header["turn"], "won": won})
+        except ConnectionError as e:
+            logger.debug(f"Failed to send arbitration to {device}: {e}")
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one device's connection."""
+
+        device = str(writer.get_extra_info("peername"))
+        tasks = set()
+        try:
+            while True:
+                header, _ = await protocol.read_message(reader)
+
+                match header["type"]:
+                    case protocol.HELLO:
+                        device = header.get("client_id", device)
+                        logger.info(f"Device connected for arbitration: {device}")
+                    case protocol.CLAIM:
+                        task = asyncio.create_task(self._claim(writer, device, header))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    case _:
+                        raise protocol.ProtocolError(f"Unknown message type: {header['type']}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.info(f"Device disconnected from arbitration: {device}")
+        except (protocol.ProtocolError, ValueError, KeyError) as e:
+            logger.error(f"Protocol error from {device}: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def start(self, host: str, port: int) -> asyncio.Server:
+        """
+        Start listening for devices.
+
+        :param host: Address to listen on.
+        :param port: Port to listen on, 0 for any free port.
+        :return: The listening server.
+        """
+        return await asyncio.start_server(self._handle_client, host, port)
+
+    async def serve(self, host: str, port: int):
+        """
+        Serve devices until cancelled.
+
+        :param host: Address to listen on.
+        :param port: Port to listen on.
+        """
+        server = await self.start(host, port)
+        logger.info(f"Wakeword arbiter listening on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            logger.info(f"Arbitrated {self.arbiter.claims} claims in {self.arbiter.rounds} rounds")
+
+
+if __name__ == "__main__":
+    import config
+    from config import logging_config
+
+    crumbot_config = config.get_config()
+
+    parser = argparse.ArgumentParser(description="Run the wakeword arbiter for the devices in a room.")
+    parser.add_argument("--host", default=crumbot_config["arbiter_host"])
+    parser.add_argument("--port", type=int, default=crumbot_config["arbiter_port"])
+    parser.add_argument("--window", type=float, default=crumbot_config["arbitration_window"])
+    args = parser.parse_args()
+
+    logging_config.configure_logging()
+    try:
+        asyncio.run(ArbiterServer(WakewordArbiter(args.window)).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nExiting...")
@@ -0,0 +1,318 @@
+import asyncio
+import logging
+from typing import AsyncIterator
+import numpy as np
+
+from . import protocol
+from .codec import available_codecs, make_codec
+from .transport import AudioPacketizer, JitterBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceClient:
+    """
+    Thin client for an InferenceServer. Streams prompts to the server while
+    they're spoken and yields the server's responses for each turn. Turns run
+    one at a time per connection. Audio is encoded with the preferred codec if
+    the server supports it, and the response audio goes through a jitter buffer.
+    """
+
+    def __init__(self, host: str, port: int, client_id: str, codec: str = "pcm", jitter_buffer: float = 0.1,
+                 packet_length: float = 0.1):
+        """
+        :param host: Address of the server.
+        :param port: Port of the server.
+        :param client_id: ID of this client, the server keeps a conversation per ID.
+        :param codec: Preferred audio codec, "pcm" (raw), "adpcm" or "opus". Raw audio is used if
+            the server doesn't support it.
+        :param jitter_buffer: Seconds of response audio to buffer before it's played.
+        :param packet_length: Seconds of prompt audio per packet.
+        """
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.codecs = list(dict.fromkeys([codec, "pcm"]))
+        if codec not in available_codecs():
+            logger.warning(f"Audio codec {codec} is unavailable here, using pcm.")
+            self.codecs = ["pcm"]
+        self.jitter_buffer = jitter_buffer
+        self.packet_length = packet_length
+        self.codec = "pcm"  # picked by the server
+        self.writer = None
+        self.reader_task = None
+        self.connect_lock = asyncio.Lock()  # the warm-up and the prompt may both connect first
+        self.turns = {}  # turn id -> queue of the messages for the turn
+        # turn id, packetizer and audio not sent yet of the prompt being streamed on this connection
+        self.prompt = None
+        # of the audio sent and received so far
+        self.stats = {"sent_bytes": 0, "sent_seconds": 0.0, "encode_time": 0.0, "received_bytes": 0,
+                      "received_seconds": 0.0, "decode_time": 0.0, "packets_lost": 0, "packets_late": 0}
+
+    async def connect(self):
+        """Connect to the server if not connected yet."""
+
+        async with self.connect_lock:
+            if self.writer is not None and not self.writer.is_closing():
+                return
+
+            self.prompt = None  # streamed on the old connection
+            reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            await protocol.write_message(
+                self.writer, {"type": protocol.HELLO, "client_id": self.client_id, "codecs": self.codecs})
+            header, _ = await protocol.read_message(reader)
+            if header["type"] != protocol.HELLO:
+                raise protocol.ProtocolError(f"Expected a hello from the server, got {header['type']}.")
+            self.codec = header["codec"]
+            self.reader_task = asyncio.create_task(self._read(reader))
+        logger.info(f"Connected to inference server at {self.host}:{self.port}, audio codec {self.codec}")
+
+    async def _read(self, reader: asyncio.StreamReader):
+        """
+        Hand the server's messages to the turns waiting for them, so a turn can
+        stop waiting at any time without leaving a message half read.
+        """
+        try:
+            while True:
+                header, payload = await protocol.read_message(reader)
+                queue = self.turns.get(header.get("turn"))
+                if queue is not None:
+                    queue.put_nowait((header, payload))
+                # else leftovers from a cancelled turn
+        except (OSError, asyncio.IncompleteReadError, protocol.ProtocolError) as e:
+            self.writer.close()
+            for queue in self.turns.values():
+                queue.put_nowait((None, e))
+
+    async def send_audio(self, turn_id: int, audio_data: np.ndarray):
+        """
+        Stream a piece of a turn's prompt to the server while it's spoken, so
+        only the last packet is left to send once it ends. The audio is sent in
+        packets once there's enough of it.
+
+        :param turn_id: ID of the turn.
+        :param audio_data: The next piece of the prompt as 16 kHz int16 audio.
+        """
+        try:
+            await self.connect()
+            if self.prompt is None or self.prompt[0] != turn_id:
+                self.prompt = (turn_id, AudioPacketizer(make_codec(self.codec, 16000), self.packet_length),
+                               np.zeros(0, dtype=np.int16))
+            _, packetizer, pending = self.prompt
+            pending = np.concatenate((pending, audio_data))
+            while len(pending) >= packetizer.packet_samples:
+                await self._send_packet(turn_id, packetizer, pending[:packetizer.packet_samples])
+                pending = pending[packetizer.packet_samples:]
+            self.prompt = (turn_id, packetizer, pending)
+        except (OSError, protocol.ProtocolError) as e:
+            logger.error(f"Lost connection to inference server: {e}")
+            await self.close()
+
+    async def _send_packet(self, turn_id: int, packetizer: AudioPacketizer, audio_data: np.ndarray):
+        """Encode a packet of prompt audio and send it."""
+
+        # off the event loop, encoding isn't free for every codec
+        encode_time = packetizer.encode_time
+        seq, samples, payload = await asyncio.to_thread(packetizer.encode, audio_data)
+        await protocol.write_message(
+            self.writer, {"type": protocol.AUDIO, "turn": turn_id, "seq": seq, "samples": samples}, payload)
+        self.stats["sent_bytes"] += len(payload)
+        self.stats["sent_seconds"] += samples / 16000
+        self.stats["encode_time"] += packetizer.encode_time - encode_time
+
+    async def run_turn(self, turn_id: int, prompt_audio: np.ndarray | None = None, session: str | None = None,
+                       voice: str | None = None) -> AsyncIterator[tuple[dict, bytes]]:
+        """
+        End a turn's prompt and yield the server's responses until the turn
+        ends. A turn that is given up on before that is cancelled on the server.
+
+        :param turn_id: ID of the turn.
+        :param prompt_audio: The rest of the prompt as 16 kHz int16 audio, if it wasn't all streamed already.
+        :param session: The conversation to continue, this client's own if not given.
+        :param voice: TTS voice to answer in, the server's if not given.
+        :return: An async iterator of (header, payload) messages.
+        """
+        header = {"type": protocol.TURN, "turn": turn_id}
+        if session is not None:
+            header["session"] = session
+        if voice is not None:
+            header["voice"] = voice
+        queue = asyncio.Queue()
+        self.turns[turn_id] = queue
+        jitter_buffer = None
+        ended = False
+        try:
+            if prompt_audio is not None:
+                await self.send_audio(turn_id, prompt_audio)
+            if self.prompt is None or self.prompt[0] != turn_id:
+                raise protocol.ProtocolError("The prompt's audio was lost with the connection.")
+            _, packetizer, pending = self.prompt
+            self.prompt = None
+            if len(pending):
+                await self._send_packet(turn_id, packetizer, pending)
+            await protocol.write_message(self.writer, header)
+            jitter_buffer = JitterBuffer(make_codec(self.codec, 24000), self.jitter_buffer)
+
+            while True:
+                header, payload = await queue.get()
+                if header is None:
+                    raise payload  # the connection was lost
+                if header["type"] == protocol.AUDIO:
+                    # decoded back into raw audio once it's its turn to play, off the event loop too
+                    ready = await asyncio.to_thread(jitter_buffer.push, header["seq"], header["samples"], payload)
+                    for audio_data in ready:
+                        yield {"type": protocol.AUDIO, "turn": turn_id, "rate": header["rate"]}, audio_data.tobytes()
+                    continue
+                if header["type"] == protocol.END:
+                    ended = True
+                    for audio_data in jitter_buffer.flush():
+                        yield {"type": protocol.AUDIO, "turn": turn_id, "rate": jitter_buffer.codec.rate}, \
+                            audio_data.tobytes()
+                    return
+                yield header, payload
+        except (OSError, asyncio.IncompleteReadError, protocol.ProtocolError) as e:
+            logger.error(f"Lost connection to inference server: {e}")
+            await self.close()
+            yield {"type": protocol.ERROR, "turn": turn_id, "message": str(e)}, b""
+        finally:
+            self.turns.pop(turn_id, None)
+            if not ended:
+                await self.cancel(turn_id)
+            self._update_stats(jitter_buffer)
+
+    def _update_stats(self, jitter_buffer: JitterBuffer | None):
+        """Add the audio received in a finished turn to the stats."""
+
+        if jitter_buffer is not None:
+            self.stats["received_bytes"] += jitter_buffer.bytes
+            self.stats["received_seconds"] += jitter_buffer.samples / jitter_buffer.codec.rate
+            self.stats["decode_time"] += jitter_buffer.decode_time
+            self.stats["packets_lost"] += jitter_buffer.lost
+            self.stats["packets_late"] += jitter_buffer.late
+
+    async def cancel(self, turn_id: int):
+        """
+        Ask the server to stop working on a turn, or to drop its prompt if it's still being streamed.
+
+        :param turn_id: ID of the turn.
+        """
+        if self.prompt is not None and self.prompt[0] == turn_id:
+            self.prompt = None
+        if self.writer is None or self.writer.is_closing():
+            return
+        try:
+            await protocol.write_message(self.writer, {"type": protocol.CANCEL, "turn": turn_id})
+        except OSError as e:
+            logger.warning(f"Failed to cancel turn {turn_id}: {e}")
+
+    async def warm_up(self, session: str | None = None):
+        """
+        Tell the server a prompt is coming, so it can warm up the LLM.
+
+        :param session: The conversation the prompt continues, this client's own if not given.
+        """
+        header = {"type": protocol.WARM_UP}
+        if session is not None:
+            header["session"] = session
+        try:
+            await self.connect()
+            await protocol.write_message(self.writer, header)
+        except (OSError, protocol.ProtocolError) as e:
+            logger.warning(f"Failed to request warm-up: {e}")
+
+    async def close(self):
+        """Close the connection."""
+
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.writer = None
+        self.reader_task = None
+        self.prompt = None
+
+
+class ArbiterClient:
+    """
+    Client for a wakeword arbiter, which decides which of the devices that
+    heard the wake word answers it. If the arbiter can't be reached in time,
+    the device answers, so it keeps working on its own.
+    """
+
+    def __init__(self, host: str, port: int, client_id: str, timeout: float = 0.5):
+        """
+        :param host: Address of the arbiter.
+        :param port: Port of the arbiter.
+        :param client_id: ID of this device.
+        :param timeout: Seconds to wait for the arbiter's decision.
+        """
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.timeout = timeout
+        self.writer = None
+        self.reader_task = None
+        self.pending = {}  # turn id -> future of the decision
+
+    async def connect(self):
+        """Connect to the arbiter if not connected yet."""
+
+        if self.writer is not None and not self.writer.is_closing():
+            return
+
+        reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        await protocol.write_message(self.writer, {"type": protocol.HELLO, "client_id": self.client_id})
+        self.reader_task = asyncio.create_task(self._read(reader))
+        logger.info(f"Connected to wakeword arbiter at {self.host}:{self.port}")
+
+    async def _read(self, reader: asyncio.StreamReader):
+        """Hand the arbiter's decisions to the claims waiting for them."""
+        try:
+            while True:
+                header, _ = await protocol.read_message(reader)
+                future = self.pending.pop(header.get("turn"), None)
+                if header["type"] == protocol.ARBITRATION and future is not None and not future.done():
+                    future.set_result(bool(header["won"]))
+        except (OSError, asyncio.IncompleteReadError, protocol.ProtocolError) as e:
+            logger.warning(f"Lost connection to wakeword arbiter: {e}")
+            self.writer.close()
+
+    async def claim(self, turn_id: int, score: float, snr: float) -> bool:
+        """
+        Claim the wake word for a turn.
+
+        :param turn_id: ID of the turn.
+        :param score: The wakeword score.
+        :param snr: Signal-to-noise ratio of the wake word in dB.
+        :return: If this device should go on with the turn.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending[turn_id] = future
+        try:
+            await asyncio.wait_for(self.connect(), self.timeout)
+            await protocol.write_message(
+                self.writer, {"type": protocol.CLAIM, "turn": turn_id, "score": score, "snr": snr})
+            return await asyncio.wait_for(future, self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.warning(f"Wakeword arbitration failed, answering anyway: {e!r}")
+            return True
+        finally:
+            self.pending.pop(turn_id, None)
+
+    async def close(self):
+        """Close the connection."""
+
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.writer = None
+        self.reader_task = None
@@ -0,0 +1,201 @@
+"""
+Audio codecs for the connection to the inference server.
+
+Every codec encodes int16 mono audio into packets that can be decoded on
+their own, given the number of samples in them, so a lost packet doesn't
+break the ones after it. Encoders and decoders are made per stream, since
+some codecs keep state between the packets of a stream.
+"""
+import logging
+import struct
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class AudioCodec:
+    """Raw int16 audio, the baseline the other codecs compress."""
+
+    name = "pcm"
+
+    def __init__(self, rate: int):
+        """
+        :param rate: Sample rate of the stream.
+        """
+        self.rate = rate
+
+    def encode(self, audio_data: np.ndarray) -> bytes:
+        """
+        Encode a packet.
+
+        :param audio_data: The packet's audio as int16.
+        :return: The encoded packet.
+        """
+        return audio_data.astype(np.int16).tobytes()
+
+    def decode(self, data: bytes, samples: int) -> np.ndarray:
+        """
+        Decode a packet.
+
+        :param data: The encoded packet.
+        :param samples: Number of samples in the packet.
+        :return: The packet's audio as int16.
+        """
+        return np.frombuffer(data, dtype=np.int16)[:samples]
+
+
+# IMA ADPCM quantizer steps, and how the step index moves after each code
+ADPCM_STEPS = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88, 97,
+    107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796,
+    876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871,
+    5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623,
+    27086, 29794, 32767]
+ADPCM_INDEX_STEPS = [-1, -1, -1, -1, 2, 4, 6, 8] * 2
+# the predictor and step index a packet starts from
+ADPCM_HEADER = struct.Struct(">hBx")
+
+
+class ADPCMCodec(AudioCodec):
+    """
+    IMA ADPCM in pure Python: 4 bits per sample, a quarter of raw audio.
+    Each packet starts with the encoder's state, so it decodes on its own.
+    """
+
+    name = "adpcm"
+
+    def __init__(self, rate: int):
+        super().__init__(rate)
+        self.predictor = 0
+        self.index = 0
+
+    def encode(self, audio_data: np.ndarray) -> bytes:
+        predictor, index = self.predictor, self.index
+        header = ADPCM_HEADER.pack(predictor, index)
+        codes = bytearray((len(audio_data) + 1) // 2)
+
+        for i, sample in enumerate(audio_data.tolist()):
+            step = ADPCM_STEPS[index]
+            difference = sample - predictor
+            code = 0
+            if difference < 0:
+                code = 8
+                difference = -difference
+            delta = step >> 3
+            if difference >= step:
+                code |= 4
+                difference -= step
+                delta += step
+            step >>= 1
+            if difference >= step:
+                code |= 2
+                difference -= step
+                delta += step
+            step >>= 1
+            if difference >= step:
+                code |= 1
+                delta += step
+
+            predictor = max(-32768, predictor - delta) if code & 8 else min(32767, predictor + delta)
+            index = min(88, max(0, index + ADPCM_INDEX_STEPS[code]))
+            codes[i >> 1] |= code << ((i & 1) << 2)
+
+        self.predictor, self.index = predictor, index
+        return header + bytes(codes)
+
+    def decode(self, data: bytes, samples: int) -> np.ndarray:
+        predictor, index = ADPCM_HEADER.unpack_from(data)
+        codes = data[ADPCM_HEADER.size:]
+        audio_data = [0] * samples
+
+        for i in range(samples):
+            code = (codes[i >> 1] >> ((i & 1) << 2)) & 15
+            step = ADPCM_STEPS[index]
+            delta = step >> 3
+            if code & 4:
+                delta += step
+            if code & 2:
+                delta += step >> 1
+            if code & 1:
+                delta += step >> 2
+
+            predictor = max(-32768, predictor - delta) if code & 8 else min(32767, predictor + delta)
+            index = min(88, max(0, index + ADPCM_INDEX_STEPS[code]))
+            audio_data[i] = predictor
+
+        return np.array(audio_data, dtype=np.int16)
+
+
+class OpusCodec(AudioCodec):
+    """
+    Opus, through opuslib (and the libopus library). Packets are split into
+    20 ms Opus frames, each prefixed with its length, and the last one is
+    padded with silence.
+    """
+
+    name = "opus"
+
+    def __init__(self, rate: int, bitrate: int = 24000):
+        """
+        :param rate: Sample rate of the stream, one of Opus' 8, 12, 16, 24 or 48 kHz.
+        :param bitrate: Target bits per second.
+        """
+        import opuslib
+
+        super().__init__(rate)
+        self.frame_size = rate // 50
+        self.encoder = opuslib.Encoder(rate, 1, opuslib.APPLICATION_VOIP)
+        self.encoder.bitrate = bitrate
+        self.decoder = opuslib.Decoder(rate, 1)
+
+    def encode(self, audio_data: np.ndarray) -> bytes:
+        frames = -(-len(audio_data) // self.frame_size)
+        padded = np.zeros(frames * self.frame_size, dtype=np.int16)
+        padded[:len(audio_data)] = audio_data
+
+        encoded = bytearray()
+        for frame in padded.reshape(frames, self.frame_size):
+            packet = self.encoder.encode(frame.tobytes(), self.frame_size)
+            encoded += struct.pack(">H", len(packet)) + packet
+        return bytes(encoded)
+
+    def decode(self, data: bytes, samples: int) -> np.ndarray:
+        frames = []
+        offset = 0
+        while offset < len(data):
+            (length,) = struct.unpack_from(">H", data, offset)
+            offset += 2
+            frames.append(np.frombuffer(self.decoder.decode(data[offset:offset + length], self.frame_size),
+                                        dtype=np.int16))
+            offset += length
+        return np.concatenate(frames)[:samples] if frames else np.zeros(samples, dtype=np.int16)
+
+
+CODECS = {codec.name: codec for codec in (AudioCodec, ADPCMCodec, OpusCodec)}
+
+
+def make_codec(name: str, rate: int) -> AudioCodec:
+    """
+    Create a codec for one stream.
+
+    :param name: Name of the codec, "pcm", "adpcm" or "opus".
+    :param rate: Sample rate of the stream.
+    :return: The codec.
+    """
+    if name not in CODECS:
+        raise ValueError(f"Unknown audio codec {name}, expected one of {list(CODECS)}.")
+    return CODECS[name](rate)
+
+
+def available_codecs() -> list[str]:
+    """Get the codecs whose dependencies are installed."""
+
+    available = []
+    for name in CODECS:
+        try:
+            make_codec(name, 16000)
+            available.append(name)
+        except Exception as e:  # opuslib raises a plain Exception without libopus
+            logger.debug(f"Audio codec {name} is unavailable: {e}")
+    return available
@@ -0,0 +1,124 @@
+"""
+Loopback client for the inference server.
+
+Sends a recorded prompt to a running server (or to one started in-process)
+and writes the spoken response to a WAV file, then reports the bandwidth and
+codec time of the audio both ways, e.g.:
+
+    python -m server.loopback prompt.wav --out response.wav
+    python -m server.loopback prompt.wav --codec adpcm
+"""
+import argparse
+import asyncio
+import logging
+import time
+import wave
+import numpy as np
+
+import config
+from config import logging_config
+from . import protocol
+from .client import InferenceClient
+
+logger = logging.getLogger(__name__)
+
+
+def read_prompt(path: str) -> np.ndarray:
+    """Read a mono 16 kHz 16-bit WAV file."""
+    with wave.open(path, "rb") as f:
+        if f.getnchannels() != 1 or f.getsampwidth() != 2 or f.getframerate() != 16000:
+            raise ValueError(f"{path} must be a mono 16-bit WAV file at 16000 Hz.")
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+
+
+def report_audio(stats: dict):
+    """Print the bandwidth and codec time of the audio sent and received."""
+    for direction, time_key in (("sent", "encode_time"), ("received", "decode_time")):
+        seconds = stats[f"{direction}_seconds"]
+        if seconds:
+            print(f"Audio {direction}: {seconds:.1f}s in {stats[f'{direction}_bytes'] / 1024:.1f} KiB "
+                  f"({stats[f'{direction}_bytes'] * 8 / seconds / 1000:.1f} kbit/s), "
+                  f"{time_key.split('_')[0]}d in {stats[time_key] * 1000:.1f} ms")
+    if stats["packets_lost"] or stats["packets_late"]:
+        print(f"Packets lost: {stats['packets_lost']}, late: {stats['packets_late']}")
+
+
+async def run_loopback(prompt_path: str, out_path: str | None, host: str, port: int, in_process: bool,
+                       codec: str = "pcm", jitter_buffer: float = 0.1, packet_length: float = 0.1):
+    """
+    Run one turn against the server and report what came back.
+
+    :param prompt_path: WAV file with the prompt.
+    :param out_path: WAV file to write the response audio to, or None.
+    :param host: Address of the server.
+    :param port: Port of the server.
+    :param in_process: Start a server with the configured models in this process first.
+    :param codec: Audio codec to ask the server for.
+    :param jitter_buffer: Seconds of response audio to buffer before it counts as played.
+    :param packet_length: Seconds of response audio per packet, for the in-process server.
+    """
+    server_task = None
+    if in_process:
+        from pipeline import components
+        from .server import InferenceServer
+
+        server = InferenceServer(
+            components.load_stt_model(streaming=False), components.load_command_processor(),
+            components.load_tts_model(), packet_length=packet_length)
+        server_task = asyncio.create_task(server.serve(host, port))
+        await asyncio.sleep(0.5)
+
+    client = InferenceClient(host, port, client_id="loopback", codec=codec, jitter_buffer=jitter_buffer)
+    audio_segments = []
+    rate = 24000
+
+    start = time.perf_counter()
+    try:
+        async for header, payload in client.run_turn(1, read_prompt(prompt_path)):
+            elapsed = time.perf_counter() - start
+            match header["type"]:
+                case protocol.TRANSCRIPT:
+                    print(f"[{elapsed:.2f}s] Transcript: {header['text']}")
+                case protocol.TEXT:
+                    print(f"[{elapsed:.2f}s] Response: {header['text']}")
+                case protocol.AUDIO:
+                    if not audio_segments:
+                        print(f"[{elapsed:.2f}s] First audio")
+                    rate = header["rate"]
+                    audio_segments.append(np.frombuffer(payload, dtype=np.int16))
+                case protocol.ERROR:
+                    print(f"[{elapsed:.2f}s] Error: {header['message']}")
+        print(f"[{time.perf_counter() - start:.2f}s] Done")
+        report_audio(client.stats)
+    finally:
+        await client.close()
+        if server_task is not None:
+            server_task.cancel()
+
+    if out_path and audio_segments:
+        with wave.open(out_path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(rate)
+            f.writeframes(np.concatenate(audio_segments).tobytes())
+        print(f"Wrote response audio to {out_path}")
+
+
+if __name__ == "__main__":
+    crumbot_config = config.get_config()
+
+    parser = argparse.ArgumentParser(description="Send a recorded prompt to the Crumbot inference server.")
+    parser.add_argument("prompt", help="Mono 16 kHz 16-bit WAV file with the prompt")
+    parser.add_argument("--out", help="WAV file to write the response audio to")
+    parser.add_argument("--host", default=crumbot_config["server_host"])
+    parser.add_argument("--port", type=int, default=crumbot_config["server_port"])
+    parser.add_argument("--in-process", action="store_true",
+                        help="Start a server with the configured models in this process")
+    parser.add_argument("--codec", default=crumbot_config["audio_codec"], help="pcm, adpcm or opus")
+    parser.add_argument("--jitter-buffer", type=float, default=crumbot_config["audio_jitter_buffer"])
+    parser.add_argument("--packet-length", type=float, default=crumbot_config["audio_packet_length"])
+    args = parser.parse_args()
+
+    logging_config.configure_logging()
+    asyncio.run(run_loopback(args.prompt, args.out, args.host, args.port, args.in_process, args.codec,
+                             args.jitter_buffer, args.packet_length))
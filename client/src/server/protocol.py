@@ -0,0 +1,62 @@
+import asyncio
+import json
+import struct
+
+# Every message is a JSON header followed by an optional binary payload:
+# [header length: uint32][payload length: uint32][header][payload]
+PREFIX = struct.Struct(">II")
+
+MAX_HEADER_SIZE = 64 * 1024
+MAX_PAYLOAD_SIZE = 64 * 1024 * 1024
+
+# Client -> server
+HELLO = "hello"  # {"client_id", "codecs"?}, the audio codecs the client supports, best first
+# AUDIO {"turn", "seq", "samples"}, payload: a packet of 16 kHz prompt audio, encoded, streamed while it's spoken
+TURN = "turn"  # {"turn", "session"?, "voice"?}, the end of the prompt streamed in AUDIO messages before it
+CANCEL = "cancel"  # {"turn"}, also drops a prompt that is still being streamed
+WARM_UP = "warm_up"  # {"session"?}, a prompt is coming, load the LLM
+CLAIM = "claim"  # {"turn", "score", "snr"}, to the arbiter: heard the wake word
+
+# Server -> client
+# HELLO {"codec"}, the codec picked from the client's, only in reply to a HELLO with codecs
+TRANSCRIPT = "transcript"  # {"turn", "text"}
+TEXT = "text"  # {"turn", "text"}, a chunk of the response
+AUDIO = "audio"  # {"turn", "rate", "seq", "samples"}, payload: a packet of response audio, encoded
+END = "end"  # {"turn"}, no more messages for this turn
+ERROR = "error"  # {"turn", "message"}
+ARBITRATION = "arbitration"  # {"turn", "won"}, from the arbiter: whether to go on with the turn
+
+
+class ProtocolError(Exception):
+    pass
+
+
+async def write_message(writer: asyncio.StreamWriter, header: dict, payload: bytes = b""):
+    """
+    Write a message and wait until the transport can take more.
+
+    :param writer: The stream to write to.
+    :param header: The message header, must contain a "type".
+    :param payload: Optional binary payload.
+    """
+    header_bytes = json.dumps(header).encode("utf8")
+    writer.write(PREFIX.pack(len(header_bytes), len(payload)) + header_bytes + payload)
+    await writer.drain()
+
+
+async def read_message(reader: asyncio.StreamReader) -> tuple[dict, bytes]:
+    """
+    Read a message.
+
+    :param reader: The stream to read from.
+    :return: The message header and payload.
+    """
+    header_size, payload_size = PREFIX.unpack(await reader.readexactly(PREFIX.size))
+    if header_size > MAX_HEADER_SIZE or payload_size > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Message too large ({header_size} + {payload_size} bytes).")
+
+    header = json.loads(await reader.readexactly(header_size))
+    payload = await reader.readexactly(payload_size) if payload_size else b""
+    if "type" not in header:
+        raise ProtocolError("Message without a type.")
+    return header, payload
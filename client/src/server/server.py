@@ -0,0 +1,234 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from stt.scheduler import BatchingSTTScheduler
+from . import protocol
+from .codec import available_codecs, make_codec
+from .transport import AudioPacketizer, JitterBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceServer:
+    """
+    Hosts the STT, agent and TTS models for any number of thin clients.
+
+    Each client streams its prompts over a local socket while they're spoken,
+    and gets the transcript, response text and synthesized audio streamed back
+    as they are produced. Prompts from concurrent clients are transcribed in
+    shared batches, and the other model calls run in a thread pool, with the
+    agent and the TTS model each used by one turn at a time. Audio goes both
+    ways in the codec picked from the ones the client supports, and the
+    response audio in packets.
+    """
+
+    def __init__(self, stt_model, command_processor, tts_model, max_workers: int = 4,
+                 max_batch_size: int = 8, max_batch_wait: float = 0.05, packet_length: float = 0.1):
+        """
+        Initialize the server with its models.
+
+        :param stt_model: The batched speech-to-text model.
+        :param command_processor: The command processor (agent).
+        :param tts_model: The text-to-speech model.
+        :param max_workers: Number of threads for blocking model calls.
+        :param max_batch_size: Maximum number of prompts transcribed in one batch.
+        :param max_batch_wait: Maximum seconds a prompt waits for its batch to fill up.
+        :param packet_length: Seconds of response audio per packet.
+        """
+        self.stt_model = stt_model
+        self.command_processor = command_processor
+        self.tts_model = tts_model
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="server")
+        # a warm-up can take seconds while the model loads, and mustn't hold up a turn's model calls
+        self.warm_up_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warm_up")
+        self.stt_scheduler = BatchingSTTScheduler(stt_model, max_batch_size, max_batch_wait)
+        self.tts_lock = asyncio.Lock()
+        # the command processor's conversation memory, tool selection and fast path cache are shared by all
+        # clients and aren't thread-safe, so one turn at a time advances its response
+        self.agent_lock = asyncio.Lock()
+        self.packet_length = packet_length
+        self.codecs = available_codecs()
+
+    async def _run_blocking(self, func, *args):
+        """Run a blocking call in the server's thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _next(self, generator):
+        """
+        Advance a blocking generator in the thread pool. If the turn is
+        cancelled meanwhile, the step in flight is waited for before the
+        cancellation goes on, so the generator isn't executing when it's closed.
+
+        :return: The generator's next item, None once it's exhausted.
+        """
+        future = asyncio.get_running_loop().run_in_executor(self.executor, next, generator, None)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # also when cancelled again meanwhile, like when the client disconnects after cancelling
+            while not future.done():
+                try:
+                    await asyncio.wait([future])
+                except asyncio.CancelledError:
+                    pass
+            if not future.cancelled():
+                future.exception()  # retrieved, it doesn't matter anymore
+            raise
+
+    async def _run_turn(self, send, client_id: str, turn_id: int, prompt_audio: np.ndarray, codec: str,
+                        session: str | None = None, voice: str | None = None):
+        """
+        Process a prompt and stream the results back to the client.
+
+        :param send: Coroutine function that sends a message to the client.
+        :param client_id: The client's ID, used as the conversation thread.
+        :param turn_id: The client's ID for the turn.
+        :param prompt_audio: The prompt as 16 kHz int16 audio.
+        :param codec: Name of the codec of the client's audio, the response is encoded with the same one.
+        :param session: The conversation to continue instead of the client's, like a user's across devices.
+        :param voice: TTS voice to answer in, the default one if not given.
+        """
+        try:
+            packetizer = AudioPacketizer(make_codec(codec, 24000), self.packet_length)
+
+            transcription = await self.stt_scheduler.transcribe(prompt_audio)
+            logger.info(f"[{client_id}] Transcription: {transcription}")
+            await send({"type": protocol.TRANSCRIPT, "turn": turn_id, "text": transcription})
+
+            response = self.command_processor.process_prompt(transcription, session=session or client_id)
+            try:
+                while True:
+                    async with self.agent_lock:
+                        chunk = await self._next(response)
+                    if chunk is None:
+                        break
+                    if not chunk:
+                        continue
+                    logger.info(f"[{client_id}] AI: {chunk}")
+                    await send({"type": protocol.TEXT, "turn": turn_id, "text": chunk})
+                    await self._speak(send, turn_id, chunk, packetizer, voice)
+            finally:
+                response.close()
+        except asyncio.CancelledError:
+            logger.info(f"[{client_id}] Turn {turn_id} cancelled.")
+        except Exception as e:
+            logger.exception(f"[{client_id}] Turn {turn_id} failed")
+            await send({"type": protocol.ERROR, "turn": turn_id, "message": str(e)})
+        finally:
+            await send({"type": protocol.END, "turn": turn_id})
+
+    async def _speak(self, send, turn_id: int, text: str, packetizer: AudioPacketizer, voice: str | None = None):
+        """Synthesize text and stream the audio to the client in packets."""
+
+        segments = self.tts_model.synthesize(text, voice)
+        try:
+            while True:
+                async with self.tts_lock:
+                    segment = await self._next(segments)
+                if segment is None:
+                    break
+                for packet in packetizer.split(segment):
+                    seq, samples, payload = await self._run_blocking(packetizer.encode, packet)
+                    await send({"type": protocol.AUDIO, "turn": turn_id, "rate": 24000, "seq": seq,
+                                "samples": samples}, payload)
+        finally:
+            segments.close()
+
+    @staticmethod
+    def _warm_up_done(future: asyncio.Future):
+        """Log a warm-up that failed, instead of losing its exception."""
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("LLM warm-up failed", exc_info=future.exception())
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one client connection."""
+
+        peer = writer.get_extra_info("peername")
+        client_id = str(peer)
+        turns = {}
+        prompts = {}  # turn id -> jitter buffer and decoded audio of the prompt being streamed
+        send_lock = asyncio.Lock()
+        codec = "pcm"  # until the client asks for another codec
+
+        async def send(header: dict, payload: bytes = b""):
+            async with send_lock:
+                if writer.is_closing():
+                    return  # the client is gone, drop the rest of the turn
+                try:
+                    await protocol.write_message(writer, header, payload)
+                except ConnectionError as e:
+                    logger.debug(f"Failed to send to {client_id}: {e}")
+
+        logger.info(f"Client connected: {peer}")
+        try:
+            while True:
+                header, payload = await protocol.read_message(reader)
+
+                match header["type"]:
+                    case protocol.HELLO:
+                        client_id = header.get("client_id", client_id)
+                        logger.info(f"Client {peer} is {client_id}")
+                        if "codecs" in header:
+                            codec = next((name for name in header["codecs"] if name in self.codecs), "pcm")
+                            await send({"type": protocol.HELLO, "codec": codec})
+                            logger.info(f"Audio codec for {client_id}: {codec}")
+                    case protocol.AUDIO:
+                        turn_id = header["turn"]
+                        if turn_id not in prompts:
+                            # a client streams one prompt at a time, any other was abandoned
+                            prompts.clear()
+                            prompts[turn_id] = (JitterBuffer(make_codec(codec, 16000), target=0), [])
+                        jitter_buffer, prompt = prompts[turn_id]
+                        # decoded as it arrives, so only the last packet is left once the prompt ends
+                        prompt += await self._run_blocking(
+                            jitter_buffer.push, header["seq"], header["samples"], payload)
+                    case protocol.TURN:
+                        turn_id = header["turn"]
+                        jitter_buffer, prompt = prompts.pop(turn_id, (None, []))
+                        if jitter_buffer is not None:
+                            prompt += jitter_buffer.flush()
+                        prompt_audio = np.concatenate(prompt) if prompt else np.zeros(0, dtype=np.int16)
+                        task = asyncio.create_task(self._run_turn(
+                            send, client_id, turn_id, prompt_audio, codec, header.get("session"),
+                            header.get("voice")))
+                        turns[turn_id] = task
+                        task.add_done_callback(lambda _, turn_id=turn_id: turns.pop(turn_id, None))
+                    case protocol.WARM_UP:
+                        # in the background, the prompt will queue behind it on Ollama anyway
+                        warm_up = asyncio.get_running_loop().run_in_executor(
+                            self.warm_up_executor, self.command_processor.warm_up,
+                            header.get("session") or client_id, "wakeword")
+                        warm_up.add_done_callback(self._warm_up_done)
+                    case protocol.CANCEL:
+                        prompts.pop(header["turn"], None)
+                        task = turns.get(header["turn"])
+                        if task is not None:
+                            task.cancel()
+                    case _:
+                        raise protocol.ProtocolError(f"Unknown message type: {header['type']}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.info(f"Client disconnected: {client_id}")
+        except (protocol.ProtocolError, ValueError, KeyError) as e:
+            logger.error(f"Protocol error from {client_id}: {e}")
+        finally:
+            for task in list(turns.values()):
+                task.cancel()
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        """
+        Serve clients until cancelled.
+
+        :param host: Address to listen on.
+        :param port: Port to listen on.
+        """
+        server = await asyncio.start_server(self._handle_client, host, port)
+        logger.info(f"Inference server listening on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            logger.info(f"STT scheduler: {self.stt_scheduler.stats()}")
+            await self.stt_scheduler.close()
@@ -0,0 +1,177 @@
+"""
+Streaming audio between the clients and the inference server.
+
+The sender splits a stream into sequence-numbered packets encoded with a
+codec, and the receiver puts them back in order in a jitter buffer, which
+holds back the start of the stream until enough audio is buffered that
+packets arriving late don't cut into playback.
+
+Over the TCP connection to the server packets always arrive in order and
+none are lost, so the jitter buffer's reordering and covering of lost packets
+with silence never come into play. They are there for a datagram transport,
+and bench.transport exercises them over a simulated lossy link.
+"""
+import time
+from typing import Iterator
+
+import numpy as np
+
+from utils.metrics import registry
+from .codec import AudioCodec
+
+
+def _audio_metrics(codec: str, direction: str):
+    """The bandwidth counters of the audio sent or received with a codec."""
+    return (
+        registry.counter("crumbot_audio_bytes_total", "Encoded audio bytes sent to or received from the "
+                         "other end of the inference connection.", codec=codec, direction=direction),
+        registry.counter("crumbot_audio_transported_seconds_total", "Seconds of audio sent to or received from "
+                         "the other end of the inference connection.", codec=codec, direction=direction),
+        registry.counter("crumbot_audio_codec_seconds_total", "Time spent encoding or decoding audio.",
+                         codec=codec, operation="encode" if direction == "sent" else "decode"),
+    )
+
+
+class AudioPacketizer:
+    """Splits an audio stream into sequence-numbered packets, encoded with a codec."""
+
+    def __init__(self, codec: AudioCodec, packet_length: float = 0.1):
+        """
+        :param codec: The codec for the stream.
+        :param packet_length: Seconds of audio per packet.
+        """
+        self.codec = codec
+        self.packet_samples = max(1, int(packet_length * codec.rate))
+        self.seq = 0
+        self.bytes = 0
+        self.samples = 0
+        self.encode_time = 0.0
+        self.sent_bytes, self.sent_seconds, self.encode_seconds = _audio_metrics(codec.name, "sent")
+
+    def encode(self, audio_data: np.ndarray) -> tuple[int, int, bytes]:
+        """
+        Encode the next packet of the stream.
+
+        :param audio_data: Up to a packet of int16 audio.
+        :return: The packet's sequence number, number of samples and payload.
+        """
+        start = time.perf_counter()
+        payload = self.codec.encode(audio_data)
+        elapsed = time.perf_counter() - start
+
+        seq = self.seq
+        self.seq += 1
+        self.bytes += len(payload)
+        self.samples += len(audio_data)
+        self.encode_time += elapsed
+        self.sent_bytes.inc(len(payload))
+        self.sent_seconds.inc(len(audio_data) / self.codec.rate)
+        self.encode_seconds.inc(elapsed)
+        return seq, len(audio_data), payload
+
+    def split(self, audio_data: np.ndarray) -> Iterator[np.ndarray]:
+        """Split audio into the stream's packets, to encode one by one."""
+        for offset in range(0, len(audio_data), self.packet_samples):
+            yield audio_data[offset:offset + self.packet_samples]
+
+
+class JitterBuffer:
+    """
+    Puts the packets of an audio stream back in order and decodes them.
+    Nothing is released until `target` seconds of audio are buffered, and a
+    packet that still hasn't arrived once `max_reorder` packets after it have
+    is given up on and replaced with silence (only on a lossy transport).
+    """
+
+    def __init__(self, codec: AudioCodec, target: float = 0.1, max_reorder: int = 4):
+        """
+        :param codec: The codec for the stream.
+        :param target: Seconds of audio to buffer before the stream starts.
+        :param max_reorder: Packets that may arrive ahead of a missing one before it counts as lost.
+        """
+        self.codec = codec
+        self.target_samples = int(target * codec.rate)
+        self.max_reorder = max_reorder
+        self.pending = {}  # seq -> (samples, payload) of packets that arrived ahead of a missing one
+        self.next_seq = 0
+        self.held = []  # audio held back until the target is buffered
+        self.held_samples = 0
+        self.started = False
+        self.packet_samples = 0  # of the last packet, lost packets are replaced with this much silence
+
+        self.bytes = 0
+        self.samples = 0
+        self.decode_time = 0.0
+        self.lost = 0
+        self.late = 0  # packets that arrived after they were given up on, or twice
+        self.received_bytes, self.received_seconds, self.decode_seconds = _audio_metrics(codec.name, "received")
+        self.lost_packets = registry.counter("crumbot_audio_packets_lost_total",
+                                             "Audio packets that never arrived, replaced with silence.")
+        self.late_packets = registry.counter("crumbot_audio_packets_late_total",
+                                             "Audio packets that arrived after they were given up on.")
+
+    def push(self, seq: int, samples: int, payload: bytes) -> list[np.ndarray]:
+        """
+        Add a packet that arrived.
+
+        :param seq: The packet's sequence number.
+        :param samples: Number of samples in the packet.
+        :param payload: The encoded packet.
+        :return: The audio that is ready to play, in order.
+        """
+        if seq < self.next_seq or seq in self.pending:
+            self.late += 1
+            self.late_packets.inc()
+            return []
+
+        self.bytes += len(payload)
+        self.received_bytes.inc(len(payload))
+        self.pending[seq] = (samples, payload)
+        return self._hold(self._release(flush=False))
+
+    def flush(self) -> list[np.ndarray]:
+        """
+        End the stream, giving up on the packets that are still missing.
+
+        :return: The rest of the stream's audio.
+        """
+        return self._hold(self._release(flush=True), flush=True)
+
+    def _release(self, flush: bool) -> list[np.ndarray]:
+        """Decode the packets that are next in order, skipping missing ones that are too far behind."""
+
+        audio = []
+        while self.pending:
+            if self.next_seq in self.pending:
+                samples, payload = self.pending.pop(self.next_seq)
+                start = time.perf_counter()
+                audio.append(self.codec.decode(payload, samples))
+                elapsed = time.perf_counter() - start
+                self.decode_time += elapsed
+                self.decode_seconds.inc(elapsed)
+                self.samples += samples
+                self.received_seconds.inc(samples / self.codec.rate)
+                self.packet_samples = samples
+            elif flush or max(self.pending) - self.next_seq >= self.max_reorder:
+                self.lost += 1
+                self.lost_packets.inc()
+                audio.append(np.zeros(self.packet_samples, dtype=np.int16))
+            else:
+                break
+            self.next_seq += 1
+        return audio
+
+    def _hold(self, audio: list[np.ndarray], flush: bool = False) -> list[np.ndarray]:
+        """Hold the audio back until the stream has started."""
+
+        if self.started:
+            return audio
+
+        self.held += audio
+        self.held_samples += sum(len(segment) for segment in audio)
+        if self.held_samples < self.target_samples and not flush:
+            return []
+
+        self.started = True
+        held, self.held = self.held, []
+        return held
@@ -1,3 +1,3 @@
-from .stt import FasterWhisperBatchedSTT
+from .stt import FasterWhisperBatchedSTT, FasterWhisperStreamingSTT
 
-__all__ = ["FasterWhisperBatchedSTT"]
\ No newline at end of file
+__all__ = ["FasterWhisperBatchedSTT", "FasterWhisperStreamingSTT"]
\ No newline at end of file
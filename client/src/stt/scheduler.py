@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from utils.metrics import registry
+from .stt import FasterWhisperBatchedSTT, SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingSTTScheduler:
+    """
+    Gather utterances from concurrent callers into batches for one batched decode.
+
+    A batch is started once `max_batch_size` utterances are waiting, or
+    `max_wait` seconds after the first one arrived, whichever comes first.
+    """
+
+    def __init__(self, stt_model: FasterWhisperBatchedSTT, max_batch_size: int = 8, max_wait: float = 0.05,
+                 report_every: int = 50):
+        """
+        Initialize the scheduler.
+
+        :param stt_model: The batched STT model to run batches on.
+        :param max_batch_size: Maximum number of utterances in a batch.
+        :param max_wait: Maximum seconds an utterance waits for a batch to fill up.
+        :param report_every: Log the scheduler stats every this many batches.
+        """
+        self.stt_model = stt_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.report_every = report_every
+
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt-batch")
+        self.task = None
+
+        self.queue_wait = registry.histogram(
+            "crumbot_stt_queue_wait_seconds", "Time utterances wait for their STT batch to start.",
+            [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5])
+        self.batch_size = registry.histogram(
+            "crumbot_stt_batch_size", "Utterances per STT batch.", [1, 2, 4, 8, 16, 32])
+        self.batches = 0
+        self.utterances = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    async def transcribe(self, audio_data: np.ndarray) -> str:
+        """
+        Transcribe an utterance as part of the next batch.
+
+        :param audio_data: Audio data as a NumPy array in int16 format.
+        :return: Transcription of the audio data as a string.
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((time.perf_counter(), audio_data, future))
+        return await future
+
+    async def _collect_batch(self) -> list:
+        """Wait for the next batch of queued utterances."""
+
+        batch = [await self.queue.get()]
+        deadline = batch[0][0] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        """Run batches until cancelled."""
+
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            batch = [item for item in batch if not item[2].cancelled()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            for enqueued, _, _ in batch:
+                self.queue_wait.observe(start - enqueued)
+            self.batch_size.observe(len(batch))
+
+            audios = [audio for _, audio, _ in batch]
+            try:
+                transcriptions = await loop.run_in_executor(
+                    self.executor, self.stt_model.transcribe_batch, audios)
+            except Exception as e:
+                logger.exception("Batched transcription failed")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, _, future), transcription in zip(batch, transcriptions):
+                if not future.done():
+                    future.set_result(transcription)
+
+            self.busy_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.utterances += len(batch)
+            self.audio_seconds += sum(len(audio) for audio in audios) / SAMPLE_RATE
+
+            if self.batches % self.report_every == 0:
+                logger.info(f"STT scheduler: {self.stats()}")
+
+    def stats(self) -> dict:
+        """
+        Get the scheduler's statistics.
+
+        :return: A dictionary with the queue wait and batch size histograms, and throughput.
+        """
+        return {
+            "batches": self.batches,
+            "utterances": self.utterances,
+            "queue_wait": self.queue_wait.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+            "utterances_per_second": self.utterances / self.busy_seconds if self.busy_seconds else 0.0,
+            "realtime_factor": self.busy_seconds / self.audio_seconds if self.audio_seconds else 0.0,
+        }
+
+    async def close(self):
+        """Stop the scheduler."""
+
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,12 +1,40 @@
+import bisect
+import logging
 import faster_whisper
 import numpy as np
 
-from utils.audio import int16_to_float32
+from utils.audio import AudioRingBuffer, int16_to_float32
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000  # Whisper expects 16 kHz audio
+CHUNK_LENGTH = 30  # seconds of audio Whisper decodes at once
+FRAMES_PER_SECOND = 100  # Whisper feature frames per second
+
+
+def _normalize_word(word: str) -> str:
+    """
+    Normalize a word so that decodes can be compared regardless of casing and punctuation.
+
+    :param word: The word to normalize.
+    :return: The normalized word.
+    """
+    return "".join(c for c in word.lower() if c.isalnum())
 
 
 class FasterWhisperBatchedSTT:
-    def __init__(self, model_name: str, **model_kwargs):
+    streaming = False
+
+    def __init__(self, model_name: str, decode_options: dict | None = None, **model_kwargs):
+        """
+        Initialize the batched STT model.
+
+        :param model_name: The name of the Faster Whisper model to use.
+        :param decode_options: Options for BatchedInferencePipeline.transcribe(), over the defaults.
+        :param model_kwargs: Additional keyword arguments for model loading.
+        """
         self.model_name = model_name
+        self.decode_options = {"beam_size": 5, "language": "en", **(decode_options or {})}
         self._load_model(model_kwargs)
 
     def _load_model(self, kwargs):
@@ -36,10 +64,246 @@ class FasterWhisperBatchedSTT:
         audio_data = int16_to_float32(audio_data)
 
         # Transcribe the audio data using the loaded model
+        segments, _ = self.model.transcribe(audio_data, **self.decode_options)
+        transcription = "".join([segment.text for segment in segments])
+        return transcription
+
+    def transcribe_batch(self, audio_data: list[np.ndarray], batch_size: int | None = None) -> list[str]:
+        """
+        Transcribe several utterances in one batched decode.
+
+        The utterances are laid out one after another, and each one (split into
+        30 second windows if needed) is passed as its own clip, so every clip is
+        decoded as a separate element of the batch. faster-whisper ignores
+        vad_filter when it's given clips, so it doesn't apply here.
+
+        Segments are matched to their clips by their seek, which faster-whisper
+        1.1 sets to the start of the clip, or else by their start time.
+
+        :param audio_data: List of audio data as NumPy arrays in int16 format.
+        :param batch_size: Maximum number of clips decoded at once, all of them if not given.
+        :return: Transcriptions of the utterances, in the same order.
+        """
+
+        window = CHUNK_LENGTH * SAMPLE_RATE
+        clips = []
+        clip_owners = []  # index of the utterance of each clip
+        offset = 0
+        for index, audio in enumerate(audio_data):
+            for start in range(0, len(audio), window):
+                end = min(start + window, len(audio))
+                clips.append({"start": offset + start, "end": offset + end})
+                clip_owners.append(index)
+            offset += len(audio)
+        clip_starts = [clip["start"] / SAMPLE_RATE for clip in clips]
+        # the same expression faster-whisper uses for a segment's seek
+        clip_seeks = {int(start * FRAMES_PER_SECOND): clip for clip, start in enumerate(clip_starts)}
+
+        transcriptions = [""] * len(audio_data)
+        if not clips:
+            return transcriptions
+
         segments, _ = self.model.transcribe(
-            audio_data,
-            beam_size=5,
-            language="en"
+            int16_to_float32(np.concatenate(audio_data)),
+            clip_timestamps=clips,
+            batch_size=min(len(clips), batch_size or len(clips)),
+            **self.decode_options
         )
-        transcription = "".join([segment.text for segment in segments])
-        return transcription
\ No newline at end of file
+        for segment in segments:
+            clip = clip_seeks.get(segment.seek)
+            if clip is None:
+                # the last clip that starts before the segment, its start time is rounded to milliseconds
+                clip = max(0, bisect.bisect_right(clip_starts, segment.start + 0.001) - 1)
+            transcriptions[clip_owners[clip]] += segment.text
+
+        return transcriptions
+
+
+class FasterWhisperStreamingSTT:
+    """
+    Incremental Faster Whisper transcription using local agreement.
+
+    Audio is inserted while the user is still speaking, and the growing buffer is
+    re-decoded every `min_chunk_length` seconds of new audio. Words that two
+    consecutive decodes agree on are committed, and the buffer is trimmed to the
+    last committed word, so the decode left at the end of speech only covers
+    the uncommitted tail. If the buffer fills up, the last decode's words are
+    committed too, so the start of a long utterance isn't lost.
+    """
+
+    streaming = True
+
+    def __init__(self, model_name: str, min_chunk_length: float = 1.0, buffer_trim_length: float = 3.0,
+                 max_buffer_length: float = 30.0, beam_size: int = 5, **model_kwargs):
+        """
+        Initialize the streaming STT model.
+
+        :param model_name: The name of the Faster Whisper model to use.
+        :param min_chunk_length: Seconds of new audio required before the buffer is decoded again.
+        :param buffer_trim_length: Once the buffer is longer than this many seconds, trim it to the last committed word.
+        :param max_buffer_length: Maximum seconds of audio held for a single utterance, should cover
+            the longest prompt.
+        :param beam_size: Beam size of the decodes.
+        :param model_kwargs: Additional keyword arguments for model loading.
+        """
+        self.model_name = model_name
+        self.min_chunk_samples = int(min_chunk_length * SAMPLE_RATE)
+        self.buffer_trim_samples = int(buffer_trim_length * SAMPLE_RATE)
+        self.audio = AudioRingBuffer(int(max_buffer_length * SAMPLE_RATE))
+        self.beam_size = beam_size
+        self._load_model(model_kwargs)
+        self.reset()
+
+    def _load_model(self, kwargs):
+        """
+        Load the Faster Whisper model for sequential inference.
+        If the model is not available, it will be downloaded.
+
+        :param kwargs: Additional keyword arguments for model loading.
+        """
+
+        if self.model_name not in faster_whisper.available_models():
+            faster_whisper.download_model(
+                self.model_name, **kwargs)
+        self.model = faster_whisper.WhisperModel(
+            self.model_name, **kwargs)
+
+    def reset(self):
+        """Start a new utterance."""
+
+        self.audio.clear()
+        self.buffer_start = 0  # position where the decoded window starts
+        self.last_decode_position = 0
+        self.committed = []  # (start, end, word) with absolute times in seconds
+        self.hypothesis = []  # uncommitted words from the last decode
+        self.overflowed = False  # if audio was dropped undecoded
+
+    def insert_audio(self, audio_data: np.ndarray):
+        """
+        Append audio to the current utterance.
+
+        :param audio_data: Audio data as a NumPy array in int16 format.
+        """
+        overflow = self.audio.position + len(audio_data) - self.buffer_start - self.audio.capacity
+        if overflow > 0:
+            self._make_room(self.buffer_start + overflow)
+        self.audio.write(audio_data)
+
+    def _make_room(self, position: int):
+        """
+        Move the start of the decoded window up to a position before the audio
+        there is overwritten, by trimming the buffer to the last committed word,
+        and then to the last decode's words, committing them as they are.
+
+        :param position: Absolute position the window has to start at.
+        """
+        if self.committed:
+            self.buffer_start = max(self.buffer_start, int(self.committed[-1][1] * SAMPLE_RATE))
+        if self.buffer_start < position and self.hypothesis:
+            self.committed.extend(self.hypothesis)
+            self.hypothesis = []
+            self.buffer_start = max(self.buffer_start, int(self.committed[-1][1] * SAMPLE_RATE))
+        if self.buffer_start >= position:
+            return
+
+        # decoded audio after the last word has no words in it, but the rest was never decoded
+        undecoded = position - max(self.buffer_start, self.last_decode_position)
+        if undecoded > 0 and not self.overflowed:
+            logger.warning(f"Utterance is longer than the STT buffer ({self.audio.capacity / SAMPLE_RATE:.0f}s) and "
+                           f"decoding fell behind, dropping the audio it hasn't decoded yet.")
+            self.overflowed = True
+        self.buffer_start = position
+
+    def _decode(self) -> list[tuple[float, float, str]]:
+        """
+        Decode the buffered audio and return the words that are not committed yet.
+
+        :return: A list of (start, end, word) tuples with absolute times in seconds.
+        """
+        self.buffer_start = max(self.buffer_start, self.audio.oldest_position)
+        self.last_decode_position = self.audio.position
+
+        # committed words that were trimmed from the buffer keep the decoder on track
+        prompt = "".join(word for start, end, word in self.committed
+                         if end * SAMPLE_RATE <= self.buffer_start)[-200:]
+
+        segments, _ = self.model.transcribe(
+            int16_to_float32(self.audio.read(self.buffer_start)),
+            beam_size=self.beam_size,
+            language="en",
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            initial_prompt=prompt or None
+        )
+
+        offset = self.buffer_start / SAMPLE_RATE
+        words = [(offset + word.start, offset + word.end, word.word)
+                 for segment in segments for word in segment.words]
+
+        if not self.committed:
+            return words
+
+        # drop words that were already committed, by time and then by matching the committed tail
+        last_end = self.committed[-1][1]
+        words = [word for word in words if word[0] > last_end - 0.1]
+        for n in range(min(len(words), len(self.committed), 5), 0, -1):
+            tail = [_normalize_word(word[2]) for word in self.committed[-n:]]
+            if [_normalize_word(word[2]) for word in words[:n]] == tail:
+                return words[n:]
+        return words
+
+    def _trim_buffer(self):
+        """Trim the buffer to the end of the last committed word once it gets long."""
+
+        if not self.committed or self.audio.position - self.buffer_start <= self.buffer_trim_samples:
+            return
+        self.buffer_start = max(self.buffer_start, int(self.committed[-1][1] * SAMPLE_RATE))
+
+    def process_iter(self) -> str:
+        """
+        Decode the buffer if enough new audio has arrived, and commit the words
+        that the last two decodes agree on.
+
+        :return: The newly committed text (empty if nothing was committed).
+        """
+        if self.audio.position - self.last_decode_position < self.min_chunk_samples:
+            return ""
+
+        words = self._decode()
+
+        agreed = []
+        for new, old in zip(words, self.hypothesis):
+            if _normalize_word(new[2]) != _normalize_word(old[2]):
+                break
+            agreed.append(new)
+
+        self.committed.extend(agreed)
+        self.hypothesis = words[len(agreed):]
+        self._trim_buffer()
+
+        return "".join(word for start, end, word in agreed)
+
+    def finish(self) -> str:
+        """
+        Finish the current utterance, decoding whatever audio is left.
+
+        :return: Transcription of the whole utterance as a string.
+        """
+        if self.audio.position > self.last_decode_position:
+            self.hypothesis = self._decode()
+
+        self.committed.extend(self.hypothesis)
+        self.hypothesis = []
+
+        return "".join(word for start, end, word in self.committed)
+
+    def transcribe(self, audio_data: np.ndarray) -> str:
+        """
+        Transcribe a whole utterance in one go.
+
+        :param audio_data: Audio data as a NumPy array in int16 format.
+        :return: Transcription of the audio data as a string.
+        """
+        self.reset()
+        self.insert_audio(audio_data)
+        return self.finish()
@@ -0,0 +1,261 @@
+"""
+Offline batch transcription and evaluation.
+
+Transcribes a directory or a manifest of recordings with the batched STT model
+and writes one JSON line per file, with the word error rate against the
+reference transcript when there is one, e.g.:
+
+    python transcribe.py recordings/ --out large-v3-turbo.jsonl
+    python transcribe.py manifest.jsonl --model small.en --compute-type float16 --beam-size 1 --out small.jsonl
+
+In a directory, every audio file is transcribed, and a .txt file with the same
+name is its reference. A manifest has a JSON object per line with "audio" (a
+path relative to the manifest) and optionally "text".
+"""
+import argparse
+import collections
+import json
+import logging
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from utils.audio import load_wav, float32_to_int16
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+CHUNK_LENGTH = 30  # seconds per clip of the batched decode
+AUDIO_EXTENSIONS = {".wav", ".flac", ".mp3", ".ogg", ".m4a"}
+
+
+def find_inputs(path: Path) -> list[tuple[Path, str | None]]:
+    """
+    List the recordings to transcribe.
+
+    :param path: A directory of recordings or a JSON lines manifest.
+    :return: The recordings and their reference transcripts, None if they have none.
+    """
+    if path.is_dir():
+        inputs = []
+        for audio_path in sorted(path.rglob("*")):
+            if audio_path.suffix.lower() in AUDIO_EXTENSIONS:
+                reference_path = audio_path.with_suffix(".txt")
+                reference = reference_path.read_text(encoding="utf8").strip() if reference_path.exists() else None
+                inputs.append((audio_path, reference))
+        return inputs
+
+    inputs = []
+    with open(path, encoding="utf8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                inputs.append((path.parent / entry["audio"], entry.get("text")))
+    return inputs
+
+
+def load_audio(path: Path) -> np.ndarray:
+    """
+    Load a recording as 16 kHz int16 audio. 16 kHz WAVs are memory-mapped,
+    anything else is decoded and resampled.
+    """
+    if path.suffix.lower() == ".wav":
+        try:
+            return load_wav(path, SAMPLE_RATE, mmap=True)
+        except ValueError:
+            pass  # not mono 16-bit 16 kHz, so decode it below
+
+    from faster_whisper import decode_audio
+    return float32_to_int16(decode_audio(str(path), sampling_rate=SAMPLE_RATE))
+
+
+def normalize_words(text: str) -> list[str]:
+    """Split text into lowercase words without punctuation."""
+    words = ("".join(c for c in word.lower() if c.isalnum()) for word in text.split())
+    return [word for word in words if word]
+
+
+def word_errors(reference: str, hypothesis: str) -> tuple[int, int]:
+    """
+    Count the word errors (substitutions, deletions and insertions) of a transcription.
+
+    :param reference: The correct transcript.
+    :param hypothesis: The transcription.
+    :return: The number of errors and the number of words in the reference.
+    """
+    ref, hyp = normalize_words(reference), normalize_words(hypothesis)
+
+    # edit distance, one row at a time
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1], len(ref)
+
+
+def load_ahead(inputs: list[tuple[Path, str | None]], workers: int,
+               window: int) -> Iterator[tuple[Path, str | None, np.ndarray | Exception]]:
+    """
+    Load recordings on a thread pool, in order, keeping up to `window` of them loaded ahead.
+    A recording that fails to load is yielded with the exception instead of its audio.
+    """
+    def load(path: Path) -> np.ndarray | Exception:
+        try:
+            return load_audio(path)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="load") as executor:
+        pending = collections.deque()
+        remaining = iter(inputs)
+        for path, reference in remaining:
+            pending.append((path, reference, executor.submit(load, path)))
+            if len(pending) >= window:
+                break
+        while pending:
+            path, reference, future = pending.popleft()
+            for next_path, next_reference in remaining:
+                pending.append((next_path, next_reference, executor.submit(load, next_path)))
+                break
+            yield path, reference, future.result()
+
+
+def batch_by_clips(items: Iterable[tuple], batch_size: int) -> Iterator[list[tuple]]:
+    """
+    Group loaded recordings into batches of up to `batch_size` 30 second clips.
+    A recording longer than the whole batch gets a batch of its own.
+    """
+    batch, clips = [], 0
+    for item in items:
+        item_clips = max(math.ceil(len(item[2]) / (SAMPLE_RATE * CHUNK_LENGTH)), 1)
+        if batch and clips + item_clips > batch_size:
+            yield batch
+            batch, clips = [], 0
+        batch.append(item)
+        clips += item_clips
+    if batch:
+        yield batch
+
+
+def run(inputs: list[tuple[Path, str | None]], stt, out, batch_size: int, workers: int) -> dict:
+    """
+    Transcribe the recordings and write a JSON line per recording as each batch finishes.
+
+    :param inputs: The recordings and their reference transcripts.
+    :param stt: The batched STT model.
+    :param out: Text file the results are written to.
+    :param batch_size: Maximum number of 30 second clips decoded at once.
+    :param workers: Threads loading recordings ahead of the decode.
+    :return: Totals over all recordings.
+    """
+    totals = {"files": 0, "failed": 0, "audio_seconds": 0.0, "decode_seconds": 0.0, "errors": 0, "words": 0}
+    start = time.perf_counter()
+
+    def loaded():
+        for path, reference, audio in load_ahead(inputs, workers, window=batch_size + 2 * workers):
+            if isinstance(audio, Exception):
+                logger.error(f"Failed to load {path}: {audio!r}")
+                totals["failed"] += 1
+                continue
+            yield path, reference, audio
+
+    for batch in batch_by_clips(loaded(), batch_size):
+        decode_batch(batch, stt, out, batch_size, totals)
+
+    totals["wall_seconds"] = time.perf_counter() - start
+    totals["wer"] = totals["errors"] / totals["words"] if totals["words"] else None
+    totals["realtime_factor"] = (totals["decode_seconds"] / totals["audio_seconds"]
+                                 if totals["audio_seconds"] else None)
+    return totals
+
+
+def decode_batch(batch: list[tuple[Path, str | None, np.ndarray]], stt, out, batch_size: int, totals: dict):
+    """Transcribe a batch of recordings, write their results and add them to the totals."""
+    start = time.perf_counter()
+    transcriptions = stt.transcribe_batch([audio for _, _, audio in batch], batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+
+    totals["decode_seconds"] += elapsed
+    for (path, reference, audio), hypothesis in zip(batch, transcriptions):
+        result = {
+            "audio": str(path),
+            "duration": round(len(audio) / SAMPLE_RATE, 3),
+            "hypothesis": hypothesis,
+            "reference": reference,
+            # the batch is decoded as one, so its time is shared out by duration
+            "decode_time": round(elapsed * len(audio) / max(sum(len(a) for _, _, a in batch), 1), 4),
+        }
+        if reference is not None:
+            errors, words = word_errors(reference, hypothesis)
+            result.update(errors=errors, words=words, wer=errors / words if words else None)
+            totals["errors"] += errors
+            totals["words"] += words
+        out.write(json.dumps(result) + "\n")
+        totals["files"] += 1
+        totals["audio_seconds"] += len(audio) / SAMPLE_RATE
+    out.flush()
+    logger.info(f"Transcribed {totals['files']} files ({len(batch)} in {elapsed:.2f}s)")
+
+
+def parse_option(option: str) -> tuple[str, object]:
+    """Parse a decode option like "temperature=0" or "vad_filter=true", with JSON values."""
+    key, sep, value = option.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected key=value, got {option!r}")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+if __name__ == "__main__":
+    import config
+    from config import logging_config
+    from stt import FasterWhisperBatchedSTT
+
+    crumbot_config = config.get_config()
+
+    parser = argparse.ArgumentParser(description="Transcribe recordings with the batched STT model and score them.")
+    parser.add_argument("input", type=Path, help="Directory of recordings, or a JSON lines manifest")
+    parser.add_argument("--out", required=True, help="JSON lines file to write the results to")
+    parser.add_argument("--model", default=crumbot_config["stt_model"], help="Faster Whisper model")
+    parser.add_argument("--device", default=crumbot_config["device"])
+    parser.add_argument("--compute-type", default=crumbot_config["stt_compute_type"])
+    parser.add_argument("--cpu-threads", type=int, default=crumbot_config["stt_cpu_threads"])
+    parser.add_argument("--beam-size", type=int, default=crumbot_config["stt_beam_size"])
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--option", type=parse_option, action="append", default=[], metavar="KEY=VALUE",
+                        help="Other decode option, e.g. temperature=0 (can be repeated)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Maximum 30 second clips decoded at once")
+    parser.add_argument("--workers", type=int, default=4, help="Threads loading recordings")
+    args = parser.parse_args()
+    if "vad_filter" in dict(args.option):
+        parser.error("vad_filter doesn't apply, every recording is decoded as its own clip")
+
+    logging_config.configure_logging()
+
+    inputs = find_inputs(args.input)
+    if not inputs:
+        sys.exit(f"No recordings found in {args.input}")
+
+    decode_options = {"beam_size": args.beam_size, "language": args.language, **dict(args.option)}
+    logger.info(f"Transcribing {len(inputs)} files with {args.model} ({args.device}, {args.compute_type}), "
+                f"{decode_options}")
+    stt = FasterWhisperBatchedSTT(args.model, decode_options=decode_options,
+                                  device=args.device, compute_type=args.compute_type, cpu_threads=args.cpu_threads)
+
+    with open(args.out, "w", encoding="utf8") as out:
+        totals = run(inputs, stt, out, args.batch_size, args.workers)
+
+    wer = f"{totals['wer']:.2%}" if totals["wer"] is not None else "n/a"
+    rtf = f"{totals['realtime_factor']:.3f}" if totals["realtime_factor"] is not None else "n/a"
+    logger.info(f"{totals['files']} files ({totals['failed']} failed), {totals['audio_seconds']:.1f}s of audio "
+                f"in {totals['wall_seconds']:.1f}s, real-time factor {rtf}, WER {wer} "
+                f"({totals['errors']} errors / {totals['words']} words)")
@@ -1,3 +1,4 @@
 from .tts import KokoroTTS
+from .cache import TTSCache
 
-__all__ = ["KokoroTTS"]
\ No newline at end of file
+__all__ = ["KokoroTTS", "TTSCache"]
\ No newline at end of file
@@ -0,0 +1,168 @@
+import collections
+import hashlib
+import logging
+import os
+import threading
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TTSCache:
+    """
+    Content-addressed LRU cache of synthesized speech.
+
+    Audio is keyed by a hash of (text, voice, speed) and kept in memory up to a
+    byte budget. With a cache directory, entries are also written to disk as raw
+    int16 PCM and read back into memory on a memory miss, so they survive
+    restarts. They're copied rather than memory-mapped, so the files can always
+    be evicted (Windows can't delete a file that is still mapped).
+    """
+
+    def __init__(self, max_memory_size: int, cache_dir: str | Path | None = None, max_disk_size: int | None = None):
+        """
+        Initialize the cache.
+
+        :param max_memory_size: Maximum bytes of audio kept in memory.
+        :param cache_dir: Directory for the on-disk tier, or None to only cache in memory.
+        :param max_disk_size: Maximum bytes of audio kept on disk, or None for no limit.
+        """
+        self.max_memory_size = max_memory_size
+        self.max_disk_size = max_disk_size
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.entries = collections.OrderedDict()  # key -> int16 audio, least recently used first
+        self.memory_size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, voice: str, speed: float) -> str:
+        """
+        Build the cache key for a piece of speech.
+
+        :param text: The spoken text.
+        :param voice: The TTS voice.
+        :param speed: The TTS speed.
+        :return: The cache key.
+        """
+        return hashlib.sha256(f"{voice}\0{speed}\0{text.strip()}".encode("utf8")).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pcm"
+
+    def _remember(self, key: str, audio: np.ndarray):
+        """Insert audio into the memory tier, evicting the least recently used entries."""
+
+        if audio.nbytes > self.max_memory_size:
+            return
+
+        if key in self.entries:
+            self.memory_size -= self.entries.pop(key).nbytes
+        self.entries[key] = audio
+        self.memory_size += audio.nbytes
+
+        while self.memory_size > self.max_memory_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.memory_size -= evicted.nbytes
+
+    def get(self, key: str) -> np.ndarray | None:
+        """
+        Look up cached audio.
+
+        :param key: The cache key.
+        :return: The cached int16 audio, or None on a miss.
+        """
+        with self.lock:
+            audio = self.entries.get(key)
+            if audio is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return audio
+
+            if self.cache_dir is not None:
+                path = self._disk_path(key)
+                try:
+                    audio = np.fromfile(path, dtype=np.int16) if path.exists() else None
+                    if audio is not None and len(audio):
+                        os.utime(path)  # mark as recently used for disk eviction
+                except OSError as e:
+                    # evicted or being replaced concurrently
+                    logger.debug(f"Failed to read TTS cache entry {path}: {e}")
+                    audio = None
+                if audio is not None and len(audio):
+                    self._remember(key, audio)
+                    self.disk_hits += 1
+                    return audio
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, audio: np.ndarray):
+        """
+        Store synthesized audio.
+
+        :param key: The cache key.
+        :param audio: The int16 audio to store.
+        """
+        with self.lock:
+            self._remember(key, audio)
+
+        if self.cache_dir is None:
+            return
+
+        path = self._disk_path(key)
+        temp_path = path.with_suffix(".tmp")
+        try:
+            audio.astype(np.int16, copy=False).tofile(temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write TTS cache entry {path}: {e}")
+            return
+
+        self._trim_disk()
+
+    def _trim_disk(self):
+        """Delete the least recently used files once the disk tier is over budget."""
+
+        if self.max_disk_size is None:
+            return
+
+        files = []
+        for path in self.cache_dir.glob("*.pcm"):
+            try:
+                files.append((path.stat(), path))
+            except OSError:
+                pass  # deleted in the meantime
+
+        disk_size = sum(stat.st_size for stat, _ in files)
+        for stat, path in sorted(files, key=lambda file: file[0].st_mtime):
+            if disk_size <= self.max_disk_size:
+                break
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                # e.g. open in another process on Windows, it's tried again on the next trim
+                logger.warning(f"Failed to evict TTS cache entry {path}: {e}")
+                continue
+            disk_size -= stat.st_size
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get the cache counters.
+
+        :return: A dictionary of hit/miss counters and the memory tier's size.
+        """
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "memory_size": self.memory_size,
+        }
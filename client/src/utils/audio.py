@@ -1,4 +1,7 @@
 import numpy as np
+import wave
+from multiprocessing import shared_memory
+from pathlib import Path
 
 def float32_to_int16(audio_data: np.ndarray) -> np.ndarray:
     """
@@ -27,4 +30,194 @@ def int16_to_float32(audio_data: np.ndarray) -> np.ndarray:
         raise ValueError("Input audio data must be of type int16.")
     
     # Convert to float32 and scale to the range of -1.0 to 1.0
-    return (audio_data.astype(np.float32) / 32768.0)
\ No newline at end of file
+    return (audio_data.astype(np.float32) / 32768.0)
+
+def load_wav(path: str | Path, rate: int, mmap: bool = False) -> np.ndarray:
+    """
+    Load a mono 16-bit WAV file into memory.
+
+    :param path: Path to the WAV file.
+    :param rate: Expected sample rate of the file.
+    :param mmap: Memory-map the samples instead of reading them, so they are only paged in when used.
+    :return: NumPy array containing int16 audio data.
+    """
+    with open(path, "rb") as raw, wave.open(raw, "rb") as f:
+        if f.getnchannels() != 1 or f.getsampwidth() != 2 or f.getframerate() != rate:
+            raise ValueError(f"{path} must be a mono 16-bit WAV file at {rate} Hz.")
+        if not mmap or f.getnframes() == 0:
+            return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+
+        # wave stops reading right after the header of the data chunk
+        return np.memmap(path, dtype=np.int16, mode="r", offset=raw.tell(), shape=(f.getnframes(),))
+
+
+class AudioRingBuffer:
+    def __init__(self, capacity: int, dtype=np.int16):
+        """
+        Fixed-capacity ring buffer for audio samples.
+        Samples are addressed by their absolute position in the stream, so a
+        reader can mark where an utterance starts and read it back later.
+
+        :param capacity: Maximum number of samples held by the buffer.
+        :param dtype: NumPy dtype of the samples.
+        """
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.position = 0  # absolute position of the next sample to be written
+
+    @property
+    def oldest_position(self) -> int:
+        """Absolute position of the oldest sample still held by the buffer."""
+        return max(0, self.position - self.capacity)
+
+    def clear(self):
+        """Discard all samples and restart positions from zero."""
+        self.position = 0
+
+    def write(self, audio_data: np.ndarray):
+        """
+        Write samples to the buffer, overwriting the oldest ones once it is full.
+
+        :param audio_data: NumPy array of samples to write.
+        """
+        if len(audio_data) > self.capacity:
+            # only the newest samples would survive anyway
+            self.position += len(audio_data) - self.capacity
+            audio_data = audio_data[-self.capacity:]
+
+        start = self.position % self.capacity
+        end = start + len(audio_data)
+        if end <= self.capacity:
+            self.buffer[start:end] = audio_data
+        else:
+            split = self.capacity - start
+            self.buffer[start:] = audio_data[:split]
+            self.buffer[:end - self.capacity] = audio_data[split:]
+
+        self.position += len(audio_data)
+
+    def read_into(self, start: int, out: np.ndarray):
+        """
+        Copy samples starting at an absolute position into a preallocated array.
+
+        :param start: Absolute position of the first sample to read.
+        :param out: Array to fill, its length is the number of samples read.
+        """
+        if start < self.oldest_position or start + len(out) > self.position:
+            raise ValueError(
+                f"Samples {start}-{start + len(out)} are not in the buffer ({self.oldest_position}-{self.position}).")
+
+        start_index = start % self.capacity
+        split = min(len(out), self.capacity - start_index)
+        out[:split] = self.buffer[start_index:start_index + split]
+        out[split:] = self.buffer[:len(out) - split]
+
+    def read(self, start: int, end: int | None = None) -> np.ndarray:
+        """
+        Read samples between two absolute positions as one contiguous copy.
+        The copy is safe to hand to another thread while writing continues.
+
+        :param start: Absolute position of the first sample to read.
+        :param end: Absolute position after the last sample to read (defaults to the write position).
+        :return: NumPy array containing the samples.
+        """
+        if end is None:
+            end = self.position
+        if start < self.oldest_position or end > self.position or start > end:
+            raise ValueError(
+                f"Samples {start}-{end} are not in the buffer ({self.oldest_position}-{self.position}).")
+
+        start_index = start % self.capacity
+        end_index = start_index + (end - start)
+        if end_index <= self.capacity:
+            return self.buffer[start_index:end_index].copy()
+        return np.concatenate((self.buffer[start_index:], self.buffer[:end_index - self.capacity]))
+
+
+class SharedFrameRing:
+    """
+    Ring buffer of fixed-size audio frames in shared memory, so frames can be
+    handed to another process without pickling them. There is a single writer,
+    which publishes a frame by advancing the write position after copying it in,
+    and readers address frames by their absolute position in the stream.
+    """
+
+    INFO_DTYPE = np.dtype([("frame", np.int64), ("captured_at", np.float64)])
+
+    def __init__(self, frames: int, frame_size: int, name: str | None = None):
+        """
+        Create a ring, or attach to one created by another process.
+
+        :param frames: Number of frames the ring holds.
+        :param frame_size: Samples per frame.
+        :param name: Name of the shared memory to attach to, a new ring is created if not given.
+        """
+        self.frames = frames
+        self.frame_size = frame_size
+        self.owner = name is None
+        info_offset = np.dtype(np.int64).itemsize
+        audio_offset = info_offset + frames * self.INFO_DTYPE.itemsize
+        size = audio_offset + frames * frame_size * np.dtype(np.int16).itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+
+        self._position = np.ndarray(1, dtype=np.int64, buffer=self.shm.buf)
+        self.info = np.ndarray(frames, dtype=self.INFO_DTYPE, buffer=self.shm.buf, offset=info_offset)
+        self.audio = np.ndarray((frames, frame_size), dtype=np.int16, buffer=self.shm.buf, offset=audio_offset)
+        if self.owner:
+            self._position[0] = 0
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory, for other processes to attach to."""
+        return self.shm.name
+
+    @property
+    def position(self) -> int:
+        """Absolute position of the next frame to be written."""
+        return int(self._position[0])
+
+    def write(self, frame: int, captured_at: float, audio_data: np.ndarray):
+        """
+        Write a frame, overwriting the oldest one once the ring is full.
+
+        :param frame: Index of the frame since capture started.
+        :param captured_at: perf_counter() time the frame was captured at.
+        :param audio_data: The frame as a NumPy array in int16 format.
+        """
+        if len(audio_data) != self.frame_size:
+            raise ValueError(f"Frames must have {self.frame_size} samples, got {len(audio_data)}.")
+
+        position = self.position
+        slot = position % self.frames
+        self.audio[slot] = audio_data
+        self.info[slot] = (frame, captured_at)
+        self._position[0] = position + 1
+
+    def read(self, position: int) -> tuple[int, float, np.ndarray] | None:
+        """
+        Read a frame by its absolute position.
+
+        :param position: Absolute position of the frame.
+        :return: The frame's index, capture time and a copy of its audio, or None if it was overwritten already.
+        """
+        if position >= self.position:
+            raise ValueError(f"Frame {position} was not written yet ({self.position} frames written).")
+        # the slot of the frame a whole ring behind the writer is the one being written next
+        if self.position - position >= self.frames:
+            return None
+
+        slot = position % self.frames
+        frame, captured_at = self.info[slot]
+        audio_data = self.audio[slot].copy()
+        # the writer may have lapped the reader while it was copying
+        if self.position - position >= self.frames:
+            return None
+        return int(frame), float(captured_at), audio_data
+
+    def close(self):
+        """Detach from the shared memory, and free it if this ring created it."""
+        # the views have to go before the memory can be closed
+        del self._position, self.info, self.audio
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
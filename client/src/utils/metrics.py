@@ -0,0 +1,246 @@
+import bisect
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram, cheap enough to update from hot paths.
+    """
+
+    def __init__(self, buckets: list[float]):
+        """
+        :param buckets: Upper bounds of the buckets, an overflow bucket is added automatically.
+        """
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        """
+        Record a value.
+
+        :param value: The value to record.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, q: float) -> float:
+        """
+        Estimate a percentile as the upper bound of the bucket it falls in.
+
+        :param q: The percentile, between 0 and 100.
+        :return: The estimate, or infinity if it falls in the overflow bucket.
+        """
+        if self.count == 0:
+            return 0.0
+
+        target = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        """
+        Get the histogram's current state.
+
+        :return: A dictionary with the count, mean, percentiles and bucket counts.
+        """
+        with self.lock:
+            return {
+                "count": self.count,
+                "mean": self.sum / self.count if self.count else 0.0,
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+                "buckets": dict(zip([str(bound) for bound in self.buckets] + ["inf"], self.counts)),
+            }
+
+
+class Counter:
+    """
+    Monotonic counter. Either incremented directly, or read from a function
+    for counts that are already kept elsewhere.
+    """
+
+    def __init__(self, fn: Callable[[], float] | None = None):
+        """
+        :param fn: Function returning the current count, instead of counting with inc().
+        """
+        self.fn = fn
+        self._value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self.fn() if self.fn is not None else self._value
+
+
+class Gauge(Counter):
+    """Value that can go up and down, like a queue depth."""
+
+    def set(self, value: float):
+        with self.lock:
+            self._value = value
+
+
+class MetricsRegistry:
+    """
+    Collection of named metrics that can be exported in the Prometheus text
+    format, over HTTP or to a periodically rewritten file.
+    """
+
+    def __init__(self):
+        self.families = {}  # name -> (type, help, {labels: metric})
+        self.lock = threading.Lock()
+
+    def _register(self, kind: str, name: str, help: str, labels: dict, create):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.setdefault(name, (kind, help, {}))
+            if family[0] != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family[0]}.")
+            metrics = family[2]
+            if key not in metrics:
+                metrics[key] = create()
+            return metrics[key]
+
+    def counter(self, name: str, help: str, fn: Callable[[], float] | None = None, **labels) -> Counter:
+        """Get or create a counter, `fn` replaces the function of an existing one."""
+        counter = self._register("counter", name, help, labels, lambda: Counter(fn))
+        if fn is not None:
+            counter.fn = fn
+        return counter
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float] | None = None, **labels) -> Gauge:
+        """Get or create a gauge, `fn` replaces the function of an existing one."""
+        gauge = self._register("gauge", name, help, labels, lambda: Gauge(fn))
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name: str, help: str, buckets: list[float], **labels) -> Histogram:
+        """Get or create a histogram."""
+        return self._register("histogram", name, help, labels, lambda: Histogram(buckets))
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+        labels = labels + extra
+        if not labels:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                   for _, value in labels)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        :return: The metrics as text.
+        """
+        with self.lock:
+            families = [(name, kind, help, list(metrics.items()))
+                        for name, (kind, help, metrics) in sorted(self.families.items())]
+
+        lines = []
+        for name, kind, help, metrics in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                if kind != "histogram":
+                    try:
+                        value = metric.value
+                    except Exception:
+                        continue  # the thing it reads from is gone
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+                    continue
+
+                with metric.lock:
+                    counts, count, total = list(metric.counts), metric.count, metric.sum
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + [float("inf")], counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f"{name}_bucket{self._format_labels(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host: str, port: int) -> ThreadingHTTPServer:
+        """
+        Serve the metrics at /metrics from a background thread.
+
+        :param host: Address to listen on.
+        :param port: Port to listen on.
+        :return: The server, shut it down to stop serving.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+    def write_periodically(self, path: str | Path, interval: float) -> threading.Event:
+        """
+        Rewrite a file with the metrics every `interval` seconds from a
+        background thread, e.g. for node_exporter's textfile collector.
+
+        :param path: File to write the metrics to.
+        :param interval: Seconds between writes.
+        :return: An event, set it to stop writing.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        stopped = threading.Event()
+
+        def run():
+            while not stopped.wait(interval):
+                temp_path = path.with_suffix(path.suffix + ".tmp")
+                try:
+                    temp_path.write_text(self.render(), encoding="utf8")
+                    os.replace(temp_path, path)
+                except OSError as e:
+                    logger.error(f"Failed to write metrics to {path}: {e}")
+
+        threading.Thread(target=run, name="metrics-file", daemon=True).start()
+        return stopped
+
+
+# metrics of this process
+registry = MetricsRegistry()
@@ -0,0 +1,184 @@
+import pyaudio
+import numpy as np
+import logging
+import threading
+import time
+from utils.audio import AudioRingBuffer
+
+logger = logging.getLogger(__name__)
+
+class AudioPlaybackManager:
+    def __init__(self, rate: int, format: int, channels: int, chunk_size: int, buffer_length: float = 60.0,
+                 audio_interface: pyaudio.PyAudio | None = None, stall_timeout: float = 2.0):
+        """
+        Initializes the audio playback manager.
+
+        Playback runs on a single persistent output stream. Audio is written into a
+        preallocated ring buffer by one producer and read by the stream callback,
+        which only ever advances its own read position, so neither side takes a lock.
+
+        :param rate: Sample rate of the audio (e.g., 24000).
+        :param format: PyAudio format (e.g., pyaudio.paInt16).
+        :param channels: Number of audio channels (e.g., 1 for mono).
+        :param chunk_size: Size of each audio chunk to process (e.g., 1024).
+        :param buffer_length: Seconds of audio the ring buffer can hold.
+        :param audio_interface: PyAudio instance to play through, a new one is created if not given.
+        :param stall_timeout: Seconds to wait for space in a full buffer while the stream plays nothing,
+            before the rest of the audio is dropped.
+        """
+        self.p = audio_interface or pyaudio.PyAudio()
+        self.rate = rate
+        self.channels = channels
+        self.format = format
+        self.chunk_size = chunk_size
+        self.stall_timeout = stall_timeout
+        self.stream = None
+        self.stream_lock = threading.Lock()  # the stream is opened from the event loop and the pipeline's workers
+
+        self.buffer = AudioRingBuffer(int(buffer_length * rate))
+        self.read_position = 0  # only advanced by the callback
+        self.clear_to = 0  # buffer position the callback skips ahead to when playback is stopped
+        self.generation = 0  # incremented whenever playback is stopped
+
+        # a short clip (like the wake beep) mixed on top of the buffered audio
+        self.clip = None
+        self.clip_position = 0
+
+        # preallocated callback buffers
+        self.read_buffer = np.zeros(chunk_size, dtype=np.int16)
+        self.mix_buffer = np.zeros(chunk_size, dtype=np.int32)
+        self.output_buffer = np.zeros(chunk_size, dtype=np.int16)
+
+    @property
+    def is_playing(self) -> bool:
+        """If there is any audio left to play."""
+        return self.buffer.position > max(self.read_position, self.clear_to) or self.clip is not None
+
+    def _resize_buffers(self, frame_count: int):
+        """Grow the callback buffers if PortAudio asks for more frames than expected."""
+        self.read_buffer = np.zeros(frame_count, dtype=np.int16)
+        self.mix_buffer = np.zeros(frame_count, dtype=np.int32)
+        self.output_buffer = np.zeros(frame_count, dtype=np.int16)
+
+    def _audio_callback(self, in_data, frame_count, time_info, status):
+        """
+        PyAudio callback function. This function is called by PyAudio whenever
+        it needs more audio data to play. It runs in a separate thread.
+        """
+        if frame_count > len(self.mix_buffer):
+            self._resize_buffers(frame_count)
+
+        # skip the audio that was buffered when playback was stopped, but not what was written since
+        clear_to = self.clear_to
+        if clear_to > self.read_position:
+            self.read_position = clear_to
+
+        mix = self.mix_buffer[:frame_count]
+        mix.fill(0)
+
+        # buffered audio, silence if there is not enough of it
+        available = min(frame_count, self.buffer.position - self.read_position)
+        if available > 0:
+            samples = self.read_buffer[:available]
+            self.buffer.read_into(self.read_position, samples)
+            mix[:available] = samples
+            self.read_position += available
+
+        # mix the clip on top
+        clip = self.clip
+        if clip is not None:
+            position = self.clip_position
+            count = min(frame_count, len(clip) - position)
+            mix[:count] += clip[position:position + count]
+            self.clip_position = position + count
+            if self.clip_position >= len(clip):
+                self.clip = None
+
+        output = self.output_buffer[:frame_count]
+        np.clip(mix, -32768, 32767, out=mix)
+        np.copyto(output, mix, casting="unsafe")
+        return output.tobytes(), pyaudio.paContinue
+
+    def _ensure_stream(self):
+        """Open the persistent output stream if it isn't running yet."""
+        with self.stream_lock:
+            if self.stream is not None and self.stream.is_active():
+                return
+
+            if self.stream is not None:
+                logger.warning("Playback stream stopped, reopening it")
+                self.stream.close()
+
+            # Open the audio stream in callback mode
+            self.stream = self.p.open(
+                format=self.format,
+                channels=self.channels,
+                rate=self.rate,
+                output=True,            # This is an output stream (playback)
+                frames_per_buffer=self.chunk_size,
+                stream_callback=self._audio_callback # Our custom callback function
+            )
+            self.stream.start_stream()
+
+    def queue_playback(self, audio_data: np.ndarray):
+        """
+        Adds audio data to the ring buffer, waiting for space if it is full.
+        Returns early if playback is stopped in the meantime, and drops the
+        rest of the audio if the buffer stays full because nothing plays it.
+
+        :param audio_data: The NumPy array containing the audio data (int16).
+        """
+        self._ensure_stream()
+
+        generation = self.generation
+        offset = 0
+        stalled_since = None  # when the stream last played anything while the buffer was full
+        while offset < len(audio_data):
+            if generation != self.generation:
+                return  # playback was stopped
+
+            free = self.buffer.capacity - (self.buffer.position - self.read_position)
+            if free <= 0:
+                read_position = self.read_position
+                time.sleep(self.chunk_size / self.rate / 2)
+                if self.read_position != read_position:
+                    stalled_since = None
+                elif stalled_since is None:
+                    stalled_since = time.monotonic()
+                elif time.monotonic() - stalled_since > self.stall_timeout:
+                    logger.error(f"Playback is stuck, dropping {(len(audio_data) - offset) / self.rate:.1f}s of audio")
+                    return
+                # the stream may have died, like when the output device went away
+                self._ensure_stream()
+                continue
+
+            stalled_since = None
+            count = min(free, len(audio_data) - offset)
+            self.buffer.write(audio_data[offset:offset + count])
+            offset += count
+
+    def play_clip(self, clip: np.ndarray):
+        """
+        Play a short preloaded clip on top of any other audio.
+
+        :param clip: The NumPy array containing the clip (int16, at the playback rate).
+        """
+        self._ensure_stream()
+        self.clip = None
+        self.clip_position = 0
+        self.clip = clip
+
+    def stop_playback(self):
+        """Stops the audio playback and clears the buffer."""
+        self.generation += 1
+        self.clear_to = self.buffer.position
+
+    def close(self):
+        """Closes the audio stream and terminates PyAudio."""
+        self.stop_playback()
+        with self.stream_lock:
+            if self.stream:
+                self.stream.stop_stream()
+                self.stream.close()
+                self.stream = None
+        self.p.terminate()
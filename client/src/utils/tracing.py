@@ -0,0 +1,177 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SPAN_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+class Span:
+    """A timed step of a trace."""
+
+    def __init__(self, trace: "Trace", name: str, parent: "Span | None", start: float, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = start
+        self.end_time = None
+        self.attributes = attributes
+
+    @property
+    def duration(self) -> float | None:
+        return self.end_time - self.start if self.end_time is not None else None
+
+    def end(self, end: float | None = None, **attributes):
+        """
+        End the span.
+
+        :param end: perf_counter() time the span ended at, now if not given.
+        :param attributes: Attributes to add to the span.
+        """
+        if self.end_time is not None:
+            return
+        self.end_time = time.perf_counter() if end is None else end
+        self.attributes.update(attributes)
+        registry.histogram("crumbot_span_seconds", "Duration of the steps of a turn.", SPAN_BUCKETS,
+                           span=self.name).observe(self.duration)
+
+    def to_dict(self, origin: float) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.start - origin, 6),
+            "duration": round(self.duration, 6) if self.duration is not None else None,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """
+    The spans of one utterance, from the wake word to the end of its response.
+    Spans can be started and ended from any thread.
+    """
+
+    def __init__(self, tracer: "Tracer", turn_id: int):
+        self.tracer = tracer
+        self.turn_id = turn_id
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+        self.status = None
+
+    def start_span(self, name: str, parent: Span | None = None, start: float | None = None, **attributes) -> Span:
+        """
+        Start a span, end it with Span.end().
+
+        :param name: Name of the span, like "stt".
+        :param parent: The span this one is a step of.
+        :param start: perf_counter() time the span started at, now if not given.
+        :param attributes: Attributes of the span.
+        :return: The span.
+        """
+        span = Span(self, name, parent, time.perf_counter() if start is None else start, attributes)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    @contextlib.contextmanager
+    def span(self, name: str, parent: Span | None = None, **attributes):
+        """Context manager that times the code it wraps as a span."""
+        span = self.start_span(name, parent, **attributes)
+        try:
+            yield span
+        finally:
+            span.end()
+
+    def event(self, name: str, at: float | None = None, **attributes) -> Span:
+        """
+        Record an instant, like the start of playback, as a span without duration.
+
+        :param name: Name of the event.
+        :param at: perf_counter() time of the event, now if not given.
+        :param attributes: Attributes of the event.
+        :return: The span.
+        """
+        span = self.start_span(name, start=at, **attributes)
+        span.end(span.start)
+        return span
+
+    def finish(self, status: str = "ok"):
+        """End the trace and hand it to the tracer. Unfinished spans are ended with it."""
+        with self.lock:
+            if self.status is not None:
+                return
+            self.status = status
+            spans = list(self.spans)
+
+        now = time.perf_counter()
+        for span in spans:
+            span.end(now, unfinished=True)
+        self.tracer.export(self)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "turn_id": self.turn_id,
+            "started_at": self.started_at,
+            "status": self.status,
+            "spans": [span.to_dict(self.origin) for span in spans],
+        }
+
+
+class Tracer:
+    """Creates a trace per utterance and exports the finished ones."""
+
+    def __init__(self, trace_file: str | Path | None = None):
+        """
+        :param trace_file: JSON lines file the finished traces are appended to, if given.
+        """
+        self.trace_file = Path(trace_file) if trace_file else None
+        self.lock = threading.Lock()
+        if self.trace_file is not None:
+            os.makedirs(self.trace_file.parent, exist_ok=True)
+
+    def start_trace(self, turn_id: int) -> Trace:
+        """
+        Start the trace of a turn.
+
+        :param turn_id: The pipeline's id of the turn.
+        :return: The trace.
+        """
+        return Trace(self, turn_id)
+
+    def export(self, trace: Trace):
+        """Log a summary of a finished trace, and append it to the trace file."""
+        data = trace.to_dict()
+
+        # total time per top level step, in the order they started
+        totals = {}
+        for span in data["spans"]:
+            if span["parent_id"] is None and span["duration"]:
+                count, total = totals.get(span["name"], (0, 0.0))
+                totals[span["name"]] = (count + 1, total + span["duration"])
+        summary = ", ".join(f"{name} {total:.3f}s" + (f" ({count}x)" if count > 1 else "")
+                            for name, (count, total) in totals.items())
+        logger.info(f"Trace {trace.trace_id[:8]} ({trace.status}): {summary}")
+
+        if self.trace_file is None:
+            return
+        try:
+            with self.lock, open(self.trace_file, "a", encoding="utf8") as f:
+                f.write(json.dumps(data) + "\n")
+        except OSError as e:
+            logger.error(f"Failed to write trace to {self.trace_file}: {e}")
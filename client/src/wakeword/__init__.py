@@ -1,3 +1,4 @@
-from .detector import OpenWakewordDetector
+from .detector import OpenWakewordDetector, EnergyGate, ensure_feature_models
+from .process import WakewordProcess
 
-__all__ = ["OpenWakewordDetector"]
\ No newline at end of file
+__all__ = ["OpenWakewordDetector", "EnergyGate", "ensure_feature_models", "WakewordProcess"]
\ No newline at end of file
@@ -1,25 +1,152 @@
 from openwakeword import Model
+import openwakeword.utils
 import numpy as np
+import os
+import collections
 import logging
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+SAMPLE_RATE = 16000
+FRAME_SIZE = 1280  # samples openWakeWord computes one embedding for
+
+
+def ensure_feature_models():
+    """
+    Download openWakeWord's feature and VAD models if they are missing.
+    Unlike openwakeword.utils.download_models(), this never fetches the
+    pretrained wakeword models, which crumbot doesn't use.
+    """
+    target_directory = os.path.join(os.path.dirname(openwakeword.__file__), "resources", "models")
+    os.makedirs(target_directory, exist_ok=True)
+
+    urls = [model["download_url"] for model in openwakeword.FEATURE_MODELS.values()]
+    urls += [url.replace(".tflite", ".onnx") for url in urls]
+    urls += [model["download_url"] for model in openwakeword.VAD_MODELS.values()]
+
+    for url in urls:
+        if not os.path.exists(os.path.join(target_directory, url.split("/")[-1])):
+            logger.info(f"Downloading {url}")
+            openwakeword.utils.download_file(url, target_directory)
+
+
+class EnergyGate:
+    """
+    Decide if audio is clearly silent, based on frame energy relative to a
+    tracked noise floor. The floor follows quiet frames quickly and rises
+    slowly, so speech doesn't drag it up. It doesn't go below `min_floor_db`,
+    so after digital silence (like a muted mic) the gate doesn't open on the
+    faintest noise.
+    """
+
+    def __init__(self, margin_db: float = 6.0, hangover: float = 1.0, floor_rise_db: float = 1.0,
+                 min_floor_db: float = -90.0):
+        """
+        :param margin_db: How far above the noise floor a frame must be to open the gate.
+        :param hangover: Seconds the gate stays open after the last loud frame.
+        :param floor_rise_db: How fast the noise floor may rise, in dB per second.
+        :param min_floor_db: Lowest the noise floor goes, in dBFS.
+        """
+        self.margin_db = margin_db
+        self.hangover = hangover
+        self.floor_rise_db = floor_rise_db
+        self.min_floor_db = min_floor_db
+        self.noise_floor = None
+        self.energy = None  # of the last frame, in dBFS
+        self.open_until = 0.0
+        self.time = 0.0  # seconds of audio seen
+
+    def update(self, audio_data: np.ndarray) -> bool:
+        """
+        Feed a frame to the gate.
+
+        :param audio_data: Audio data as a NumPy array in int16 format.
+        :return: If the gate is open (the audio is not clearly silent).
+        """
+        duration = len(audio_data) / SAMPLE_RATE
+        self.time += duration
+
+        rms = np.sqrt(np.mean(np.square(audio_data, dtype=np.float32)))
+        energy = 20 * np.log10(rms / 32768 + 1e-10)
+        self.energy = energy
+
+        if self.noise_floor is None or energy < self.noise_floor:
+            self.noise_floor = max(energy, self.min_floor_db)
+        else:
+            self.noise_floor = min(energy, self.noise_floor + self.floor_rise_db * duration)
+
+        if energy > self.noise_floor + self.margin_db:
+            self.open_until = self.time + self.hangover
+
+        return self.time <= self.open_until
+
 
 class OpenWakewordDetector:
-    def __init__(self, model_path: str | Path, wakeword_threshold: float = 0.5, vad_threshold: float = 0.5):
-        self.model_path = str(Path(__file__).parent / "models" / model_path)
-        self.wakeword_threshold = wakeword_threshold
+    """
+    Wakeword and voice activity detection with openWakeWord. Several wakeword
+    models can be loaded at once, like one per user, and they share one pass
+    of the feature extraction (melspectrogram and embeddings) per frame, so
+    each extra wakeword only adds its own small classifier.
+    """
+
+    out_of_process = False
+
+    def __init__(self, model_path: str | Path | list[str | Path], wakeword_threshold: float | list[float] = 0.5,
+                 vad_threshold: float = 0.5, gate: EnergyGate | None = None, gate_history: float | None = None):
+        """
+        Initialize the wakeword detector.
+
+        :param model_path: The wakeword model's file name in the models directory, or a list of them.
+            Each wakeword is named after its file, without the extension.
+        :param wakeword_threshold: Score above which the wakeword is detected, or one per model.
+        :param vad_threshold: Score above which voice activity is detected.
+        :param gate: Energy gate used to skip inference while the input is clearly silent, or None to always run it.
+        :param gate_history: Seconds of skipped audio replayed through the feature extraction when the gate
+            opens, so the streaming features are computed from real audio again. At most what the wakeword
+            models look at, which is also the default.
+        """
+        model_paths = model_path if isinstance(model_path, list) else [model_path]
+        thresholds = wakeword_threshold if isinstance(wakeword_threshold, list) \
+            else [wakeword_threshold] * len(model_paths)
+        if len(thresholds) != len(model_paths):
+            raise ValueError(f"Got {len(thresholds)} thresholds for {len(model_paths)} wakeword models.")
+
+        self.model_paths = [str(Path(__file__).parent / "models" / path) for path in model_paths]
+        # wakeword name -> threshold, openWakeWord names the models after their files
+        self.thresholds = {Path(path).stem: threshold for path, threshold in zip(self.model_paths, thresholds)}
         self.vad_threshold = vad_threshold
+        self.gate = gate
+        self.gated = False
+        self.frames_total = 0
+        self.frames_skipped = 0
         self._load_model()
 
+        # each embedding the models look at comes from one frame, older skipped audio doesn't matter
+        context = max(self.model.model_inputs.values())
+        if gate_history is not None:
+            context = min(context, int(gate_history * SAMPLE_RATE / FRAME_SIZE))
+        self.skipped_frames = collections.deque(maxlen=max(1, context))
+
     def _load_model(self):
-        """Load the wakeword detection model."""
+        """Load the wakeword detection models."""
 
-        logger.info(f"Loading model from {self.model_path}")
-        self.model = Model(wakeword_models=[
-                           self.model_path], inference_framework='onnx', vad_threshold=self.vad_threshold)
-        self.model_name = list(self.model.models.keys())[0]
+        logger.info(f"Loading models from {', '.join(self.model_paths)}")
+        self.model = Model(wakeword_models=self.model_paths, inference_framework='onnx',
+                           vad_threshold=self.vad_threshold)
+        if set(self.model.models) != set(self.thresholds):
+            raise ValueError(f"Wakeword models {sorted(self.model.models)} don't match {sorted(self.thresholds)}, "
+                             f"each model needs a distinct file name.")
+
+    @property
+    def wakewords(self) -> list[str]:
+        """Names of the wakewords listened for."""
+        return list(self.thresholds)
+
+    @property
+    def skip_ratio(self) -> float:
+        """Fraction of frames for which inference was skipped."""
+        return self.frames_skipped / self.frames_total if self.frames_total else 0.0
 
     def predict(self, audio_data: np.ndarray):
         """
@@ -27,16 +154,77 @@ class OpenWakewordDetector:
         :param audio_data: Audio data as a NumPy array in int16 format.
         """
 
+        self.frames_total += 1
+
+        if self.gate is not None:
+            if not self.gate.update(audio_data):
+                # clearly silent, keep the frame around in case the gate opens soon
+                self.gated = True
+                self.frames_skipped += 1
+                self.skipped_frames.append(audio_data)
+                return
+
+            if self.gated:
+                # catch the shared features up on the most recent skipped audio in one call, without
+                # running the classifiers and VAD on audio that was too quiet to matter
+                if self.skipped_frames:
+                    self.model.preprocessor(np.concatenate(self.skipped_frames))
+                self.skipped_frames.clear()
+                self.gated = False
+
         self.model.predict(audio_data)
 
     def is_wakeword_detected(self) -> bool:
         """
         Check if the wake word is detected based on the model's prediction buffer.
-        :return: If the wakeword is currently detected.
+        :return: If any of the wakewords is currently detected.
+        """
+
+        return self.detected_wakeword() is not None
+
+    def detected_wakeword(self) -> str | None:
+        """
+        Get which wakeword is detected. If several are above their thresholds,
+        the one that is furthest above it (relative to the threshold) wins.
+        :return: The wakeword's name, or None if none is detected
+        """
+
+        if self.gated:
+            return None
+
+        detected = None
+        best = 1.0
+        for name, threshold in self.thresholds.items():
+            margin = self.wakeword_score(name) / threshold
+            if margin > best:
+                detected, best = name, margin
+        return detected
+
+    def wakeword_score(self, name: str | None = None) -> float:
         """
+        Get a wakeword model's latest score.
+        :param name: The wakeword, the one that is detected (or the highest scoring one) if not given
+        :return: Score between 0 and 1
+        """
+
+        if self.gated:
+            return 0.0
+
+        if name is None:
+            name = self.detected_wakeword() or max(
+                self.thresholds, key=lambda wakeword: self.model.prediction_buffer[wakeword][-1])
+        return float(self.model.prediction_buffer[name][-1])
+
+    def snr(self) -> float:
+        """
+        Get how far the last frame is above the noise floor, for comparing how well devices hear the same sound.
+        :return: Signal-to-noise ratio in dB, 0 without an energy gate
+        """
+
+        if self.gate is None or self.gate.energy is None:
+            return 0.0
 
-        scores = self.model.prediction_buffer[self.model_name]
-        return scores[-1] > self.wakeword_threshold
+        return float(self.gate.energy - self.gate.noise_floor)
 
     def vad(self) -> bool:
         """
@@ -44,5 +232,18 @@ class OpenWakewordDetector:
         :return: Current VAD status
         """
 
-        scores = self.model.vad.prediction_buffer
-        return scores[-1] > self.vad_threshold
+        if self.gated:
+            return False
+
+        return self.vad_probability() > self.vad_threshold
+
+    def vad_probability(self) -> float:
+        """
+        Get the VAD model's probability that the current frame is speech.
+        :return: Speech probability between 0 and 1
+        """
+
+        if self.gated:
+            return 0.0
+
+        return float(self.model.vad.prediction_buffer[-1])
@@ -0,0 +1,179 @@
+"""
+Wakeword/VAD detection in a worker process.
+
+Detection has to keep up with the mic, but in the assistant's process it
+shares the GIL with STT, TTS and the agent. WakewordProcess runs the detector
+in a process of its own instead: the mic callback writes frames into a shared
+memory ring, and the worker sends a small result back over a pipe for every
+frame it ran the detector on.
+"""
+import logging
+import multiprocessing
+import time
+from typing import Callable, TYPE_CHECKING
+
+import numpy as np
+
+from utils.audio import SharedFrameRing
+
+if TYPE_CHECKING:
+    from .detector import OpenWakewordDetector
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+
+def _run_worker(make_detector: Callable[[], "OpenWakewordDetector"], ring_name: str, frames: int, frame_size: int,
+                available, stop, connection, deadline: float):
+    """Entry point of the worker process: run the detector on every frame written to the ring."""
+
+    ring = SharedFrameRing(frames, frame_size, name=ring_name)
+    try:
+        try:
+            detector = make_detector()
+        except Exception as e:
+            connection.send(("error", repr(e)))
+            return
+        position = ring.position  # before the ready message, which frames are written after
+        connection.send(("ready",))
+
+        dropped = 0  # frames the writer lapped before they were read, since the last result
+        while not stop.is_set():
+            if not available.acquire(timeout=0.1):
+                continue
+
+            while position < ring.position:
+                if ring.position - position > ring.frames:
+                    dropped += ring.position - ring.frames - position
+                    position = ring.position - ring.frames
+                frame = ring.read(position)
+                position += 1
+                if frame is None:
+                    dropped += 1
+                    continue
+
+                _, captured_at, audio_data = frame
+                start = time.perf_counter()
+                detector.predict(audio_data)
+                wakeword = None  # name, score and SNR if detected
+                name = detector.detected_wakeword()
+                if name is not None:
+                    wakeword = (name, detector.wakeword_score(name), detector.snr())
+                speech, speech_probability = detector.vad(), detector.vad_probability()
+                end = time.perf_counter()
+
+                # the result is late if it's ready after the next frame is due
+                connection.send(("frame", position - 1, dropped, end - start, end > captured_at + deadline,
+                                 detector.skip_ratio, wakeword, speech, speech_probability))
+                dropped = 0
+    except (BrokenPipeError, EOFError, KeyboardInterrupt):
+        pass  # the assistant is exiting
+    finally:
+        ring.close()
+
+
+class WakewordProcess:
+    """
+    Runs a wakeword/VAD detector in a worker process. The mic callback hands
+    frames over with write(), and the detector's results come back in order
+    from receive().
+    """
+
+    out_of_process = True
+
+    def __init__(self, make_detector: Callable[[], "OpenWakewordDetector"], frame_size: int = 1280,
+                 buffer_length: float = 5.0, deadline: float | None = None, start_timeout: float = 120.0):
+        """
+        Start the worker process and wait for its detector to load.
+
+        :param make_detector: Creates the detector in the worker process, so it must be picklable,
+            like the detector's class or a functools.partial of it.
+        :param frame_size: Samples per mic frame.
+        :param buffer_length: Seconds of frames the ring holds, for when the worker falls behind.
+        :param deadline: Seconds after its capture by which a frame's result is due,
+            the length of a frame if not given.
+        :param start_timeout: Max seconds to wait for the detector to load.
+        """
+        context = multiprocessing.get_context("spawn")
+        # one extra slot for the frame being written, which can't be read
+        self.ring = SharedFrameRing(round(buffer_length * SAMPLE_RATE / frame_size) + 1, frame_size)
+        self.available = context.Semaphore(0)  # released for every frame written
+        self.stop = context.Event()
+        self.connection, worker_connection = context.Pipe(duplex=False)
+        self.deadline = deadline if deadline is not None else frame_size / SAMPLE_RATE
+
+        self.deadline_misses = 0
+        self.skip_ratio = 0.0
+        self.dropped = 0  # frames dropped since the last result received
+
+        self.process = context.Process(
+            target=_run_worker, name="wakeword", daemon=True,
+            args=(make_detector, self.ring.name, self.ring.frames, frame_size, self.available, self.stop,
+                  worker_connection, self.deadline))
+        self.process.start()
+        worker_connection.close()  # so the pipe reports EOF once the worker exits
+
+        try:
+            if not self.connection.poll(start_timeout):
+                raise TimeoutError(f"The wakeword detector didn't load in {start_timeout}s")
+            message = self.connection.recv()
+        except EOFError:
+            self.process.join(timeout=1.0)
+            message = ("error", f"exit code {self.process.exitcode}")
+        except BaseException:
+            self.close()
+            raise
+        if message[0] == "error":
+            self.close()
+            raise RuntimeError(f"Failed to load the wakeword detector in its process: {message[1]}")
+        logger.info(f"Wakeword detection running in process {self.process.pid}")
+
+    def write(self, frame: int, captured_at: float, audio_data: np.ndarray):
+        """
+        Hand a frame to the worker. Only called from the mic callback.
+
+        :param frame: Index of the frame since capture started.
+        :param captured_at: perf_counter() time the frame was captured at.
+        :param audio_data: The frame as a NumPy array in int16 format.
+        """
+        self.ring.write(frame, captured_at, audio_data)
+        self.available.release()
+
+    def receive(self, timeout: float | None = None) -> tuple | None:
+        """
+        Wait for the result of the next frame.
+
+        :param timeout: Max seconds to wait, forever if not given.
+        :return: The frame's index, capture time and audio, the wakeword's name, score and SNR (None if
+            none was detected), VAD status and speech probability, the inference time and the number of frames
+            dropped before it. None if no result arrived in time.
+        """
+        until = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            remaining = max(until - time.monotonic(), 0.0) if until is not None else None
+            try:
+                if not self.connection.poll(remaining):
+                    return None
+                _, position, frame_dropped, inference_time, missed, self.skip_ratio, wakeword, speech, \
+                    speech_probability = self.connection.recv()
+            except EOFError:
+                raise RuntimeError(f"The wakeword process exited with code {self.process.exitcode}") from None
+
+            self.dropped += frame_dropped
+            self.deadline_misses += missed
+            frame = self.ring.read(position)
+            if frame is None:
+                self.dropped += 1  # the mic lapped the ring while the worker was busy with it
+                continue
+            dropped, self.dropped = self.dropped, 0
+            return (*frame, wakeword, speech, speech_probability, inference_time, dropped)
+
+    def close(self):
+        """Stop the worker process and free the ring."""
+        self.stop.set()
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
+        self.ring.close()
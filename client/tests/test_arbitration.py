@@ -0,0 +1,81 @@
+import asyncio
+
+import numpy as np
+
+from pipeline.pipeline import CHUNK, AssistantPipeline, AssistantState
+
+
+class FakeDetector:
+    out_of_process = False
+
+
+class FakePlayback:
+    def play_clip(self, clip):
+        pass
+
+    def stop_playback(self):
+        pass
+
+
+class FakeCommandProcessor:
+    def warm_up(self, session, reason):
+        pass
+
+
+class FakeSTT:
+    streaming = False
+
+
+class LosingArbiter:
+    """Loses every claim, once it is told to answer."""
+
+    def __init__(self):
+        self.answer = asyncio.Event()
+
+    async def claim(self, turn_id, score, snr):
+        await self.answer.wait()
+        return False
+
+
+async def feed(pipeline, wakeword=None, speech=False, frames=1):
+    for _ in range(frames):
+        pipeline.frames_captured += 1
+        await pipeline.event_queue.put((pipeline.frames_captured, 0.0, np.zeros(CHUNK, dtype=np.int16), wakeword,
+                                        speech, 1.0 if speech else 0.0))
+    while not pipeline.event_queue.empty():
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+
+def test_lost_claim_cancels_turn_after_speculation_miss():
+    async def run():
+        events = []
+        arbiter = LosingArbiter()
+        pipeline = AssistantPipeline(FakeDetector(), FakePlayback(), stt_model=FakeSTT(),
+                                     command_processor=FakeCommandProcessor(), speculative=True, arbiter=arbiter,
+                                     on_event=lambda event, turn_id, frame: events.append((event, turn_id)))
+        pipeline.loop = asyncio.get_running_loop()
+        endpoint_task = asyncio.create_task(pipeline._endpoint_stage())
+
+        await feed(pipeline, wakeword=("hey", 0.9, 10.0))
+        await feed(pipeline, speech=True, frames=5)
+        # a pause long enough to speculate on, then more speech
+        await feed(pipeline, frames=8)
+        assert pipeline.turn_gate is not None
+        await feed(pipeline, speech=True)
+        assert events[-1][0] == "speculation_miss"
+        turn_id = pipeline.turn_id
+
+        arbiter.answer.set()
+        await asyncio.gather(*pipeline.arbitrations)
+
+        assert ("reset", turn_id) in events
+        assert pipeline.turn_id != turn_id
+        assert pipeline.state == AssistantState.IDLE
+
+        endpoint_task.cancel()
+        pipeline.executor.shutdown()
+        pipeline.detect_executor.shutdown()
+        pipeline.warm_up_executor.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,50 @@
+import numpy as np
+
+from utils.playback import AudioPlaybackManager
+
+
+class FakeStream:
+    def is_active(self):
+        return True
+
+    def start_stream(self):
+        pass
+
+
+class FakeAudioInterface:
+    def open(self, **kwargs):
+        return FakeStream()
+
+
+def make_manager():
+    return AudioPlaybackManager(rate=1000, format=8, channels=1, chunk_size=10, buffer_length=1.0,
+                                audio_interface=FakeAudioInterface())
+
+
+def play(manager, frame_count):
+    output, _ = manager._audio_callback(None, frame_count, None, 0)
+    return np.frombuffer(output, dtype=np.int16)
+
+
+def test_stop_playback_skips_buffered_audio():
+    manager = make_manager()
+    manager.queue_playback(np.full(50, 1, dtype=np.int16))
+    assert list(play(manager, 10)) == [1] * 10
+
+    manager.stop_playback()
+    assert not manager.is_playing
+    assert list(play(manager, 10)) == [0] * 10
+
+
+def test_audio_written_after_stop_still_plays():
+    manager = make_manager()
+    manager.queue_playback(np.full(50, 1, dtype=np.int16))
+
+    # the next response starts before the callback sees the stop
+    manager.stop_playback()
+    manager.queue_playback(np.full(20, 2, dtype=np.int16))
+    assert manager.is_playing
+
+    assert list(play(manager, 10)) == [2] * 10
+    assert list(play(manager, 10)) == [2] * 10
+    assert not manager.is_playing
@@ -0,0 +1,17 @@
+from command.streaming import ThinkingFilter
+
+
+def feed_all(pieces):
+    thinking = ThinkingFilter()
+    return "".join(thinking.feed(piece) for piece in pieces) + thinking.flush()
+
+
+def test_hidden_text_is_dropped():
+    assert feed_all(["Hi <th", "ink>let me think", "</thi", "nk>there."]) == "Hi there."
+
+
+def test_unclosed_tag_passes_on_its_text(caplog):
+    with caplog.at_level("WARNING"):
+        text = feed_all(["<think>", "The lights are ", "on now.", " </th"])
+    assert text == "The lights are on now. </th"
+    assert "unclosed <think>" in caplog.text